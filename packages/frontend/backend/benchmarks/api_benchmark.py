@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Benchmark de la API
+==================================
+
+Benchmark end-to-end de latencia y throughput para fastapi_main.app.
+
+Modos:
+- inprocess: llama a la app directamente vía httpx.ASGITransport
+  (mide el coste del framework + handlers sin red)
+- uvicorn: levanta workers reales de uvicorn y mide por HTTP
+
+Para cada ruta registra p50/p95/p99, RPS y RSS, guarda los resultados
+como baseline JSON y falla (exit 1) si hay regresiones sobre el umbral.
+
+Uso:
+    python api_benchmark.py --mode inprocess --concurrency 32 --requests 2000
+    python api_benchmark.py --mode uvicorn --workers 4 --save-baseline
+    python api_benchmark.py --mode both --threshold 15
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from bench_utils import (
+    TEMPLATES_DIR,
+    compare_results,
+    current_rss_bytes,
+    environment_info,
+    format_table,
+    latency_summary,
+    load_baseline,
+    save_baseline,
+)
+
+AUTH_HEADERS = {"Authorization": "Bearer benchmark-token"}
+NDJSON_HEADERS = {**AUTH_HEADERS, "Accept": "application/x-ndjson"}
+UPLOAD_PAYLOAD = b"x" * 64 * 1024  # 64KB por subida
+
+
+def _upload_request(client: httpx.AsyncClient):
+    return client.post(
+        "/api/files/upload",
+        params={"path": "/data"},
+        files={"file": ("bench.txt", UPLOAD_PAYLOAD, "text/plain")},
+        headers=AUTH_HEADERS,
+    )
+
+
+# Rutas del benchmark: nombre -> función que construye la petición
+ROUTES: Dict[str, Callable[[httpx.AsyncClient], object]] = {
+    "jobs": lambda c: c.get("/api/jobs", headers=AUTH_HEADERS),
+    "files": lambda c: c.get("/api/files", params={"path": "/"}, headers=AUTH_HEADERS),
+    "history": lambda c: c.get("/api/history", params={"days": 30}, headers=AUTH_HEADERS),
+    "jobs_ndjson": lambda c: c.get("/api/jobs", headers=NDJSON_HEADERS),
+    "files_ndjson": lambda c: c.get("/api/files", params={"path": "/"}, headers=NDJSON_HEADERS),
+    "system_resources": lambda c: c.get("/api/system/resources", headers=AUTH_HEADERS),
+    "upload": _upload_request,
+    "logs": lambda c: c.get("/api/jobs/job_001/logs", headers=AUTH_HEADERS),
+}
+
+# Métricas que se comparan contra el baseline
+HIGHER_IS_WORSE = ["p50_ms", "p95_ms", "p99_ms", "rss_mb"]
+LOWER_IS_WORSE = ["rps"]
+
+
+async def _run_route(client: httpx.AsyncClient, build_request: Callable,
+                     total: int, concurrency: int, warmup: int) -> Dict:
+    """Ejecuta `total` peticiones de una ruta con `concurrency` clientes concurrentes"""
+    for _ in range(warmup):
+        await build_request(client)
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await build_request(client)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    summary = latency_summary(latencies, elapsed)
+    summary["errors"] = errors
+    return summary
+
+
+async def _bench_client(client: httpx.AsyncClient, routes: List[str], total: int,
+                        concurrency: int, warmup: int,
+                        rss_probe: Callable[[], int]) -> Dict:
+    """Ejecuta todas las rutas seleccionadas contra un cliente ya configurado"""
+    cases = {}
+    for name in routes:
+        summary = await _run_route(client, ROUTES[name], total, concurrency, warmup)
+        summary["rss_mb"] = round(rss_probe() / (1024 * 1024), 1)
+        cases[name] = summary
+    return cases
+
+
+async def bench_inprocess(routes: List[str], total: int, concurrency: int, warmup: int) -> Dict:
+    """Benchmark en proceso a través de ASGITransport"""
+    from fastapi_main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return await _bench_client(client, routes, total, concurrency, warmup, current_rss_bytes)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_tree_rss(root_pid: int) -> int:
+    """Suma el RSS del proceso maestro de uvicorn y de sus workers"""
+    total = current_rss_bytes(root_pid)
+    children_file = Path(f"/proc/{root_pid}/task/{root_pid}/children")
+    try:
+        for child in children_file.read_text().split():
+            total += _process_tree_rss(int(child))
+    except OSError:
+        pass
+    return total
+
+
+async def _wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"uvicorn no respondió en {timeout}s")
+
+
+async def bench_uvicorn(routes: List[str], total: int, concurrency: int,
+                        warmup: int, workers: int) -> Dict:
+    """Benchmark sobre workers reales de uvicorn"""
+    port = _free_port()
+    # Con varios workers se usa el estado compartido, en un namespace propio
+    namespace = f"atrox_bench_{port}"
+    env = {
+        **os.environ,
+        "ATROX_SHARED_STATE": os.environ.get("ATROX_SHARED_STATE", "shm" if workers > 1 else "local"),
+        "ATROX_STATE_NAMESPACE": namespace,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_main:app",
+         "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=TEMPLATES_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        await _wait_until_ready(base_url)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+            return await _bench_client(client, routes, total, concurrency, warmup,
+                                       lambda: _process_tree_rss(server.pid))
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        # Segmentos del estado compartido y directorio de revocaciones
+        for leftover in Path("/dev/shm").glob(f"{namespace}*"):
+            if leftover.is_dir() and not leftover.is_symlink():
+                shutil.rmtree(leftover, ignore_errors=True)
+            else:
+                leftover.unlink(missing_ok=True)
+
+
+def run(mode: str, routes: List[str], total: int, concurrency: int,
+        warmup: int, workers: int) -> Dict:
+    """Ejecuta el benchmark y devuelve el resultado en formato de baseline"""
+    if mode == "inprocess":
+        cases = asyncio.run(bench_inprocess(routes, total, concurrency, warmup))
+    else:
+        cases = asyncio.run(bench_uvicorn(routes, total, concurrency, warmup, workers))
+
+    return {
+        "benchmark": f"api_{mode}",
+        "config": {
+            "requests": total,
+            "concurrency": concurrency,
+            "warmup": warmup,
+            "workers": workers if mode == "uvicorn" else 1,
+        },
+        "environment": environment_info(),
+        "cases": cases,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de latencia/throughput de la API")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--requests", type=int, default=1000, help="Peticiones por ruta")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Workers de uvicorn (solo modo uvicorn)")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Regresión máxima permitida en porcentaje")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Guarda el resultado como nuevo baseline")
+    parser.add_argument("--baseline-dir", type=Path, default=None,
+                        help="Directorio alternativo de baselines")
+    args = parser.parse_args(argv)
+
+    # Workspace aislado para que el benchmark no toque /home/leoatrox
+    os.environ.setdefault("ATROX_BASE_DIR", tempfile.mkdtemp(prefix="atrox-apibench-"))
+
+    modes = ["inprocess", "uvicorn"] if args.mode == "both" else [args.mode]
+    failed = False
+
+    for mode in modes:
+        result = run(mode, args.routes, args.requests, args.concurrency, args.warmup, args.workers)
+        name = result["benchmark"]
+        path = args.baseline_dir / f"{name}.json" if args.baseline_dir else None
+
+        print(f"\n== {name} ==")
+        print(format_table(result, ["p50_ms", "p95_ms", "p99_ms", "rps", "rss_mb", "errors"]))
+
+        if args.save_baseline:
+            print(f"Baseline guardado en {save_baseline(name, result, path)}")
+            continue
+
+        baseline = load_baseline(name, path)
+        if baseline is None:
+            print("Sin baseline previo; usa --save-baseline para crearlo")
+            continue
+
+        regressions = compare_results(baseline, result, args.threshold,
+                                      HIGHER_IS_WORSE, LOWER_IS_WORSE)
+        if regressions:
+            failed = True
+            print(f"REGRESIONES (umbral {args.threshold}%):")
+            for line in regressions:
+                print(f"  - {line}")
+        else:
+            print(f"Sin regresiones respecto al baseline (umbral {args.threshold}%)")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Utilidades de Benchmarks
+======================================
+
+Funciones compartidas por los benchmarks del backend:
+- Percentiles de latencia
+- Medición de memoria (RSS)
+- Almacenamiento de resultados como baselines JSON
+- Comparación contra baselines para detectar regresiones
+"""
+
+import json
+import os
+import platform
+import resource
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINES_DIR = BENCH_DIR / "baselines"
+TEMPLATES_DIR = BENCH_DIR.parent / "templates"
+
+# Los templates del backend no son un paquete instalable
+if str(TEMPLATES_DIR) not in sys.path:
+    sys.path.insert(0, str(TEMPLATES_DIR))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def latency_summary(latencies_s: List[float], elapsed_s: float) -> Dict:
+    """Resume una lista de latencias (segundos) en p50/p95/p99 (ms) y RPS"""
+    values = sorted(latencies_s)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "rps": round(len(values) / elapsed_s, 1) if elapsed_s > 0 else 0.0,
+    }
+
+
+def current_rss_bytes(pid: Optional[int] = None) -> int:
+    """RSS actual de un proceso (por defecto el propio) leyendo /proc"""
+    status_file = Path(f"/proc/{pid or os.getpid()}/status")
+    try:
+        for line in status_file.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def peak_rss_bytes() -> int:
+    """RSS máximo del proceso actual (ru_maxrss está en KB en Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def environment_info() -> Dict:
+    """Datos del entorno para que los baselines sean comparables"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def baseline_path(name: str) -> Path:
+    """Ruta del archivo de baseline para un benchmark"""
+    return BASELINES_DIR / f"{name}.json"
+
+
+def save_baseline(name: str, results: Dict, path: Optional[Path] = None) -> Path:
+    """Guarda los resultados de un benchmark como baseline JSON"""
+    target = path or baseline_path(name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return target
+
+
+def load_baseline(name: str, path: Optional[Path] = None) -> Optional[Dict]:
+    """Carga un baseline existente, o None si todavía no hay"""
+    target = path or baseline_path(name)
+    if not target.exists():
+        return None
+    with open(target) as f:
+        return json.load(f)
+
+
+def compare_results(baseline: Dict, current: Dict, threshold_pct: float,
+                    higher_is_worse: List[str], lower_is_worse: List[str]) -> List[str]:
+    """
+    Compara dos resultados por caso y devuelve la lista de regresiones.
+
+    Ambos diccionarios tienen la forma {"cases": {caso: {métrica: valor}}}.
+    Una métrica regresa si empeora más de threshold_pct por ciento.
+    """
+    regressions = []
+    factor = threshold_pct / 100.0
+
+    for case, metrics in current.get("cases", {}).items():
+        base_metrics = baseline.get("cases", {}).get(case)
+        if not base_metrics:
+            continue
+
+        for metric in higher_is_worse:
+            old, new = base_metrics.get(metric), metrics.get(metric)
+            if old and new is not None and new > old * (1 + factor):
+                regressions.append(f"{case}.{metric}: {old} -> {new} (+{(new / old - 1) * 100:.1f}%)")
+
+        for metric in lower_is_worse:
+            old, new = base_metrics.get(metric), metrics.get(metric)
+            if old and new is not None and new < old * (1 - factor):
+                regressions.append(f"{case}.{metric}: {old} -> {new} ({(new / old - 1) * 100:.1f}%)")
+
+    return regressions
+
+
+def format_table(results: Dict, columns: List[str]) -> str:
+    """Formatea los casos de un resultado como tabla de texto"""
+    header = ["case"] + columns
+    rows = [header]
+    for case, metrics in results.get("cases", {}).items():
+        rows.append([case] + [str(metrics.get(col, "")) for col in columns])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(widths[i]) for i, cell in enumerate(row)) for row in rows]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Benchmark del sistema de archivos
+===============================================
+
+Microbenchmarks de UserFileManager sobre workspaces sintéticos:
+- wide: muchos archivos en un solo directorio (500k por defecto)
+- deep: 10k directorios anidados en cadenas (respetando PATH_MAX)
+- large: un archivo de texto de varios GB
+
+Cada operación se ejecuta en un subproceso limpio que reporta:
+- Tiempo (mejor y mediana de las repeticiones)
+- Syscalls de lectura/escritura (syscr/syscw de /proc/self/io)
+- Llamadas de metadatos (stat, scandir, unlink, ...) contadas sobre `os`
+- Memoria pico (ru_maxrss y, opcionalmente, tracemalloc)
+
+Uso:
+    python fs_benchmark.py --scale 0.01                # ejecución rápida
+    python fs_benchmark.py --workdir /scratch/fsbench --keep --save-baseline
+    python fs_benchmark.py --cases list_directory.wide get_disk_usage.deep
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bench_utils import (
+    compare_results,
+    environment_info,
+    format_table,
+    load_baseline,
+    save_baseline,
+)
+
+USER_ID = "bench_user"
+DEFAULT_WIDE_FILES = 500_000
+DEFAULT_DEEP_DIRS = 10_000
+DEFAULT_DEEP_DEPTH = 200  # directorios por cadena; 200 * len("/dNNN") < PATH_MAX
+DEFAULT_LARGE_SIZE = 2 * 1024 ** 3
+
+# Funciones de `os` cuyas llamadas se cuentan como operaciones de metadatos
+COUNTED_OS_CALLS = [
+    "stat", "lstat", "scandir", "listdir", "open", "unlink",
+    "rmdir", "mkdir", "rename", "replace", "walk",
+]
+
+HIGHER_IS_WORSE = ["best_s", "median_s", "syscalls", "meta_calls", "peak_rss_mb"]
+
+
+# ---------------------------------------------------------------------------
+# Generación de árboles sintéticos
+# ---------------------------------------------------------------------------
+
+def generate_wide(target: Path, files: int):
+    """Crea `files` archivos pequeños en un solo directorio"""
+    target.mkdir(parents=True, exist_ok=True)
+    payload = b"0123456789abcdef\n"
+    dir_fd = os.open(target, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for i in range(files):
+            fd = os.open(f"f{i:07d}.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=dir_fd)
+            os.write(fd, payload)
+            os.close(fd)
+    finally:
+        os.close(dir_fd)
+
+
+def generate_deep(target: Path, dirs: int, depth: int):
+    """Crea `dirs` directorios anidados en cadenas de profundidad `depth`"""
+    target.mkdir(parents=True, exist_ok=True)
+    created = 0
+    chain = 0
+    while created < dirs:
+        current = target / f"c{chain:04d}"
+        for level in range(min(depth, dirs - created)):
+            current = current / f"d{level:03d}"
+            created += 1
+        current.mkdir(parents=True, exist_ok=True)
+        (current / "leaf.txt").write_bytes(b"leaf\n")
+        chain += 1
+
+
+def generate_large(target: Path, size: int):
+    """Crea un archivo de texto de `size` bytes escrito por bloques"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    line = b"".join(b"%08d some benchmark log line with numbers 3.14159 NaN ERROR\n" % i for i in range(1024))
+    written = 0
+    with open(target, "wb") as f:
+        while written < size:
+            chunk = line[:size - written]
+            f.write(chunk)
+            written += len(chunk)
+
+
+def tree_paths(root: Path) -> Dict[str, Path]:
+    user_dir = root / USER_ID
+    return {
+        "wide": user_dir / "results" / "wide",
+        "deep": user_dir / "data" / "deep",
+        "large": user_dir / "data" / "large.txt",
+        "delete": user_dir / "results" / "to_delete",
+    }
+
+
+def ensure_trees(root: Path, wide_files: int, deep_dirs: int, deep_depth: int, large_size: int):
+    """Genera los árboles que todavía no existen (reutilizables con --keep)"""
+    paths = tree_paths(root)
+    marker = root / "trees.json"
+    spec = {"wide": wide_files, "deep": deep_dirs, "depth": deep_depth, "large": large_size}
+
+    if marker.exists() and json.loads(marker.read_text()) == spec:
+        return
+
+    for name in ("wide", "deep", "large"):
+        if paths[name].is_dir():
+            shutil.rmtree(paths[name])
+        elif paths[name].exists():
+            paths[name].unlink()
+
+    started = time.perf_counter()
+    generate_wide(paths["wide"], wide_files)
+    generate_deep(paths["deep"], deep_dirs, deep_depth)
+    generate_large(paths["large"], large_size)
+    marker.write_text(json.dumps(spec))
+    print(f"Árboles sintéticos generados en {time.perf_counter() - started:.1f}s ({root})")
+
+
+# ---------------------------------------------------------------------------
+# Operaciones medidas (se ejecutan dentro del subproceso worker)
+# ---------------------------------------------------------------------------
+
+def _manager(root: Path):
+    from file_manager import UserFileManager
+
+    manager = UserFileManager(base_dir=str(root))
+    manager.max_file_size = 1 << 62  # el benchmark sube archivos de varios GB
+    return manager
+
+
+def _op_upload(manager, root: Path):
+    with open(tree_paths(root)["large"], "rb") as f:
+        result = manager.upload_file(USER_ID, f, "upload.txt", "/scratch")
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+
+
+CASES: Dict[str, Callable] = {
+    "list_directory.wide": lambda m, r: m.list_directory(USER_ID, "/results/wide"),
+    "get_disk_usage.wide_deep": lambda m, r: m.get_disk_usage(USER_ID),
+    "preview_file.large": lambda m, r: m.preview_file(USER_ID, "/data/large.txt"),
+    "upload_file.large": _op_upload,
+    "calculate_file_hash.large": lambda m, r: m._calculate_file_hash(tree_paths(r)["large"]),
+    "delete_file.wide": lambda m, r: m.delete_file(USER_ID, "/results/to_delete"),
+}
+
+
+def _read_proc_io() -> Dict[str, int]:
+    values = {}
+    with open("/proc/self/io") as f:
+        for line in f:
+            key, value = line.split(":")
+            values[key] = int(value)
+    return values
+
+
+def _install_call_counters() -> Dict[str, int]:
+    """Envuelve funciones de `os` para contar llamadas de metadatos"""
+    counts = {name: 0 for name in COUNTED_OS_CALLS}
+
+    def wrap(name, func):
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    for name in COUNTED_OS_CALLS:
+        setattr(os, name, wrap(name, getattr(os, name)))
+    return counts
+
+
+def run_worker(case: str, root: Path, trace_memory: bool) -> Dict:
+    """Ejecuta una única repetición de un caso y devuelve sus métricas"""
+    manager = _manager(root)
+    manager.get_user_directory(USER_ID)  # no medir la creación de subdirectorios
+    counts = _install_call_counters()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    io_before = _read_proc_io()
+    started = time.perf_counter()
+    CASES[case](manager, root)
+    elapsed = time.perf_counter() - started
+    io_after = _read_proc_io()
+
+    result = {
+        "elapsed_s": elapsed,
+        "syscr": io_after["syscr"] - io_before["syscr"],
+        "syscw": io_after["syscw"] - io_before["syscw"],
+        "meta_calls": sum(counts.values()),
+        "calls": {k: v for k, v in counts.items() if v},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if trace_memory:
+        result["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Orquestación
+# ---------------------------------------------------------------------------
+
+def _spawn_worker(case: str, root: Path, trace_memory: bool) -> Dict:
+    cmd = [sys.executable, __file__, "--worker", case, "--workdir", str(root)]
+    if trace_memory:
+        cmd.append("--tracemalloc")
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_case(case: str, root: Path, repeat: int, trace_memory: bool, wide_files: int) -> Dict:
+    """Ejecuta un caso `repeat` veces en subprocesos y agrega los resultados"""
+    runs = []
+    for _ in range(repeat):
+        if case == "delete_file.wide":
+            generate_wide(tree_paths(root)["delete"], wide_files)
+        runs.append(_spawn_worker(case, root, trace_memory=False))
+
+    times = [r["elapsed_s"] for r in runs]
+    last = runs[-1]
+    summary = {
+        "best_s": round(min(times), 4),
+        "median_s": round(statistics.median(times), 4),
+        "syscalls": last["syscr"] + last["syscw"],
+        "syscr": last["syscr"],
+        "syscw": last["syscw"],
+        "meta_calls": last["meta_calls"],
+        "calls": last["calls"],
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+    }
+
+    # Pasada separada con tracemalloc: su sobrecoste no debe contaminar los tiempos
+    if trace_memory:
+        if case == "delete_file.wide":
+            generate_wide(tree_paths(root)["delete"], wide_files)
+        summary["py_peak_mb"] = _spawn_worker(case, root, trace_memory=True)["py_peak_mb"]
+
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de UserFileManager")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="Directorio para los árboles (por defecto uno temporal)")
+    parser.add_argument("--keep", action="store_true", help="No borrar los árboles al terminar")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplicador de tamaño de los árboles (p.ej. 0.01)")
+    parser.add_argument("--wide-files", type=int, default=None)
+    parser.add_argument("--deep-dirs", type=int, default=None)
+    parser.add_argument("--deep-depth", type=int, default=DEFAULT_DEEP_DEPTH)
+    parser.add_argument("--large-size", type=int, default=None, help="Tamaño en bytes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Mide además la memoria pico de Python con tracemalloc")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline-dir", type=Path, default=None)
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.workdir, args.tracemalloc)))
+        return 0
+
+    wide_files = args.wide_files or max(1, int(DEFAULT_WIDE_FILES * args.scale))
+    deep_dirs = args.deep_dirs or max(1, int(DEFAULT_DEEP_DIRS * args.scale))
+    large_size = args.large_size or max(1024, int(DEFAULT_LARGE_SIZE * args.scale))
+
+    root = args.workdir or Path(tempfile.mkdtemp(prefix="atrox-fsbench-"))
+    root.mkdir(parents=True, exist_ok=True)
+
+    try:
+        ensure_trees(root, wide_files, deep_dirs, args.deep_depth, large_size)
+
+        cases = {}
+        for case in args.cases:
+            cases[case] = bench_case(case, root, args.repeat, args.tracemalloc, wide_files)
+            print(f"  {case}: {cases[case]['best_s']}s")
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    result = {
+        "benchmark": "fs_user_file_manager",
+        "config": {
+            "wide_files": wide_files,
+            "deep_dirs": deep_dirs,
+            "deep_depth": args.deep_depth,
+            "large_size": large_size,
+            "repeat": args.repeat,
+        },
+        "environment": environment_info(),
+        "cases": cases,
+    }
+
+    columns = ["best_s", "median_s", "syscr", "syscw", "meta_calls", "peak_rss_mb"]
+    if args.tracemalloc:
+        columns.append("py_peak_mb")
+    print(format_table(result, columns))
+
+    # Los baselines solo son comparables con la misma configuración de árboles
+    name = f"fs_{wide_files}w_{deep_dirs}d_{large_size}b"
+    path = args.baseline_dir / f"{name}.json" if args.baseline_dir else None
+
+    if args.save_baseline:
+        print(f"Baseline guardado en {save_baseline(name, result, path)}")
+        return 0
+
+    baseline = load_baseline(name, path)
+    if baseline is None:
+        print("Sin baseline previo; usa --save-baseline para crearlo")
+        return 0
+
+    regressions = compare_results(baseline, result, args.threshold, HIGHER_IS_WORSE, [])
+    if regressions:
+        print(f"REGRESIONES (umbral {args.threshold}%):")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+
+    print(f"Sin regresiones respecto al baseline (umbral {args.threshold}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Caché de autenticación
+=====================================
+
+Cachés para get_current_user:
+- TokenCache: LRU acotada de tokens ya verificados, indexada por el
+  digest del token (nunca se guarda el token en claro) y que expira
+  en el `exp` del propio token.
+- UserCache: caché TTL pequeña de UserInfo por user_id.
+
+Ambas exponen ganchos explícitos de revocación/invalidación para logout,
+cambios de rol o bajas de usuario. Vaciar la caché no basta para revocar
+(el mismo JWT se volvería a verificar y cachear), así que las
+revocaciones se guardan además en una lista compartida entre workers:
+- Tokens revocados (por digest) hasta su `exp`
+- Por usuario, el instante de revocación: se rechazan los tokens
+  emitidos (`iat`) antes
+Backends de la lista: local (un solo worker), shm (archivos en /dev/shm)
+y redis, los mismos modos que ATROX_SHARED_STATE.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from metrics import cache_counters
+
+
+def token_digest(token: str) -> bytes:
+    """Digest del token usado como clave (no se retienen tokens en memoria)"""
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenCache:
+    """
+    LRU de tokens verificados: digest -> (user_id, exp, iat)
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[str, float, float]]" = OrderedDict()
+        self._by_user: Dict[str, Set[bytes]] = {}
+        self._lock = threading.Lock()
+        self._hits, self._misses = cache_counters("auth_tokens")
+
+    def get(self, token: str) -> Optional[Tuple[str, float, float]]:
+        """Devuelve (user_id, exp, iat) de un token verificado y vigente, o None"""
+        digest = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(digest)
+                    self._hits.inc()
+                    return entry
+                self._remove(digest)
+        self._misses.inc()
+        return None
+
+    def put(self, token: str, user_id: str, exp: float, issued_at: float = 0.0):
+        """Guarda un token recién verificado hasta su expiración"""
+        if exp <= time.time():
+            return
+        digest = token_digest(token)
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (user_id, exp, issued_at)
+            self._by_user.setdefault(user_id, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def revoke_token(self, token: str):
+        """Revoca un token concreto (p.ej. logout)"""
+        with self._lock:
+            self._remove(token_digest(token))
+
+    def revoke_user(self, user_id: str) -> int:
+        """Revoca todos los tokens cacheados de un usuario"""
+        with self._lock:
+            digests = self._by_user.pop(user_id, set())
+            for digest in digests:
+                self._entries.pop(digest, None)
+            return len(digests)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _remove(self, digest: bytes):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            user_digests = self._by_user.get(entry[0])
+            if user_digests is not None:
+                user_digests.discard(digest)
+                if not user_digests:
+                    del self._by_user[entry[0]]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class UserCache:
+    """
+    Caché TTL de registros de usuario: user_id -> (UserInfo, caducidad)
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits, self._misses = cache_counters("auth_users")
+
+    def get(self, user_id: str):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self._hits.inc()
+                    return entry[0]
+                del self._entries[user_id]
+        self._misses.inc()
+        return None
+
+    def put(self, user_id: str, user):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """Invalida un usuario (cambio de rol, datos o baja)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalRevocations:
+    """Lista de revocación en proceso (un solo worker, desarrollo)"""
+
+    def __init__(self):
+        self._tokens: Dict[bytes, float] = {}
+        self._users: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def revoke_token(self, token: str, exp: float):
+        now = time.time()
+        with self._lock:
+            for digest in [d for d, until in self._tokens.items() if until <= now]:
+                del self._tokens[digest]
+            self._tokens[token_digest(token)] = exp
+
+    def token_revoked(self, token: str) -> bool:
+        until = self._tokens.get(token_digest(token))
+        return until is not None and until > time.time()
+
+    def revoke_user(self, user_id: str, revoked_at: float):
+        with self._lock:
+            self._users[user_id] = max(self._users.get(user_id, 0.0), revoked_at)
+
+    def revoked_before(self, user_id: str) -> float:
+        return self._users.get(user_id, 0.0)
+
+
+class FileRevocations:
+    """
+    Lista de revocación en un directorio de tmpfs compartido por los
+    workers de la máquina: un archivo por token (contenido: exp) y por
+    usuario (contenido: instante de revocación). Comprobar un token es un
+    open en tmpfs; los archivos caducados se purgan al revocar.
+    """
+
+    def __init__(self, directory: str, max_token_age: float = 86400.0, sweep_interval: float = 300.0):
+        self.directory = directory
+        self.max_token_age = max_token_age
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, kind: str, key: bytes) -> str:
+        return os.path.join(self.directory, f"{kind}-{key.hex()}")
+
+    def _write(self, path: str, value: float):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(repr(value))
+        os.replace(tmp, path)
+
+    def _read(self, path: str) -> Optional[float]:
+        try:
+            with open(path) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            value = self._read(path)
+            if name.startswith("token-"):
+                expired = value is None or value <= now
+            elif name.startswith("user-"):
+                expired = value is not None and value + self.max_token_age <= now
+            else:
+                continue
+            if expired:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def revoke_token(self, token: str, exp: float):
+        self._write(self._path("token", token_digest(token)), exp)
+        self._sweep()
+
+    def token_revoked(self, token: str) -> bool:
+        until = self._read(self._path("token", token_digest(token)))
+        return until is not None and until > time.time()
+
+    def revoke_user(self, user_id: str, revoked_at: float):
+        path = self._path("user", token_digest(user_id))
+        self._write(path, max(self._read(path) or 0.0, revoked_at))
+        self._sweep()
+
+    def revoked_before(self, user_id: str) -> float:
+        return self._read(self._path("user", token_digest(user_id))) or 0.0
+
+
+class RedisRevocations:
+    """Lista de revocación en Redis: {prefix}:token:{digest} y {prefix}:user:{user_id}, con expiración"""
+
+    def __init__(self, url: str, prefix: str = "atrox:revoked", max_token_age: float = 86400.0):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.max_token_age = max_token_age
+
+    def revoke_token(self, token: str, exp: float):
+        ttl = int(exp - time.time()) + 1
+        if ttl > 0:
+            self.client.set(f"{self.prefix}:token:{token_digest(token).hex()}", exp, ex=ttl)
+
+    def token_revoked(self, token: str) -> bool:
+        return bool(self.client.exists(f"{self.prefix}:token:{token_digest(token).hex()}"))
+
+    def revoke_user(self, user_id: str, revoked_at: float):
+        self.client.set(f"{self.prefix}:user:{user_id}", revoked_at, ex=int(self.max_token_age))
+
+    def revoked_before(self, user_id: str) -> float:
+        return float(self.client.get(f"{self.prefix}:user:{user_id}") or 0)
+
+
+def create_revocation_list(mode: str = "local", namespace: str = "atrox_state",
+                           redis_url: str = "redis://127.0.0.1:6379",
+                           max_token_age: float = 86400.0):
+    """Crea la lista de revocación para el modo de despliegue (ATROX_SHARED_STATE)"""
+    if mode == "shm":
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        return FileRevocations(os.path.join(base, f"{namespace}_revoked"), max_token_age=max_token_age)
+    if mode == "redis":
+        return RedisRevocations(redis_url, prefix=f"{namespace.replace('_', ':')}:revoked",
+                                max_token_age=max_token_age)
+    if mode == "local":
+        return LocalRevocations()
+    raise ValueError(f"Modo de estado compartido desconocido: {mode}")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Peticiones condicionales
+=======================================
+
+Validadores HTTP (ETag / Last-Modified) calculados a partir de estado
+barato de obtener, y respuestas 304 sin construir ni serializar el cuerpo:
+- Listados: mtime del directorio
+- Vistas previas: (tamaño, mtime) del archivo
+- Cola/historial: número de generación del snapshot
+
+Todas las respuestas llevan Cache-Control: no-cache para que el cliente
+revalide siempre con If-None-Match / If-Modified-Since.
+"""
+
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def make_etag(*parts) -> str:
+    """ETag fuerte a partir de las partes que identifican el estado"""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode("utf-8"), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110 §13.1.2)"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: Optional[str], last_modified: Optional[float]) -> bool:
+    """True si los validadores del cliente siguen vigentes"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match tiene prioridad sobre If-Modified-Since
+        return etag is not None and _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def validator_headers(etag: Optional[str], last_modified: Optional[float]) -> dict:
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept, Authorization"}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def conditional_response(request: Request, etag: Optional[str], last_modified: Optional[float],
+                         build: Callable[[dict], Response]) -> Response:
+    """
+    Devuelve 304 si el cliente ya tiene la versión actual; si no, llama a
+    build(headers) para construir la respuesta completa con los validadores.
+    """
+    headers = validator_headers(etag, last_modified)
+    if (etag is not None or last_modified is not None) and is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    response = build(headers)
+    for name, value in headers.items():
+        response.headers.setdefault(name, value)
+    return response
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Sincronización delta de archivos
+===============================================
+
+Protocolo tipo rsync para volver a subir archivos del workspace tras
+cambios pequeños sin transferirlos enteros:
+1. El servidor publica la firma del archivo actual: por bloque, checksum
+   rodante (adler-32 de rsync) y hash fuerte (blake2b-128). Las firmas se
+   cachean por (ruta, tamaño, mtime).
+2. El cliente recorre su versión nueva con el checksum rodante y envía
+   solo referencias a bloques existentes y los datos literales nuevos.
+3. El servidor reconstruye la versión nueva en un temporal del mismo
+   directorio, verifica el SHA-256 final y la cambia con un rename atómico.
+
+Formatos binarios (little-endian):
+    firma: b"ATXS" ver:u8 bloque:u32 tamaño:u64 mtime_ns:i64 n:u32
+           weak:u32 * n  strong:16B * n
+    delta: b"ATXD" ver:u8 bloque:u32 tamaño_base:u64 mtime_base_ns:i64
+           ops... ; b"C" primer_bloque:u32 n:u32 | b"L" len:u32 datos
+           | b"E" sha256:32B (fin)
+
+compute_delta() es la implementación de referencia del cliente:
+
+    python delta_sync.py
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from metrics import cache_counters
+
+SIGNATURE_MAGIC = b"ATXS"
+DELTA_MAGIC = b"ATXD"
+VERSION = 1
+
+_SIGNATURE_HEADER = struct.Struct("<4sBIQqI")
+_DELTA_HEADER = struct.Struct("<4sBIQq")
+_COPY = struct.Struct("<II")
+_LITERAL = struct.Struct("<I")
+
+STRONG_BYTES = 16
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+
+# Temporales de reconstrucción (ocultos en los listados)
+TEMP_PREFIX = ".atrox-delta-"
+
+# Bytes procesados por iteración al calcular firmas y checksums rodantes
+_WINDOW_BYTES = 4 * 1024 * 1024
+_MAX_LITERAL = 1024 * 1024
+_IO_BYTES = 1024 * 1024
+_HASH_MULTIPLIER = np.uint32(2654435761)
+
+
+class DeltaConflict(Exception):
+    """El archivo base cambió desde que se calculó la firma"""
+
+
+def block_size_for(size: int) -> int:
+    """Tamaño de bloque ~ sqrt(tamaño) como rsync, múltiplo de 1 KB"""
+    block = int(math.sqrt(size)) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block))
+
+
+def _strong(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=STRONG_BYTES).digest()
+
+
+def _block_weak(blocks: np.ndarray) -> np.ndarray:
+    """Checksum débil de cada fila (bloques completos de igual longitud)"""
+    length = blocks.shape[1]
+    weights = np.arange(length, 0, -1, dtype=np.uint64)
+    a = blocks.sum(axis=1, dtype=np.uint64)
+    b = blocks.astype(np.uint64) @ weights
+    return ((a & 0xFFFF) | ((b & 0xFFFF) << 16)).astype(np.uint32)
+
+
+def _rolling_weak(data: np.ndarray, length: int) -> np.ndarray:
+    """
+    Checksum débil de todas las ventanas data[k:k+length] con sumas
+    prefijas: a = S[k+L] - S[k] y b = sum(S[k+1..k+L]) - L*S[k]
+    (aritmética módulo 2^32, reducida a 16 bits al final)
+    """
+    s = np.zeros(len(data) + 1, dtype=np.uint32)
+    np.cumsum(data, dtype=np.uint32, out=s[1:])
+    p = np.zeros(len(s) + 1, dtype=np.uint32)
+    np.cumsum(s, dtype=np.uint32, out=p[1:])
+    count = len(data) - length + 1
+    a = s[length:length + count] - s[:count]
+    b = p[length + 1:length + 1 + count] - p[1:count + 1]
+    b -= np.uint32(length) * s[:count]
+    a &= 0xFFFF
+    b <<= 16
+    a |= b
+    return a
+
+
+@dataclass
+class Signature:
+    """Firma de un archivo: checksum débil y hash fuerte por bloque"""
+    size: int
+    mtime_ns: int
+    block_size: int
+    weak: np.ndarray  # uint32, uno por bloque
+    strong: bytes  # STRONG_BYTES por bloque
+
+    @property
+    def count(self) -> int:
+        return len(self.weak)
+
+    def encode(self) -> bytes:
+        header = _SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, VERSION, self.block_size,
+                                        self.size, self.mtime_ns, self.count)
+        return header + self.weak.astype("<u4").tobytes() + self.strong
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Signature":
+        magic, version, block_size, size, mtime_ns, count = _SIGNATURE_HEADER.unpack_from(data)
+        if magic != SIGNATURE_MAGIC or version != VERSION:
+            raise ValueError("Firma inválida")
+        offset = _SIGNATURE_HEADER.size
+        weak = np.frombuffer(data, dtype="<u4", count=count, offset=offset).astype(np.uint32)
+        strong = bytes(data[offset + 4 * count:offset + 4 * count + STRONG_BYTES * count])
+        if len(strong) != STRONG_BYTES * count:
+            raise ValueError("Firma truncada")
+        return cls(size, mtime_ns, block_size, weak, strong)
+
+
+def compute_signature(path: Path, block_size: Optional[int] = None) -> Signature:
+    """Firma de un archivo (bloques completos vectorizados; el último puede ser corto)"""
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        block_size = block_size or block_size_for(size)
+        full_blocks, tail = divmod(size, block_size)
+        weak = np.empty(full_blocks + (1 if tail else 0), dtype=np.uint32)
+        strong = bytearray()
+        if size == 0:
+            return Signature(0, stat.st_mtime_ns, block_size, weak, b"")
+
+        per_window = max(1, _WINDOW_BYTES // block_size)
+        for first in range(0, full_blocks, per_window):
+            last = min(full_blocks, first + per_window)
+            chunk = _read_exact(f, (last - first) * block_size)
+            weak[first:last] = _block_weak(np.frombuffer(chunk, dtype=np.uint8).reshape(last - first, block_size))
+            view = memoryview(chunk)
+            for start in range(0, len(chunk), block_size):
+                strong += _strong(view[start:start + block_size])
+        if tail:
+            chunk = _read_exact(f, tail)
+            weak[-1] = _block_weak(np.frombuffer(chunk, dtype=np.uint8).reshape(1, tail))[0]
+            strong += _strong(chunk)
+
+    return Signature(size, stat.st_mtime_ns, block_size, weak, bytes(strong))
+
+
+class SignatureCache:
+    """LRU de firmas codificadas por (ruta, tamaño, mtime, bloque), acotada en bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits, self._misses = cache_counters("delta_signatures")
+
+    def get(self, path: Path, block_size: Optional[int] = None) -> Tuple[bytes, os.stat_result, int]:
+        """(firma codificada, stat, tamaño de bloque); recalcula si el archivo cambió"""
+        stat = os.stat(path)
+        block_size = block_size or block_size_for(stat.st_size)
+        key = (str(path), stat.st_size, stat.st_mtime_ns, block_size)
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self._hits.inc()
+                return encoded, stat, block_size
+        self._misses.inc()
+
+        signature = compute_signature(path, block_size)
+        encoded = signature.encode()
+        # Si el archivo cambió durante el cálculo la firma no se cachea
+        if (signature.size, signature.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            with self._lock:
+                if key not in self._entries and len(encoded) <= self.max_bytes:
+                    self._entries[key] = encoded
+                    self._bytes += len(encoded)
+                    while self._bytes > self.max_bytes:
+                        _key, evicted = self._entries.popitem(last=False)
+                        self._bytes -= len(evicted)
+        return encoded, stat, block_size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+# ---------------------------------------------------------------------------
+# Cliente: versión nueva + firma -> delta
+# ---------------------------------------------------------------------------
+
+def compute_delta(path: Path, signature: Signature) -> Iterator[bytes]:
+    """
+    Genera el delta (en trozos) que transforma el archivo firmado en `path`.
+    Tras una coincidencia se prueba directamente el bloque siguiente (hash
+    fuerte); el checksum rodante solo se calcula para resincronizar después
+    de datos nuevos.
+    """
+    yield _DELTA_HEADER.pack(DELTA_MAGIC, VERSION, signature.block_size, signature.size, signature.mtime_ns)
+
+    length = signature.block_size
+    full_blocks = signature.size // length
+    strong = signature.strong
+    by_strong: Dict[bytes, int] = {}
+    for index in range(full_blocks):
+        by_strong.setdefault(strong[index * STRONG_BYTES:(index + 1) * STRONG_BYTES], index)
+    tail_length = signature.size - full_blocks * length
+    tail_strong = strong[full_blocks * STRONG_BYTES:] if tail_length else None
+
+    # Prefiltro del checksum rodante: tabla indexada por un hash
+    # multiplicativo (~256 ranuras por bloque) y después claves exactas
+    weak_keys = np.unique(signature.weak[:full_blocks])
+    table_bits = min(24, max(16, (len(weak_keys) * 256).bit_length()))
+    shift = np.uint32(32 - table_bits)
+    table = np.zeros(1 << table_bits, dtype=bool)
+    table[(weak_keys * _HASH_MULTIPLIER) >> shift] = True
+
+    digest = hashlib.sha256()
+    ops = []
+    run = None  # (primer bloque, n) de copias consecutivas pendientes
+
+    def flush_run():
+        nonlocal run
+        if run is not None:
+            ops.append(b"C" + _COPY.pack(*run))
+            run = None
+
+    def copy(index, data):
+        nonlocal run
+        digest.update(data)
+        if run is not None and run[0] + run[1] == index:
+            run = (run[0], run[1] + 1)
+        else:
+            flush_run()
+            run = (index, 1)
+
+    def literal(data):
+        flush_run()
+        digest.update(data)
+        for start in range(0, len(data), _MAX_LITERAL):
+            piece = data[start:start + _MAX_LITERAL]
+            ops.append(b"L" + _LITERAL.pack(len(piece)) + piece)
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        try:
+            position = 0  # todo lo anterior ya está emitido
+            while by_strong and position + length <= size:
+                block = mm[position:position + length]
+                index = by_strong.get(_strong(block))
+                if index is not None:
+                    copy(index, block)
+                    position += length
+                    continue
+
+                # Resincronización: primer offset de la ventana que coincide con un bloque
+                window_end = min(size, position + _WINDOW_BYTES + length - 1)
+                weak = _rolling_weak(np.frombuffer(mm[position:window_end], dtype=np.uint8), length)
+                hits = np.flatnonzero(table[(weak * _HASH_MULTIPLIER) >> shift])
+                hits = hits[np.isin(weak[hits], weak_keys)]
+                match = None
+                for offset in hits[hits > 0]:
+                    offset = position + int(offset)
+                    block = mm[offset:offset + length]
+                    index = by_strong.get(_strong(block))
+                    if index is not None:
+                        match = offset
+                        break
+                if match is None:
+                    literal(mm[position:position + len(weak)])
+                    position += len(weak)
+                else:
+                    literal(mm[position:match])
+                    copy(index, block)
+                    position = match + length
+                yield from ops
+                ops.clear()
+
+            # El último bloque (corto) de la base puede coincidir con el final
+            tail_start = size - tail_length
+            if tail_strong and tail_start >= position and _strong(mm[tail_start:size]) == tail_strong:
+                if tail_start > position:
+                    literal(mm[position:tail_start])
+                copy(full_blocks, mm[tail_start:size])
+                position = size
+            if position < size:
+                literal(mm[position:size])
+            flush_run()
+            yield from ops
+        finally:
+            if size:
+                mm.close()
+
+    yield b"E" + digest.digest()
+
+
+# ---------------------------------------------------------------------------
+# Servidor: base + delta -> versión nueva (rename atómico)
+# ---------------------------------------------------------------------------
+
+def _read_exact(stream: BinaryIO, n: int) -> bytes:
+    data = stream.read(n)
+    if len(data) != n:
+        raise ValueError("Delta truncado")
+    return data
+
+
+def apply_delta(base_path: Path, delta: BinaryIO, max_literal_bytes: Optional[int] = None,
+                max_output_bytes: Optional[int] = None) -> Dict:
+    """
+    Reconstruye base_path a partir del delta. DeltaConflict si la base ya no
+    es la que se firmó; ValueError si el delta es inválido, si el SHA-256
+    final no coincide o si el resultado supera max_output_bytes (por
+    defecto, con max_literal_bytes, el tamaño de la base más ese límite:
+    las copias pueden repetir bloques de la base cualquier número de veces).
+    El archivo original no se toca hasta el rename final.
+    """
+    base_path = Path(base_path)
+    magic, version, block_size, base_size, base_mtime_ns = _DELTA_HEADER.unpack(
+        _read_exact(delta, _DELTA_HEADER.size))
+    if magic != DELTA_MAGIC or version != VERSION or block_size <= 0:
+        raise ValueError("Delta inválido")
+
+    fd, temp_name = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=base_path.parent)
+    try:
+        with open(base_path, "rb") as base, os.fdopen(fd, "wb") as out:
+            stat = os.fstat(base.fileno())
+            if (stat.st_size, stat.st_mtime_ns) != (base_size, base_mtime_ns):
+                raise DeltaConflict("El archivo cambió desde que se calculó la firma")
+
+            if max_output_bytes is None and max_literal_bytes is not None:
+                max_output_bytes = base_size + max_literal_bytes
+            
+            blocks = (base_size + block_size - 1) // block_size
+            digest = hashlib.sha256()
+            copied = literal = 0
+            expected = None
+            while expected is None:
+                op = _read_exact(delta, 1)
+                if op == b"C":
+                    first, count = _COPY.unpack(_read_exact(delta, _COPY.size))
+                    if count == 0 or first + count > blocks:
+                        raise ValueError("Referencia a bloque fuera de rango")
+                    start = first * block_size
+                    end = min(base_size, (first + count) * block_size)
+                    if max_output_bytes is not None and copied + literal + end - start > max_output_bytes:
+                        raise ValueError("El archivo reconstruido supera el tamaño máximo")
+                    for offset in range(start, end, _IO_BYTES):
+                        data = os.pread(base.fileno(), min(_IO_BYTES, end - offset), offset)
+                        digest.update(data)
+                        out.write(data)
+                    copied += end - start
+                elif op == b"L":
+                    (length,) = _LITERAL.unpack(_read_exact(delta, _LITERAL.size))
+                    literal += length
+                    if max_literal_bytes is not None and literal > max_literal_bytes:
+                        raise ValueError("Delta demasiado grande")
+                    if max_output_bytes is not None and copied + literal > max_output_bytes:
+                        raise ValueError("El archivo reconstruido supera el tamaño máximo")
+                    data = _read_exact(delta, length)
+                    digest.update(data)
+                    out.write(data)
+                elif op == b"E":
+                    expected = _read_exact(delta, 32)
+                else:
+                    raise ValueError("Operación de delta desconocida")
+
+            if digest.digest() != expected:
+                raise ValueError("El hash del archivo reconstruido no coincide")
+
+            out.flush()
+            os.fsync(out.fileno())
+            os.chmod(temp_name, stat.st_mode & 0o7777)
+
+            # Última comprobación: nadie escribió la base mientras se reconstruía
+            current = os.stat(base_path)
+            if (current.st_size, current.st_mtime_ns) != (base_size, base_mtime_ns):
+                raise DeltaConflict("El archivo cambió durante la sincronización")
+            os.replace(temp_name, base_path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return {
+        "size": copied + literal,
+        "copied_bytes": copied,
+        "literal_bytes": literal,
+        "hash": expected.hex(),
+    }
+
+
+if __name__ == "__main__":
+    # Comprobación: archivo de 64 MB con ediciones pequeñas
+    import io
+    import time
+
+    rng = np.random.default_rng(0)
+    workdir = Path(tempfile.mkdtemp(prefix="atrox_delta_"))
+    base_file = workdir / "data.dat"
+    original = rng.integers(0, 256, 64 * 1024 * 1024 + 777, dtype=np.uint8).tobytes()
+    base_file.write_bytes(original)
+
+    edited = bytearray(original)
+    edited[1000:1010] = b"X" * 10  # sobrescritura
+    edited[30_000_000:30_000_000] = b"insertado" * 100  # inserción (desplaza el resto)
+    del edited[50_000_000:50_001_234]  # borrado
+    edited += b"cola nueva"
+    new_file = workdir / "nuevo.dat"
+    new_file.write_bytes(edited)
+
+    cache = SignatureCache()
+    start = time.perf_counter()
+    encoded, _stat, _block = cache.get(base_file)
+    signature_time = time.perf_counter() - start
+    assert cache.get(base_file)[0] is encoded  # acierto: el mismo objeto
+
+    start = time.perf_counter()
+    delta = b"".join(compute_delta(new_file, Signature.decode(encoded)))
+    delta_time = time.perf_counter() - start
+
+    result = apply_delta(base_file, io.BytesIO(delta))
+    assert base_file.read_bytes() == bytes(edited)
+    assert result["hash"] == hashlib.sha256(edited).hexdigest()
+    assert not list(workdir.glob(TEMP_PREFIX + "*"))
+
+    try:
+        apply_delta(base_file, io.BytesIO(delta))
+        raise AssertionError("se esperaba DeltaConflict")
+    except DeltaConflict:
+        pass
+
+    print(f"OK: firma {len(encoded) / 1024:.0f} KB en {signature_time:.2f}s, "
+          f"delta {len(delta) / 1024:.0f} KB ({100 * len(delta) / len(edited):.2f}% del archivo) "
+          f"en {delta_time:.2f}s")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Informes de eficiencia
+=====================================
+
+Eficiencia tipo seff (CPU, memoria, uso de walltime) de todos los
+trabajos de una ventana de días a partir de un único sacct:
+- Un solo sacct -P con campos TRES para todos los trabajos y pasos
+- Parseo a arrays columnares (un array NumPy por campo)
+- Métricas y agrupaciones (usuario, partición, nombre) vectorizadas con
+  np.unique + np.bincount, sin bucles por trabajo
+
+Equivalencias con seff:
+- CPU efficiency    = TotalCPU / (Elapsed * AllocCPUS)
+- Memory efficiency = max(MaxRSS de los pasos) / memoria asignada (AllocTRES mem)
+- Walltime usage    = Elapsed / Timelimit
+"""
+
+import random
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+SACCT_FIELDS = (
+    "JobID", "JobName", "User", "Partition", "State", "AllocCPUS",
+    "ElapsedRaw", "TimelimitRaw", "TotalCPU", "MaxRSS", "AllocTRES",
+)
+
+GROUP_KEYS = ("user", "partition", "name")
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4, "P": 1024 ** 5}
+
+
+def sacct_command(user_id: Optional[str], start: datetime) -> List[str]:
+    """Comando sacct de la ventana (user_id None: todos los usuarios)"""
+    args = ["sacct", "-n", "-P", "--noconvert", "-o", ",".join(SACCT_FIELDS),
+            "-S", start.strftime("%Y-%m-%dT%H:%M:%S"), "-E", "now"]
+    args += ["-a"] if user_id is None else ["-u", user_id]
+    return args
+
+
+def parse_size(value: str) -> float:
+    """'1234K', '16G', '4000Mn' -> bytes (sin unidad: bytes)"""
+    if not value:
+        return np.nan
+    value = value.rstrip("nc")  # sufijos por nodo/por CPU de versiones antiguas
+    unit = _UNITS.get(value[-1:])
+    try:
+        return float(value[:-1]) * unit if unit else float(value)
+    except ValueError:
+        return np.nan
+
+
+def parse_duration(value: str) -> float:
+    """'[DD-][HH:]MM:SS[.mmm]' -> segundos"""
+    if not value:
+        return np.nan
+    days, _, clock = value.rpartition("-")
+    seconds = 0.0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds + (int(days) * 86400 if days else 0)
+
+
+_TRES_MEM = re.compile(r"(?:^|,)mem=([^,]*)")
+_TRES_GPU = re.compile(r"(?:^|,)gres/gpu=(\d+)")
+
+
+def _tres_values(pattern: re.Pattern, tres: Sequence[str]) -> List[str]:
+    """Valor de un campo TRES en cada fila ('' si no aparece)"""
+    search = pattern.search
+    return [m.group(1) if m else "" for m in map(search, tres)]
+
+
+class JobColumns:
+    """Trabajos de un sacct en formato columnar (una fila por trabajo)"""
+
+    def __init__(self, job_id, name, user, partition, state, alloc_cpus, elapsed,
+                 timelimit, total_cpu, alloc_mem, max_rss, gpus):
+        self.job_id = job_id
+        self.name = name
+        self.user = user
+        self.partition = partition
+        self.state = state
+        self.alloc_cpus = alloc_cpus
+        self.elapsed = elapsed
+        self.timelimit = timelimit
+        self.total_cpu = total_cpu
+        self.alloc_mem = alloc_mem
+        self.max_rss = max_rss
+        self.gpus = gpus
+
+    def __len__(self) -> int:
+        return len(self.job_id)
+
+    @classmethod
+    def from_sacct(cls, lines: Iterable[str]) -> "JobColumns":
+        """
+        Parsea la salida de sacct -P. Las filas de trabajo aportan los
+        campos del trabajo; las de pasos (JobID con '.') solo MaxRSS.
+        """
+        job_rows = []
+        index: Dict[str, int] = {}
+        step_jobs = []
+        step_rss = []
+
+        for line in lines:
+            fields = line.rstrip("\n").split("|")
+            if len(fields) != len(SACCT_FIELDS):
+                continue
+            job_id, _, step = fields[0].partition(".")
+            if step:
+                if fields[9]:
+                    step_jobs.append(job_id)
+                    step_rss.append(fields[9])
+                continue
+            index[job_id] = len(job_rows)
+            job_rows.append(fields)
+
+        n = len(job_rows)
+        if n:
+            columns = list(zip(*job_rows))
+        else:
+            columns = [()] * len(SACCT_FIELDS)
+
+        alloc_tres = columns[10]
+        timelimit = np.array(
+            [float(v) * 60 if v.isdigit() else np.nan for v in columns[7]], dtype=np.float64
+        )
+        max_rss = np.full(n, np.nan)
+        if step_jobs:
+            rows = np.array([index.get(j, -1) for j in step_jobs], dtype=np.int64)
+            rss = np.array([parse_size(v) for v in step_rss], dtype=np.float64)
+            keep = (rows >= 0) & ~np.isnan(rss)
+            np.fmax.at(max_rss, rows[keep], rss[keep])
+
+        return cls(
+            job_id=np.array(columns[0], dtype=object),
+            name=np.array(columns[1], dtype=object),
+            user=np.array(columns[2], dtype=object),
+            partition=np.array(columns[3], dtype=object),
+            # "CANCELLED by 1000" -> "CANCELLED"
+            state=np.array([s.split(" ", 1)[0] for s in columns[4]], dtype=object),
+            alloc_cpus=np.array([int(v or 0) for v in columns[5]], dtype=np.int64),
+            elapsed=np.array([float(v or 0) for v in columns[6]], dtype=np.float64),
+            timelimit=timelimit,
+            total_cpu=np.array([parse_duration(v) for v in columns[8]], dtype=np.float64),
+            alloc_mem=np.array([parse_size(v) for v in _tres_values(_TRES_MEM, alloc_tres)], dtype=np.float64),
+            max_rss=max_rss,
+            gpus=np.array([int(v or 0) for v in _tres_values(_TRES_GPU, alloc_tres)], dtype=np.int64),
+        )
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator con NaN donde el denominador no es positivo"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _round(value, digits: int = 4):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    value = float(value)
+    return None if value != value else round(value, digits)
+
+
+class EfficiencyReport:
+    """Métricas de eficiencia vectorizadas sobre JobColumns"""
+
+    def __init__(self, jobs: JobColumns):
+        self.jobs = jobs
+        self.cpu_seconds_alloc = jobs.elapsed * jobs.alloc_cpus
+        self.cpu_efficiency = _ratio(jobs.total_cpu, self.cpu_seconds_alloc)
+        self.memory_efficiency = _ratio(jobs.max_rss, jobs.alloc_mem)
+        self.walltime_usage = _ratio(jobs.elapsed, jobs.timelimit)
+
+    def _aggregate(self, inverse: np.ndarray, groups: int) -> Dict[str, np.ndarray]:
+        """Agregados por grupo (inverse: grupo de cada trabajo)"""
+        jobs = self.jobs
+        counts = np.bincount(inverse, minlength=groups)
+        alloc = np.bincount(inverse, weights=self.cpu_seconds_alloc, minlength=groups)
+        used = np.bincount(inverse, weights=np.nan_to_num(jobs.total_cpu), minlength=groups)
+
+        def mean(values: np.ndarray) -> np.ndarray:
+            valid = ~np.isnan(values)
+            total = np.bincount(inverse[valid], weights=values[valid], minlength=groups)
+            return _ratio(total, np.bincount(inverse[valid], minlength=groups).astype(np.float64))
+
+        failed = np.isin(jobs.state, ("FAILED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL"))
+        return {
+            "jobs": counts,
+            "cpu_hours_allocated": alloc / 3600,
+            "cpu_hours_used": used / 3600,
+            "cpu_hours_wasted": np.maximum(alloc - used, 0) / 3600,
+            # Ponderada por CPU-horas, como el total de seff
+            "cpu_efficiency": _ratio(used, alloc),
+            "memory_efficiency": mean(self.memory_efficiency),
+            "walltime_usage": mean(self.walltime_usage),
+            "failed_jobs": np.bincount(inverse, weights=failed, minlength=groups).astype(np.int64),
+        }
+
+    def summary(self) -> Dict:
+        aggregated = self._aggregate(np.zeros(len(self.jobs), dtype=np.int64), 1)
+        return {name: _round(values[0]) for name, values in aggregated.items()}
+
+    def group_by(self, key: str) -> List[Dict]:
+        """Agregados por usuario, partición o nombre, de mayor a menor desperdicio"""
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Agrupación desconocida: {key}")
+        if not len(self.jobs):
+            return []
+        labels, inverse = np.unique(getattr(self.jobs, key).astype(str), return_inverse=True)
+        aggregated = self._aggregate(inverse, len(labels))
+        order = np.argsort(-aggregated["cpu_hours_wasted"], kind="stable")
+        names = list(aggregated)
+        columns = [aggregated[name][order].tolist() for name in names]
+        return [
+            {key: label, **{name: _round(value) for name, value in zip(names, row)}}
+            for label, row in zip(labels[order].tolist(), zip(*columns))
+        ]
+
+    def least_efficient(self, limit: int = 20) -> List[Dict]:
+        """Trabajos con más CPU-horas desperdiciadas"""
+        jobs = self.jobs
+        wasted = self.cpu_seconds_alloc - np.nan_to_num(jobs.total_cpu)
+        order = np.argsort(-wasted, kind="stable")[:limit]
+        return [
+            {
+                "job_id": jobs.job_id[i],
+                "name": jobs.name[i],
+                "user": jobs.user[i],
+                "partition": jobs.partition[i],
+                "state": jobs.state[i],
+                "cpu_efficiency": _round(self.cpu_efficiency[i]),
+                "memory_efficiency": _round(self.memory_efficiency[i]),
+                "walltime_usage": _round(self.walltime_usage[i]),
+                "cpu_hours_wasted": _round(max(wasted[i], 0) / 3600),
+            }
+            for i in order.tolist()
+        ]
+
+    def to_dict(self, group_by: Sequence[str] = GROUP_KEYS, limit: int = 20) -> Dict:
+        return {
+            "jobs": len(self.jobs),
+            "summary": self.summary(),
+            "groups": {key: self.group_by(key) for key in group_by},
+            "least_efficient": self.least_efficient(limit),
+        }
+
+
+def simulate_sacct_output(user_id: Optional[str], jobs: int = 2000, seed: int = 0) -> List[str]:
+    """Salida de sacct sintética (desarrollo y benchmarks sin Slurm)"""
+    rng = random.Random(seed)
+    users = [user_id] if user_id else ["alice", "bob", "carol", "dave"]
+    names = ["train_model", "preprocess", "simulation", "analysis", "render"]
+    partitions = ["general", "gpu", "highmem"]
+    states = ["COMPLETED"] * 8 + ["FAILED", "TIMEOUT", "CANCELLED by 1000"]
+    lines = []
+    for i in range(jobs):
+        job_id = str(100000 + i)
+        cpus = rng.choice((1, 2, 4, 8, 16, 32))
+        limit_min = rng.choice((30, 60, 120, 240, 1440))
+        elapsed = rng.randint(10, limit_min * 60)
+        total_cpu = timedelta(seconds=elapsed * cpus * rng.uniform(0.05, 1.0))
+        mem_gb = rng.choice((2, 4, 8, 16, 64))
+        partition = rng.choice(partitions)
+        gpu = ",gres/gpu=1" if partition == "gpu" else ""
+        total = int(total_cpu.total_seconds())
+        cpu_text = f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+        common = [rng.choice(users), partition, rng.choice(states), str(cpus), str(elapsed), str(limit_min)]
+        lines.append("|".join([job_id, rng.choice(names), *common, cpu_text, "",
+                               f"billing={cpus},cpu={cpus},mem={mem_gb}G,node=1{gpu}"]))
+        rss = int(mem_gb * 1024 * 1024 * rng.uniform(0.02, 1.0))
+        lines.append("|".join([f"{job_id}.batch", "batch", "", partition, "COMPLETED", str(cpus),
+                               str(elapsed), "", cpu_text, f"{rss}K", f"cpu={cpus},mem={mem_gb}G,node=1"]))
+    return lines
@@ -15,23 +15,92 @@ NOTA: Este es un template de ejemplo. En producción requiere:
 - Tests unitarios
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, status
+from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from functools import lru_cache
+import asyncio
+import hmac
+import ipaddress
+import os
+import shutil
+import tempfile
+import time
 import uvicorn
 
-# Importar templates locales (en producción serían módulos reales)
-# from .job_manager import SlurmJobManager, JobConfig, IntelligentJobAssistant
-# from .file_manager import UserFileManager
+from auth_cache import TokenCache, UserCache, create_revocation_list
+from conditional import conditional_response, make_etag
+from delta_sync import MAX_BLOCK_SIZE as MAX_DELTA_BLOCK_SIZE, MIN_BLOCK_SIZE as MIN_DELTA_BLOCK_SIZE
+from file_manager import UserFileManager, build_archive, hash_file
+from file_watcher import WorkspaceWatcher
+from job_manager import (JOB_NAME_PATTERN, MEMORY_PATTERN, PARTITION_PATTERN, WALLTIME_PATTERN, JobConfig,
+                         JobSelector, JobStatus, NodeStatus, SlurmJobManager, WorkflowStep)
+from metrics import CONTENT_TYPE_LATEST, RouteMetrics, instrument_handler, render_latest
+from profiling import ProfileStore, ProfilingMiddleware, bind_request_thread
+from serialization import NDJSON_MEDIA_TYPE, FastJSONResponse, dumps, dumps_line, list_response, wants_ndjson
+from shared_state import create_snapshot_store
+from singleflight import default_group as singleflight_group
+from slurm_rest import DEFAULT_API_VERSION, SlurmRestClient, SlurmRestJobManager
+from staging import DataStager
+from task_queue import PROCESS_LANE, TaskQueue, TaskSpec
+from telemetry import METRICS as TELEMETRY_METRICS, TelemetryStore
+from thumbnails import DEFAULT_THUMBNAIL_SIZE, ThumbnailService
+import log_search
+
+# Directorio base de LeoAtrox (usuarios, trabajos y resultados)
+ATROX_BASE_DIR = os.environ.get("ATROX_BASE_DIR", "/home/leoatrox")
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute que mide latencia, peticiones en curso y códigos de estado.
+    Las métricas de cada ruta se resuelven una vez al registrarla.
+    Los endpoints síncronos se asocian al hilo que los ejecuta (profiling).
+    """
+
+    def get_route_handler(self):
+        # Endpoints síncronos: el hilo del threadpool queda asociado a la petición (profiling)
+        if self.dependant.call is not None and not getattr(self.dependant.call, "__atrox_bound__", False):
+            self.dependant.call = bind_request_thread(self.dependant.call)
+        handler = super().get_route_handler()
+        method = ",".join(sorted(self.methods or {"GET"}))
+        return instrument_handler(RouteMetrics(method, self.path), handler)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranca el refresco de snapshots compartidos de Slurm y la telemetría en cada worker"""
+    snapshot_store.start()
+    get_file_manager().trash.start()
+    get_job_manager()
+    data_stager.start()
+    task_queue.start()
+    telemetry_collector = telemetry_store.start_collector(lambda: snapshot_store.get("nodes") or [])
+    yield
+    task_queue.stop()
+    data_stager.stop()
+    file_watcher.stop()
+    thumbnail_service.shutdown()
+    log_search.shutdown()
+    get_file_manager().trash.stop()
+    telemetry_collector.stop()
+    snapshot_store.stop()
+
 
 app = FastAPI(
     title="AtroxGetaway API",
     description="API para gestión de trabajos en supercomputadora LeoAtrox",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
+app.router.route_class = InstrumentedRoute
 
 # Configurar CORS
 app.add_middleware(
@@ -45,26 +114,89 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
+# Cachés de autenticación: tokens verificados (hasta su exp) y usuarios (TTL)
+token_cache = TokenCache(max_entries=int(os.environ.get("ATROX_TOKEN_CACHE_SIZE", "10000")))
+user_cache = UserCache(ttl=float(os.environ.get("ATROX_USER_CACHE_TTL", "60")))
+
+# Revocaciones (logout, baja): compartidas entre workers según ATROX_SHARED_STATE;
+# las de usuario se guardan lo que dura como mucho un token
+revocations = create_revocation_list(
+    mode=os.environ.get("ATROX_SHARED_STATE", "local"),
+    namespace=os.environ.get("ATROX_STATE_NAMESPACE", "atrox_state"),
+    redis_url=os.environ.get("REDIS_URL", "redis://127.0.0.1:6379"),
+    max_token_age=float(os.environ.get("ATROX_TOKEN_MAX_AGE", "86400")),
+)
+
+# Búsqueda en logs: bytes escaneados como mucho por petición (se continúa
+# con next_offset) y plazo de cada bloque (regex con backtracking catastrófico)
+LOG_SEARCH_MAX_BYTES = int(os.environ.get("ATROX_LOG_SEARCH_MAX_BYTES", str(1024 ** 3)))
+LOG_SEARCH_CHUNK_TIMEOUT = float(os.environ.get("ATROX_LOG_SEARCH_CHUNK_TIMEOUT", "10"))
+
+# Profiling: umbral de petición lenta (ms, 0 desactiva la captura)
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get("ATROX_SLOW_REQUEST_MS", "1000"))
+profile_store = ProfileStore(
+    max_profiles=int(os.environ.get("ATROX_MAX_PROFILES", "20")),
+    max_slow_requests=int(os.environ.get("ATROX_MAX_SLOW_REQUESTS", "100")),
+)
+
 # Pydantic Models
 class JobSubmissionRequest(BaseModel):
-    name: str = Field(..., description="Nombre del trabajo")
+    name: str = Field(..., pattern=JOB_NAME_PATTERN, description="Nombre del trabajo (letras, dígitos, _ . -)")
     script_content: Optional[str] = Field(None, description="Contenido del script")
     cpus: int = Field(2, ge=1, le=128, description="Número de CPUs")
-    memory: str = Field("4GB", description="Cantidad de memoria RAM")
-    walltime: str = Field("01:00:00", description="Tiempo máximo (HH:MM:SS)")
-    partition: str = Field("general", description="Partición Slurm")
+    memory: str = Field("4GB", pattern=MEMORY_PATTERN, description="Cantidad de memoria RAM")
+    walltime: str = Field("01:00:00", pattern=WALLTIME_PATTERN, description="Tiempo máximo (HH:MM:SS)")
+    partition: str = Field("general", pattern=PARTITION_PATTERN, description="Partición Slurm")
     gpu: int = Field(0, ge=0, le=8, description="Número de GPUs")
 
 
+class WorkflowStepRequest(JobSubmissionRequest):
+    step_id: str = Field(..., pattern=JOB_NAME_PATTERN, description="Identificador del paso dentro del workflow")
+    script_path: str = Field(..., description="Script a ejecutar (ruta dentro del directorio del usuario)")
+    depends_on: List[str] = Field(default_factory=list, description="Pasos que deben terminar bien antes")
+    array_size: int = Field(0, ge=0, le=10000, description="Tareas del job array (0 = sin array)")
+
+
+class WorkflowSubmissionRequest(BaseModel):
+    name: str = Field(..., pattern=JOB_NAME_PATTERN, description="Nombre del workflow")
+    steps: List[WorkflowStepRequest] = Field(..., min_length=1, description="Pasos del DAG")
+
+
+class StagedJobSubmissionRequest(JobSubmissionRequest):
+    script_path: str = Field(..., description="Script a ejecutar (ruta dentro del directorio del usuario)")
+    stage_in: List[str] = Field(default_factory=list, description="Archivos o directorios del usuario a copiar al tier rápido")
+    stage_out: Optional[str] = Field(None, description="Directorio del usuario donde copiar $ATROX_STAGE_OUT al terminar")
+
+
+class BulkJobRequest(BaseModel):
+    action: str = Field(..., pattern="^(cancel|hold|release|requeue)$", description="Acción a aplicar")
+    job_ids: List[str] = Field(default_factory=list, max_length=20000, description="Ids de trabajos")
+    name: Optional[str] = Field(None, description="Patrón glob sobre el nombre")
+    state: Optional[str] = Field(None, description="Estado (running, queued, ...)")
+    partition: Optional[str] = Field(None, description="Partición Slurm")
+    array_id: Optional[str] = Field(None, description="Job id padre de un job array")
+    all_users: bool = Field(False, description="Trabajos de todos los usuarios (solo administradores)")
+
+
+class TaskSubmissionRequest(BaseModel):
+    name: str = Field(..., description="Tipo de tarea (file_hash, archive, disk_usage, preview, efficiency_report, slurm_sync)")
+    args: Dict[str, Any] = Field(default_factory=dict, description="Argumentos de la tarea")
+    priority: int = Field(0, ge=-10, le=10, description="Prioridad (mayor primero; > 0 solo administradores)")
+
+
 class JobStatusResponse(BaseModel):
+    """Esquema de JobStatus (job_manager) tal como se serializa en /api/jobs"""
     job_id: str
     name: str
     status: str
-    progress: int
     submit_time: datetime
-    user: str
-    cpus: int
-    memory: str
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    cpus: int = 0
+    memory: str = ""
+    user: str = ""
+    progress: int = 0
+    partition: str = ""
 
 
 class UserInfo(BaseModel):
@@ -90,50 +222,294 @@ MOCK_USER = UserInfo(
     name="Usuario Test",
     role="user"
 )
+# iat del token de prueba
+MOCK_TOKEN_ISSUED_AT = time.time()
 
-MOCK_JOBS = [
-    JobStatusResponse(
-        job_id="job_001",
-        name="Análisis RNA-Seq",
-        status="running",
-        progress=75,
-        submit_time=datetime.now(),
-        user="Dr. García",
-        cpus=8,
-        memory="16GB"
-    ),
-    JobStatusResponse(
-        job_id="job_002",
-        name="Simulación Molecular",
-        status="queued", 
-        progress=0,
-        submit_time=datetime.now(),
-        user="Ana López",
-        cpus=16,
-        memory="32GB"
-    )
+
+JOB_TEMPLATES = [
+    {
+        "id": "template_001",
+        "name": "Análisis Genómico Estándar",
+        "cpus": 8,
+        "memory": "16GB",
+        "partition": "general",
+        "walltime": "04:00:00"
+    },
+    {
+        "id": "template_002", 
+        "name": "Deep Learning GPU",
+        "cpus": 12,
+        "memory": "32GB",
+        "partition": "gpu",
+        "gpu": 2,
+        "walltime": "08:00:00"
+    }
 ]
+JOB_TEMPLATES_ETAG = make_etag("templates", dumps(JOB_TEMPLATES))
 
 
-# Dependency: Get current user
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInfo:
+# Staging de entradas/salidas de trabajos en el tier rápido (export de node-storage)
+data_stager = DataStager(
+    os.environ.get("ATROX_STAGING_DIR", os.path.join(ATROX_BASE_DIR, "staging")),
+    capacity_bytes=int(float(os.environ.get("ATROX_STAGING_CAPACITY_GB", "500")) * 1024 ** 3),
+    workers=int(os.environ.get("ATROX_STAGING_WORKERS", "8")),
+)
+
+
+# Managers (una instancia por proceso)
+@lru_cache(maxsize=None)
+def get_job_manager() -> SlurmJobManager:
+    # Backend por despliegue: comandos de Slurm (cli) o slurmrestd (rest)
+    if os.environ.get("ATROX_SLURM_BACKEND", "cli") == "rest":
+        client = SlurmRestClient(
+            os.environ.get("ATROX_SLURMRESTD_URL", "unix:///run/slurmrestd/slurmrestd.socket"),
+            token=os.environ.get("SLURM_JWT"),
+            user=os.environ.get("ATROX_SLURMRESTD_USER"),
+            api_version=os.environ.get("ATROX_SLURMRESTD_API", DEFAULT_API_VERSION),
+            pool_size=int(os.environ.get("ATROX_SLURMRESTD_POOL", "8")),
+            idle_timeout=float(os.environ.get("ATROX_SLURMRESTD_IDLE_TIMEOUT", "4")),
+        )
+        manager = SlurmRestJobManager(base_dir=ATROX_BASE_DIR, client=client)
+    else:
+        manager = SlurmJobManager(base_dir=ATROX_BASE_DIR)
+    manager.attach_stager(data_stager)
+    return manager
+
+
+@lru_cache(maxsize=None)
+def get_file_manager() -> UserFileManager:
+    # Borrados: ventana de deshacer (0 = sin deshacer) y unlinks/s del reaper
+    return UserFileManager(
+        base_dir=os.path.join(ATROX_BASE_DIR, "users"),
+        trash_undo_seconds=float(os.environ.get("ATROX_TRASH_UNDO_SECONDS", "0")),
+        trash_unlink_rate=float(os.environ.get("ATROX_TRASH_UNLINK_RATE", "5000")),
+    )
+
+
+# Vigilancia de directorios abiertos en el explorador (inotify o sondeo)
+file_watcher = WorkspaceWatcher(
+    get_file_manager(),
+    idle_timeout=float(os.environ.get("ATROX_WATCH_IDLE_TIMEOUT", "60")),
+    poll_interval=float(os.environ.get("ATROX_WATCH_POLL_INTERVAL", "2")),
+)
+
+# Miniaturas de imágenes/PDF: pool de procesos y caché en disco por contenido;
+# los resultados nuevos en directorios abiertos se renderizan al aparecer
+thumbnail_service = ThumbnailService(
+    cache_dir=os.environ.get("ATROX_THUMBNAIL_DIR", os.path.join(ATROX_BASE_DIR, "cache", "thumbnails")),
+    max_workers=int(os.environ.get("ATROX_THUMBNAIL_WORKERS", "2")),
+    max_cache_bytes=int(os.environ.get("ATROX_THUMBNAIL_CACHE_MB", "1024")) * 1024 * 1024,
+)
+file_watcher.add_listener(thumbnail_service.on_workspace_events)
+
+
+# Snapshots de cola y nodos: un worker líder consulta Slurm y los publica
+# (ATROX_SHARED_STATE=local|shm|redis; shm o redis con varios workers)
+snapshot_store = create_snapshot_store(
+    mode=os.environ.get("ATROX_SHARED_STATE", "local"),
+    interval=float(os.environ.get("ATROX_SNAPSHOT_INTERVAL", "5")),
+    shm_size=int(os.environ.get("ATROX_SHM_SIZE", str(16 * 1024 * 1024))),
+    redis_url=os.environ.get("REDIS_URL", "redis://127.0.0.1:6379"),
+    namespace=os.environ.get("ATROX_STATE_NAMESPACE", "atrox_state"),
+)
+snapshot_store.register("jobs", JobStatus, lambda: get_job_manager().get_queue_status())
+snapshot_store.register("nodes", NodeStatus, lambda: get_job_manager().get_node_status())
+
+
+# Cola persistente de tareas pesadas (SQLite compartido por los workers):
+# carril de hilos para E/S y llamadas a los managers, de procesos para CPU
+task_queue = TaskQueue(
+    os.environ.get("ATROX_TASK_DB", os.path.join(ATROX_BASE_DIR, "tasks", "tasks.db")),
+    thread_workers=int(os.environ.get("ATROX_TASK_THREADS", "4")),
+    process_workers=int(os.environ.get("ATROX_TASK_PROCESSES", "2")),
+    retention_seconds=float(os.environ.get("ATROX_TASK_RETENTION_HOURS", "24")) * 3600,
+)
+
+
+def _task_file(user_id: str, path, directories: bool = False) -> str:
+    """Ruta absoluta de un archivo existente del usuario para los argumentos de una tarea"""
+    if not isinstance(path, str) or not path:
+        raise ValueError("Se requiere 'path'")
+    target = get_file_manager().resolve_path(user_id, path)
+    if not (target.is_file() or (directories and target.is_dir())):
+        raise ValueError(f"Archivo no encontrado: {path}")
+    return str(target)
+
+
+def _prepare_archive(user_id: str, args: Dict) -> Dict:
+    source = _task_file(user_id, args.get("path"), directories=True)
+    dest = args.get("dest") or f"{args['path'].rstrip('/')}.tar.gz"
+    dest_path = get_file_manager().resolve_path(user_id, dest)
+    if dest_path.exists():
+        raise ValueError(f"El destino ya existe: {dest}")
+    if not dest_path.parent.is_dir():
+        raise ValueError(f"Directorio de destino no encontrado: {dest}")
+    return {"source": source, "dest": str(dest_path)}
+
+
+def _prepare_preview(user_id: str, args: Dict) -> Dict:
+    _task_file(user_id, args.get("path"))
+    max_lines = int(args.get("max_lines", 100))
+    if not 1 <= max_lines <= 100000:
+        raise ValueError("max_lines debe estar entre 1 y 100000")
+    return {"user_id": user_id, "path": args["path"], "max_lines": max_lines}
+
+
+def _prepare_efficiency(user_id: str, args: Dict) -> Dict:
+    return {
+        "user_id": user_id,
+        "days": int(args.get("days", 30)),
+        "group_by": [str(key) for key in args.get("group_by", ["user", "partition", "name"])],
+        "limit": int(args.get("limit", 20)),
+    }
+
+
+task_queue.register(TaskSpec(
+    "file_hash", hash_file, lane=PROCESS_LANE,
+    prepare=lambda user_id, args: {"path": _task_file(user_id, args.get("path"))},
+))
+task_queue.register(TaskSpec("archive", build_archive, lane=PROCESS_LANE, max_attempts=2,
+                             prepare=_prepare_archive))
+task_queue.register(TaskSpec(
+    "disk_usage", lambda progress, user_id: get_file_manager().get_disk_usage(user_id),
+    prepare=lambda user_id, args: {"user_id": user_id},
+))
+task_queue.register(TaskSpec(
+    "preview", lambda progress, user_id, path, max_lines: get_file_manager().preview_file(user_id, path, max_lines),
+    prepare=_prepare_preview,
+))
+task_queue.register(TaskSpec(
+    "efficiency_report",
+    lambda progress, user_id, days, group_by, limit: get_job_manager().get_efficiency_report(
+        user_id, days, tuple(group_by), limit),
+    prepare=_prepare_efficiency,
+))
+task_queue.register(TaskSpec(
+    "slurm_sync", lambda progress: {"refreshed": snapshot_store.refresh()},
+    prepare=lambda user_id, args: {}, admin_only=True, max_attempts=1,
+))
+
+# Telemetría por nodo: muestras del snapshot de nodos (sinfo) cada
+# ATROX_TELEMETRY_INTERVAL segundos, reducidas a 1m (24h) y 10m (7 días)
+telemetry_store = TelemetryStore(
+    raw_step=float(os.environ.get("ATROX_TELEMETRY_INTERVAL", "15")),
+    raw_retention=float(os.environ.get("ATROX_TELEMETRY_RAW_RETENTION", "3600")),
+    max_nodes=int(os.environ.get("ATROX_TELEMETRY_MAX_NODES", "1024")),
+)
+
+
+def verify_token(token: str) -> Tuple[str, float, float]:
     """
-    Template: Validación de usuario
-    En producción validaría el JWT token
+    Template: Verifica la firma del JWT y devuelve (user_id, exp, iat)
     """
     # TEMPLATE: Aquí iría la validación real del JWT
     # try:
-    #     payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    #     payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     #     user_id: str = payload.get("sub")
     #     if user_id is None:
     #         raise HTTPException(status_code=401, detail="Token inválido")
-    #     return get_user_from_db(user_id)
+    #     return user_id, payload["exp"], payload.get("iat", 0)
     # except JWTError:
     #     raise HTTPException(status_code=401, detail="Token inválido")
     
+    return MOCK_USER.user_id, time.time() + 3600, MOCK_TOKEN_ISSUED_AT
+
+
+def get_user_from_db(user_id: str) -> UserInfo:
+    """
+    Template: Carga el registro del usuario
+    """
+    # TEMPLATE: Consulta real a la base de datos de usuarios
     return MOCK_USER
 
 
+def resolve_user(token: str) -> UserInfo:
+    """
+    Resuelve el usuario de un bearer token.
+    Los tokens ya verificados y los usuarios recientes se sirven de caché,
+    sin repetir la verificación criptográfica ni la consulta a la base de datos.
+    La lista de revocación se consulta siempre, antes de la caché.
+    """
+    if revocations.token_revoked(token):
+        token_cache.revoke_token(token)
+        raise HTTPException(status_code=401, detail="Token revocado")
+    
+    entry = token_cache.get(token)
+    if entry is None:
+        user_id, exp, issued_at = verify_token(token)
+    else:
+        user_id, exp, issued_at = entry
+    
+    # Tokens emitidos antes de revocar las sesiones del usuario
+    if issued_at < revocations.revoked_before(user_id):
+        token_cache.revoke_token(token)
+        raise HTTPException(status_code=401, detail="Token revocado")
+    if entry is None:
+        token_cache.put(token, user_id, exp, issued_at)
+    
+    user = user_cache.get(user_id)
+    if user is None:
+        user = get_user_from_db(user_id)
+        user_cache.put(user_id, user)
+    
+    return user
+
+
+def revoke_user_sessions(user_id: str) -> int:
+    """Gancho de revocación: invalida los tokens emitidos hasta ahora y los datos cacheados de un usuario"""
+    revocations.revoke_user(user_id, time.time())
+    user_cache.invalidate(user_id)
+    return token_cache.revoke_user(user_id)
+
+
+def revoke_token(token: str):
+    """Gancho de revocación de un token concreto (logout), hasta su expiración"""
+    entry = token_cache.get(token)
+    exp = entry[1] if entry is not None else verify_token(token)[1]
+    revocations.revoke_token(token, exp)
+    token_cache.revoke_token(token)
+
+
+# Dependency: Get current user
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInfo:
+    """
+    Obtiene el usuario autenticado de la petición
+    """
+    return resolve_user(credentials.credentials)
+
+
+# Dependency: Require admin
+async def require_admin(current_user: UserInfo = Depends(get_current_user)) -> UserInfo:
+    """
+    Restringe el endpoint a administradores
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+    return current_user
+
+
+async def is_admin_request(scope) -> bool:
+    """Autoriza el profiling bajo demanda: solo administradores autenticados"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return False
+            try:
+                return resolve_user(token).role == "admin"
+            except HTTPException:
+                return False
+    return False
+
+
+app.add_middleware(
+    ProfilingMiddleware,
+    store=profile_store,
+    authorize=is_admin_request,
+    slow_threshold=SLOW_REQUEST_THRESHOLD_MS / 1000,
+)
+
+
 # Routes
 
 @app.get("/", tags=["Health"])
@@ -146,6 +522,41 @@ async def root():
     }
 
 
+# /metrics: token del scraper de Prometheus y/o red de origen permitida
+# (ATROX_METRICS_ALLOW="10.0.0.0/8,..."; detrás de nginx el origen es nginx,
+# así que por defecto no se permite ninguna red); si no, solo administradores
+METRICS_TOKEN = os.environ.get("ATROX_METRICS_TOKEN", "")
+METRICS_ALLOWED_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.environ.get("ATROX_METRICS_ALLOW", "").split(",") if network.strip()
+]
+
+
+async def require_metrics_access(request: Request):
+    """Autoriza /metrics: red permitida, token del scraper o administrador"""
+    if request.client is not None and METRICS_ALLOWED_NETWORKS:
+        try:
+            address = ipaddress.ip_address(request.client.host)
+        except ValueError:
+            address = None
+        if address is not None and any(address in network for network in METRICS_ALLOWED_NETWORKS):
+            return
+    
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Se requiere autenticación")
+    if METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    if resolve_user(token).role != "admin":
+        raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+async def metrics_endpoint():
+    """Exposición de métricas para Prometheus"""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/api/dashboard/stats", tags=["Dashboard"])
 async def get_dashboard_stats(current_user: UserInfo = Depends(get_current_user)):
     """
@@ -164,21 +575,42 @@ async def get_dashboard_stats(current_user: UserInfo = Depends(get_current_user)
     }
 
 
-@app.get("/api/jobs", response_model=List[JobStatusResponse], tags=["Jobs"])
-async def get_jobs(
+@app.get(
+    "/api/jobs",
+    response_class=FastJSONResponse,
+    # Solo documentación: la respuesta se serializa directamente desde los dataclasses
+    responses={200: {"model": List[JobStatusResponse], "content": {NDJSON_MEDIA_TYPE: {}}}},
+    tags=["Jobs"]
+)
+def get_jobs(
+    request: Request,
     status_filter: Optional[str] = None,
-    current_user: UserInfo = Depends(get_current_user)
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
 ):
     """
     Obtiene la lista de trabajos del usuario
+    (Accept: application/x-ndjson para recibirla en streaming)
     """
-    # TEMPLATE: En producción usaría job_manager.get_queue_status()
-    jobs = MOCK_JOBS
+    ndjson = wants_ndjson(request)
+    
+    # Snapshot compartido; sin snapshot vigente se consulta Slurm directamente
+    snapshot = snapshot_store.get_with_generation("jobs")
+    if snapshot is None:
+        jobs = job_manager.iter_queue_status() if ndjson else job_manager.get_queue_status()
+        if status_filter:
+            jobs = (job for job in jobs if job.status == status_filter)
+        return list_response(request, jobs)
     
-    if status_filter:
-        jobs = [job for job in jobs if job.status == status_filter]
+    generation, jobs = snapshot
     
-    return jobs
+    def build(headers):
+        items = (job for job in jobs if job.status == status_filter) if status_filter else jobs
+        return list_response(request, items, headers=headers)
+    
+    # La generación del snapshot solo cambia cuando cambia la cola
+    etag = make_etag("jobs", generation, status_filter, ndjson)
+    return conditional_response(request, etag, None, build)
 
 
 @app.post("/api/jobs", tags=["Jobs"])
@@ -236,6 +668,106 @@ async def cancel_job(
     }
 
 
+def resolve_user_script(file_manager: UserFileManager, user_id: str, path: str) -> str:
+    """
+    Ruta absoluta de un script del usuario: ValueError si sale de su
+    directorio, FileNotFoundError si no existe
+    """
+    script = file_manager.resolve_path(user_id, path).resolve()
+    if not script.is_file():
+        raise FileNotFoundError(f"Script no encontrado: {path}")
+    return str(script)
+
+
+@app.post("/api/jobs/staged", tags=["Jobs"])
+def submit_staged_job(
+    job_request: StagedJobSubmissionRequest,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Envía un trabajo con staging de datos: las entradas se copian en
+    paralelo al tier rápido (ATROX_STAGE_DIR) y el trabajo queda retenido
+    hasta que termina la copia; al acabar, ATROX_STAGE_OUT se copia a stage_out
+    """
+    try:
+        script_path = resolve_user_script(file_manager, current_user.user_id, job_request.script_path)
+        stage_in = [file_manager.resolve_path(current_user.user_id, path) for path in job_request.stage_in]
+        stage_out = file_manager.resolve_path(current_user.user_id, job_request.stage_out) if job_request.stage_out else None
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    missing = [path for path, resolved in zip(job_request.stage_in, stage_in) if not resolved.exists()]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"No existen: {', '.join(missing)}")
+    
+    config = JobConfig(
+        name=job_request.name,
+        script_path=script_path,
+        cpus=job_request.cpus,
+        memory=job_request.memory,
+        walltime=job_request.walltime,
+        partition=job_request.partition,
+        gpu=job_request.gpu,
+        user_id=current_user.user_id,
+        stage_in=[str(path) for path in stage_in],
+        stage_out=str(stage_out) if stage_out else ""
+    )
+    result = job_manager.submit_job(config)
+    if result["status"] != "success":
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/api/staging/{stage_id}", tags=["Jobs"])
+def get_staging_status(
+    stage_id: str,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Progreso del stage-in / stage-out de un trabajo
+    """
+    record = data_stager.get(stage_id, current_user.user_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Staging no encontrado")
+    return record
+
+
+@app.post("/api/jobs/bulk", tags=["Jobs"])
+def bulk_job_control(
+    bulk_request: BulkJobRequest,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
+):
+    """
+    Cancela, retiene, libera o reencola muchos trabajos a la vez: por ids
+    y/o por selector (nombre, estado, partición, job array), resuelto
+    contra el snapshot de la cola. Devuelve el resultado por trabajo.
+    """
+    if bulk_request.all_users and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+    
+    selector = JobSelector(
+        job_ids=bulk_request.job_ids,
+        name=bulk_request.name,
+        state=bulk_request.state,
+        partition=bulk_request.partition,
+        array_id=bulk_request.array_id,
+        user=None if bulk_request.all_users else current_user.user_id,
+    )
+    jobs = snapshot_store.get("jobs")
+    if jobs is None:
+        jobs = job_manager.get_queue_status()
+    
+    result = job_manager.bulk_control(bulk_request.action, selector, jobs)
+    if result["status"] != "success":
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
 @app.get("/api/jobs/{job_id}/logs", tags=["Jobs"]) 
 async def get_job_logs(
     job_id: str,
@@ -254,6 +786,68 @@ async def get_job_logs(
     }
 
 
+def search_response(file_path, pattern: str, ignore_case: bool, literal: bool, context: int,
+                    max_matches: int, max_bytes: Optional[int], offset: int, line: int) -> StreamingResponse:
+    """
+    Búsqueda en streaming NDJSON: un objeto por coincidencia y un resumen
+    final. Si el cliente corta la conexión el escaneo se cancela.
+    """
+    try:
+        regex = log_search.compile_pattern(pattern, ignore_case, literal)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    search = log_search.SearchStream(
+        str(file_path), regex,
+        context=min(max(context, 0), 10),
+        max_matches=min(max(max_matches, 1), 10000),
+        max_bytes=LOG_SEARCH_MAX_BYTES if max_bytes is None else min(max(max_bytes, 1), LOG_SEARCH_MAX_BYTES),
+        start_offset=offset, start_line=line,
+        chunk_timeout=LOG_SEARCH_CHUNK_TIMEOUT,
+    )
+    
+    async def stream():
+        try:
+            while True:
+                item = await asyncio.to_thread(search.next_item)
+                if item is None:
+                    break
+                yield dumps_line(item)
+        finally:
+            # Fin, error o desconexión: los bloques en curso se cancelan
+            search.cancel()
+    
+    return StreamingResponse(stream(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@app.get("/api/jobs/{job_id}/logs/search", tags=["Jobs"])
+def search_job_logs(
+    job_id: str,
+    pattern: str,
+    stream: str = "out",
+    ignore_case: bool = False,
+    literal: bool = False,
+    context: int = 2,
+    max_matches: int = 1000,
+    max_bytes: Optional[int] = None,
+    offset: int = 0,
+    line: int = 1,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
+):
+    """
+    Busca una expresión regular en el .out/.err de un trabajo
+    
+    Para continuar una búsqueda cortada usar offset/line = next_offset/next_line
+    del resumen anterior.
+    """
+    # Solo se buscan los logs del directorio de resultados del propio usuario
+    log_path = job_manager.get_log_path(job_id, stream, current_user.user_id)
+    if log_path is None:
+        raise HTTPException(status_code=404, detail="Log no encontrado")
+    return search_response(log_path, pattern, ignore_case, literal, context, max_matches, max_bytes, offset, line)
+
+
 @app.post("/api/jobs/analyze-script", tags=["Jobs"])
 async def analyze_script(
     script_content: str,
@@ -281,34 +875,234 @@ async def analyze_script(
     }
 
 
+@app.post("/api/workflows", tags=["Workflows"])
+def submit_workflow(
+    workflow: WorkflowSubmissionRequest,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Envía un workflow (DAG de trabajos) en una sola petición
+    
+    Los pasos se envían en orden topológico con dependencias afterok;
+    devuelve el job id asignado a cada paso.
+    """
+    try:
+        script_paths = [resolve_user_script(file_manager, current_user.user_id, step.script_path)
+                        for step in workflow.steps]
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    steps = [
+        WorkflowStep(
+            step_id=step.step_id,
+            config=JobConfig(
+                name=step.name,
+                script_path=script_path,
+                cpus=step.cpus,
+                memory=step.memory,
+                walltime=step.walltime,
+                partition=step.partition,
+                gpu=step.gpu,
+                user_id=current_user.user_id
+            ),
+            depends_on=step.depends_on,
+            array_size=step.array_size
+        )
+        for step, script_path in zip(workflow.steps, script_paths)
+    ]
+    
+    result = job_manager.submit_workflow(workflow.name, steps, current_user.user_id)
+    if result["status"] != "success":
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/api/workflows/{workflow_id}", tags=["Workflows"])
+def get_workflow_status(
+    workflow_id: str,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
+):
+    """
+    Estado del workflow como unidad y de cada uno de sus pasos
+    """
+    result = job_manager.get_workflow_status(workflow_id, current_user.user_id)
+    if result["status"] != "success":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
+
 @app.get("/api/files", tags=["Files"])
-async def list_files(
+def list_files(
+    request: Request,
     path: str = "/",
-    current_user: UserInfo = Depends(get_current_user)
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
 ):
     """
     Lista archivos en el directorio del usuario
+    (en NDJSON los elementos salen en orden de directorio, sin ordenar)
     """
-    # TEMPLATE: file_manager = UserFileManager()
-    # files = file_manager.list_directory(current_user.user_id, path)
-    
-    # Datos simulados para template
-    return [
-        {
-            "name": "analysis.py",
-            "type": "file",
-            "size": 2048,
-            "modified": "2024-01-15T14:30:00",
-            "extension": "py"
-        },
-        {
-            "name": "data",
-            "type": "directory", 
-            "size": 0,
-            "modified": "2024-01-14T10:00:00",
-            "items": 12
-        }
-    ]
+    user_id = current_user.user_id
+    ndjson = wants_ndjson(request)
+    
+    try:
+        # Un solo recorrido da el validador y, si no hay 304, el cuerpo
+        # (el mtime del directorio no cubre archivos que crecen en su sitio)
+        listing = file_manager.directory_listing(user_id, path)
+        
+        def build(headers):
+            if listing is None:
+                return list_response(request, [], headers=headers)
+            return list_response(request, listing.iter_files() if ndjson else listing.files(), headers=headers)
+        
+        if listing is None:
+            return build({})
+        
+        etag = make_etag("files", user_id, path, listing.validator, ndjson)
+        return conditional_response(request, etag, None, build)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/files/events", tags=["Files"])
+async def watch_files(
+    request: Request,
+    path: str = "/",
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Eventos created/modified/deleted de un directorio (Server-Sent Events)
+    
+    Un evento "overflow" indica que se perdieron eventos: volver a listar.
+    """
+    try:
+        subscription = await asyncio.to_thread(
+            file_watcher.subscribe, current_user.user_id, path, asyncio.get_running_loop()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            yield b"event: ready\ndata: " + dumps({"path": subscription.watch.relative_path}) + b"\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/files/search", tags=["Files"])
+def search_file(
+    path: str,
+    pattern: str,
+    ignore_case: bool = False,
+    literal: bool = False,
+    context: int = 2,
+    max_matches: int = 1000,
+    max_bytes: Optional[int] = None,
+    offset: int = 0,
+    line: int = 1,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Busca una expresión regular en un archivo de texto del usuario (NDJSON)
+    """
+    try:
+        target = file_manager.resolve_path(current_user.user_id, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not target.is_file():
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    return search_response(target, pattern, ignore_case, literal, context, max_matches, max_bytes, offset, line)
+
+
+@app.get("/api/files/preview", tags=["Files"])
+def preview_file(
+    request: Request,
+    path: str,
+    max_lines: int = 100,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Vista previa del contenido de un archivo
+    """
+    user_id = current_user.user_id
+    
+    try:
+        file_stat = file_manager.stat_path(user_id, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if file_stat is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    
+    def build(headers):
+        result = file_manager.preview_file(user_id, path, max_lines)
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+        return FastJSONResponse(result, headers=headers)
+    
+    # Validador: (tamaño, mtime) del archivo
+    etag = make_etag("preview", user_id, path, file_stat.st_ino,
+                     file_stat.st_size, file_stat.st_mtime_ns, max_lines)
+    return conditional_response(request, etag, file_stat.st_mtime, build)
+
+
+@app.get("/api/files/thumbnail", tags=["Files"])
+def get_thumbnail(
+    request: Request,
+    path: str,
+    size: int = DEFAULT_THUMBNAIL_SIZE,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Miniatura PNG de una imagen o PDF
+    
+    Si aún no está renderizada encola el render y responde 202 con
+    {"status": "pending"} y Retry-After; reintentar devuelve el PNG.
+    """
+    try:
+        target = file_manager.resolve_path(current_user.user_id, path)
+        file_stat = target.stat()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    
+    result = thumbnail_service.request(target, size, file_stat)
+    status_name = result["status"]
+    if status_name == "pending":
+        return FastJSONResponse({"status": "pending"}, status_code=202, headers={"Retry-After": "1"})
+    if status_name == "unsupported":
+        raise HTTPException(status_code=415, detail=result["message"])
+    if status_name == "error":
+        raise HTTPException(status_code=422, detail=result["message"])
+    
+    # La clave de caché ya identifica (path, tamaño, mtime, lado)
+    return conditional_response(
+        request, f'"{result["key"]}"', file_stat.st_mtime,
+        lambda headers: FileResponse(result["file"], media_type="image/png", headers=headers)
+    )
 
 
 @app.post("/api/files/upload", tags=["Files"])
@@ -343,95 +1137,457 @@ async def upload_file(
         )
 
 
+@app.get("/api/files/signature", tags=["Files"])
+def get_file_signature(
+    request: Request,
+    path: str,
+    block_size: Optional[int] = None,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Firma de bloques (checksum rodante + hash fuerte) del archivo actual,
+    en el formato binario de delta_sync, para calcular un delta en el cliente
+    """
+    if block_size is not None and not MIN_DELTA_BLOCK_SIZE <= block_size <= MAX_DELTA_BLOCK_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"block_size debe estar entre {MIN_DELTA_BLOCK_SIZE} y {MAX_DELTA_BLOCK_SIZE}"
+        )
+    try:
+        file_stat = file_manager.stat_path(current_user.user_id, path)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if file_stat is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    
+    def build(headers):
+        result = file_manager.get_file_signature(current_user.user_id, path, block_size)
+        if result["status"] != "success":
+            raise HTTPException(status_code=404, detail=result["message"])
+        return Response(content=result["signature"], media_type="application/octet-stream", headers=headers)
+    
+    etag = make_etag("signature", path, file_stat.st_size, file_stat.st_mtime_ns, block_size)
+    return conditional_response(request, etag, file_stat.st_mtime, build)
+
+
+@app.post("/api/files/delta", tags=["Files"])
+def apply_file_delta(
+    path: str,
+    delta: UploadFile = File(...),
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Aplica un delta (bloques de la firma + datos literales) y reemplaza el
+    archivo de forma atómica. 409 si el archivo cambió desde la firma.
+    """
+    result = file_manager.apply_file_delta(current_user.user_id, path, delta.file)
+    if result["status"] != "success":
+        status_code = 409 if result.get("conflict") else 400
+        raise HTTPException(status_code=status_code, detail=result["message"])
+    return result
+
+
+@app.delete("/api/files", tags=["Files"])
+def delete_file(
+    path: str,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Elimina un archivo o directorio (inmediato: se mueve a la papelera y se
+    borra en segundo plano)
+    """
+    result = file_manager.delete_file(current_user.user_id, path)
+    if result["status"] != "success":
+        status_code = 404 if result["message"] == "Archivo no encontrado" else 400
+        raise HTTPException(status_code=status_code, detail=result["message"])
+    return result
+
+
+@app.get("/api/files/trash", tags=["Files"])
+def list_trash(
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Borrados pendientes o en curso con su progreso
+    """
+    return {
+        "entries": file_manager.list_trash(current_user.user_id),
+        "usage": file_manager.trash.usage(current_user.user_id)
+    }
+
+
+@app.post("/api/files/trash/{trash_id}/restore", tags=["Files"])
+def restore_file(
+    trash_id: str,
+    current_user: UserInfo = Depends(get_current_user),
+    file_manager: UserFileManager = Depends(get_file_manager)
+):
+    """
+    Deshace un borrado dentro de la ventana de deshacer
+    """
+    result = file_manager.restore_file(current_user.user_id, trash_id)
+    if result["status"] != "success":
+        raise HTTPException(status_code=409, detail=result["message"])
+    return result
+
+
 @app.get("/api/system/resources", response_model=SystemResourcesResponse, tags=["System"])
-async def get_system_resources(current_user: UserInfo = Depends(get_current_user)):
+def get_system_resources(
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
+):
     """
-    Obtiene el estado de recursos del sistema
+    Obtiene el estado de recursos del sistema a partir de los snapshots
+    de nodos y cola
     """
-    # TEMPLATE: Consultar sinfo, squeue, etc.
+    nodes = snapshot_store.get("nodes")
+    if nodes is None:
+        nodes = job_manager.get_node_status()
+    jobs = snapshot_store.get("jobs")
+    if jobs is None:
+        jobs = job_manager.get_queue_status()
+    
+    def percent(used: int, total: int) -> float:
+        return round(100.0 * used / total, 1) if total else 0.0
     
     return SystemResourcesResponse(
-        cpu_usage=78.5,
-        memory_usage=65.2,
-        gpu_usage=45.0,
-        active_jobs=12,
-        queued_jobs=8,
-        available_nodes=24
+        cpu_usage=percent(sum(n.cpus_alloc for n in nodes), sum(n.cpus_total for n in nodes)),
+        memory_usage=percent(sum(n.memory_alloc_mb for n in nodes), sum(n.memory_total_mb for n in nodes)),
+        gpu_usage=percent(sum(n.gpus_alloc for n in nodes), sum(n.gpus_total for n in nodes)),
+        active_jobs=sum(1 for j in jobs if j.status == "running"),
+        queued_jobs=sum(1 for j in jobs if j.status == "queued"),
+        available_nodes=sum(1 for n in nodes if n.state in ("idle", "mixed"))
     )
 
 
+@app.get("/api/system/telemetry", tags=["System"])
+def get_node_telemetry(
+    node: Optional[str] = None,
+    metrics: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    resolution: str = "auto",
+    max_points: Optional[int] = None,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Series temporales por nodo (epoch en segundos; por defecto últimas 24h)
+    
+    metrics: lista separada por comas de cpu_load, cpu_alloc, memory_alloc, gpu_alloc
+    resolution: auto, raw, 1m o 10m
+    """
+    end = time.time() if end is None else end
+    start = end - 24 * 3600 if start is None else start
+    metric_names = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else list(TELEMETRY_METRICS)
+    node_names = [node] if node else telemetry_store.nodes()
+    
+    series = []
+    try:
+        for name in node_names:
+            result = telemetry_store.query(name, start, end, metric_names, resolution, max_points)
+            if result is not None:
+                series.append(result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if node and not series:
+        raise HTTPException(status_code=404, detail=f"Sin telemetría para el nodo {node}")
+    
+    return {"start": start, "end": end, "nodes": series}
+
+
 @app.get("/api/history", tags=["History"])
-async def get_job_history(
+def get_job_history(
+    request: Request,
     days: int = 30,
     status_filter: Optional[str] = None,
-    current_user: UserInfo = Depends(get_current_user)
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
 ):
     """
     Obtiene el historial de trabajos del usuario
+    (Accept: application/x-ndjson para recibirlo en streaming)
     """
-    # TEMPLATE: job_manager.get_job_history(current_user.user_id, days)
-    
-    # Datos simulados
-    return [
-        {
-            "id": "job_hist_001",
-            "name": "Análisis RNA-Seq completado",
-            "status": "completed",
-            "submit_time": "2024-01-15T14:30:00",
-            "duration": "1h 45m",
-            "cpus": 8,
-            "memory": "16GB",
-            "exit_code": 0
-        }
-    ]
+    ndjson = wants_ndjson(request)
+    
+    def build(headers):
+        # JSON: consulta coalescida entre peticiones idénticas; NDJSON: streaming
+        if ndjson:
+            jobs = job_manager.iter_job_history(current_user.user_id, days)
+        else:
+            jobs = job_manager.get_job_history(current_user.user_id, days)
+        
+        if status_filter:
+            jobs = (job for job in jobs if job.status == status_filter)
+        
+        return list_response(request, jobs, headers=headers)
+    
+    # El historial solo cambia cuando cambia la cola (generación del snapshot)
+    # o cuando la ventana de días avanza
+    snapshot = snapshot_store.get_with_generation("jobs")
+    if snapshot is None:
+        return build({})
+    
+    etag = make_etag("history", snapshot[0], current_user.user_id, days,
+                     status_filter, date.today(), ndjson)
+    return conditional_response(request, etag, None, build)
+
+
+@app.get("/api/history/efficiency", tags=["History"])
+def get_efficiency_report(
+    days: int = 30,
+    group_by: str = "user,partition,name",
+    user: Optional[str] = None,
+    all_users: bool = False,
+    limit: int = 20,
+    current_user: UserInfo = Depends(get_current_user),
+    job_manager: SlurmJobManager = Depends(get_job_manager)
+):
+    """
+    Informe de eficiencia tipo seff (CPU, memoria, walltime) de todos los
+    trabajos de la ventana, con agregados por usuario, partición y nombre
+    
+    user / all_users: solo administradores
+    """
+    if (user is not None and user != current_user.user_id) or all_users:
+        if current_user.role != "admin":
+            raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+    target = None if all_users else (user or current_user.user_id)
+    
+    keys = tuple(key.strip() for key in group_by.split(",") if key.strip())
+    try:
+        return job_manager.get_efficiency_report(target, days, keys, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=f"Error consultando sacct: {str(e)}")
 
 
 @app.get("/api/templates", tags=["Templates"])
-async def get_job_templates(current_user: UserInfo = Depends(get_current_user)):
+async def get_job_templates(
+    request: Request,
+    current_user: UserInfo = Depends(get_current_user)
+):
     """
     Obtiene las plantillas de trabajo del usuario
     """
     # TEMPLATE: Consultar base de datos de plantillas
+    # (el ETag saldría de la versión de las plantillas del usuario)
     
-    return [
-        {
-            "id": "template_001",
-            "name": "Análisis Genómico Estándar",
-            "cpus": 8,
-            "memory": "16GB",
-            "partition": "general",
-            "walltime": "04:00:00"
-        },
-        {
-            "id": "template_002", 
-            "name": "Deep Learning GPU",
-            "cpus": 12,
-            "memory": "32GB",
-            "partition": "gpu",
-            "gpu": 2,
-            "walltime": "08:00:00"
-        }
-    ]
+    return conditional_response(
+        request, JOB_TEMPLATES_ETAG, None,
+        lambda headers: FastJSONResponse(JOB_TEMPLATES, headers=headers)
+    )
+
+
+@app.post("/api/auth/logout", tags=["Auth"])
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Revoca el token actual en todos los workers hasta su expiración
+    """
+    revoke_token(credentials.credentials)
+    return {"status": "success", "message": "Sesión cerrada"}
+
+
+@app.post("/api/admin/users/{user_id}/revoke", tags=["Admin"])
+async def revoke_user(user_id: str, admin: UserInfo = Depends(require_admin)):
+    """
+    Revoca las sesiones de un usuario (cambio de rol, baja...): se
+    rechazan los tokens emitidos antes de este momento
+    """
+    revoked = revoke_user_sessions(user_id)
+    return {
+        "status": "success",
+        "message": f"Sesiones de {user_id} revocadas",
+        "revoked_tokens": revoked
+    }
+
+
+@app.get("/api/admin/singleflight", tags=["Admin"])
+async def get_singleflight_stats(admin: UserInfo = Depends(require_admin)):
+    """
+    Estadísticas de coalescencia de llamadas idénticas por operación
+    """
+    return singleflight_group.stats()
+
+
+@app.get("/api/admin/file-watches", tags=["Admin"])
+async def get_file_watch_stats(admin: UserInfo = Depends(require_admin)):
+    """
+    Directorios vigilados, suscriptores y backend (inotify o sondeo)
+    """
+    return file_watcher.stats()
+
+
+@app.post("/api/tasks", tags=["Tasks"], status_code=status.HTTP_202_ACCEPTED)
+def submit_task(
+    task_request: TaskSubmissionRequest,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Encola una operación pesada y devuelve la tarea para consultarla en
+    /api/tasks/{task_id}; una idéntica ya pendiente se devuelve tal cual
+    """
+    spec = task_queue.spec(task_request.name)
+    if spec is None or spec.prepare is None:
+        raise HTTPException(status_code=404, detail=f"Tarea desconocida: {task_request.name}")
+    if (spec.admin_only or task_request.priority > 0) and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+    
+    try:
+        args = spec.prepare(current_user.user_id, task_request.args)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return task_queue.submit(spec.name, args, current_user.user_id, task_request.priority)
+
+
+@app.get("/api/tasks", tags=["Tasks"])
+def list_tasks(
+    state: Optional[str] = None,
+    limit: int = 100,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Tareas del usuario, las más recientes primero
+    """
+    return {"tasks": task_queue.list(current_user.user_id, state, max(1, min(limit, 1000)))}
+
+
+@app.get("/api/tasks/{task_id}", tags=["Tasks"])
+def get_task(
+    task_id: str,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Estado, progreso (0-1), intentos y resultado de una tarea
+    """
+    task = task_queue.get(task_id, current_user.user_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return task
+
+
+@app.delete("/api/tasks/{task_id}", tags=["Tasks"])
+def cancel_task(
+    task_id: str,
+    current_user: UserInfo = Depends(get_current_user)
+):
+    """
+    Cancela una tarea pendiente; una en ejecución se detiene en su
+    siguiente aviso de progreso
+    """
+    task = task_queue.cancel(task_id, current_user.user_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return task
+
+
+@app.get("/api/admin/staging", tags=["Admin"])
+def get_staging_stats(admin: UserInfo = Depends(require_admin)):
+    """
+    Ocupación del tier de staging, stagings por estado y bytes copiados,
+    deduplicados y expulsados
+    """
+    return data_stager.stats()
+
+
+@app.get("/api/admin/tasks", tags=["Admin"])
+def get_task_stats(admin: UserInfo = Depends(require_admin)):
+    """
+    Tareas por carril y estado, workers y tipos registrados
+    """
+    return task_queue.stats()
+
+
+@app.get("/api/admin/slow-requests", tags=["Admin"])
+async def get_slow_requests(
+    limit: int = 50,
+    include_samples: bool = False,
+    admin: UserInfo = Depends(require_admin)
+):
+    """
+    Peticiones que superaron el umbral de lentitud (más recientes primero)
+    """
+    entries = list(profile_store.slow_requests)[-limit:][::-1]
+    if not include_samples:
+        entries = [{k: v for k, v in e.items() if k != "folded"} for e in entries]
+    return {
+        "threshold_ms": SLOW_REQUEST_THRESHOLD_MS,
+        "requests": entries
+    }
+
+
+@app.get("/api/admin/profiles", tags=["Admin"])
+async def list_profiles(admin: UserInfo = Depends(require_admin)):
+    """
+    Perfiles bajo demanda almacenados
+    """
+    return profile_store.list_profiles()
+
+
+@app.get("/api/admin/profiles/{profile_id}", tags=["Admin"])
+async def get_profile(
+    profile_id: int,
+    raw: bool = False,
+    admin: UserInfo = Depends(require_admin)
+):
+    """
+    Obtiene un perfil; con raw=true devuelve el texto folded/pstats directamente
+    """
+    profile = profile_store.get_profile(profile_id)
+    if profile is None or "output" not in profile:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    if raw:
+        return Response(content=profile["output"], media_type="text/plain")
+    return profile
 
 
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return {
-        "error": {
-            "code": exc.status_code,
-            "message": exc.detail,
-            "timestamp": datetime.now().isoformat()
-        }
-    }
+    return FastJSONResponse(
+        status_code=exc.status_code,
+        content={
+            "error": {
+                "code": exc.status_code,
+                "message": exc.detail,
+                "timestamp": datetime.now().isoformat()
+            }
+        },
+        headers=getattr(exc, "headers", None)
+    )
 
 
 if __name__ == "__main__":
-    # Configuración para desarrollo
-    uvicorn.run(
-        "fastapi_main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    workers = int(os.environ.get("ATROX_WORKERS", "1"))
+    
+    if workers > 1:
+        # Producción: N workers con snapshots de Slurm compartidos
+        # y métricas Prometheus agregadas entre procesos
+        os.environ.setdefault("ATROX_SHARED_STATE", "shm")
+        multiproc_dir = os.environ.setdefault(
+            "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "atrox_prometheus")
+        )
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+        
+        uvicorn.run(
+            "fastapi_main:app",
+            host="0.0.0.0",
+            port=int(os.environ.get("ATROX_PORT", "8000")),
+            workers=workers,
+            log_level="info"
+        )
+    else:
+        # Configuración para desarrollo
+        uvicorn.run(
+            "fastapi_main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -17,10 +17,18 @@ import os
 import shutil
 import mimetypes
 from pathlib import Path
-from typing import Dict, List, Optional, BinaryIO
+from typing import Dict, Iterator, List, Optional, BinaryIO
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
+import itertools
+import tarfile
+
+from delta_sync import TEMP_PREFIX as DELTA_TEMP_PREFIX, DeltaConflict, SignatureCache, apply_delta
+from metrics import cache_counters, record_file_bytes
+from singleflight import coalesced
+from thumbnails import PDF_EXTENSIONS, THUMBNAIL_EXTENSIONS
+from trash import SIBLING_PREFIX, TrashManager
 
 
 @dataclass
@@ -37,12 +45,136 @@ class FileInfo:
     mime_type: Optional[str] = None
 
 
+def hash_file(path: str, progress=None, chunk_size: int = 1024 * 1024) -> Dict:
+    """
+    SHA256 de un archivo; función de módulo para poder ejecutarse en el
+    carril de procesos de la cola de tareas
+    """
+    total = os.path.getsize(path)
+    sha256_hash = hashlib.sha256()
+    done = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256_hash.update(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+    return {"hash": sha256_hash.hexdigest(), "size": total}
+
+
+def build_archive(source: str, dest: str, progress=None) -> Dict:
+    """
+    Comprime un archivo o directorio en un tar.gz; se escribe aparte y se
+    renombra al final para no dejar archivos a medias
+    """
+    files = []
+    if os.path.isdir(source):
+        for root, dirs, names in os.walk(source):
+            dirs[:] = [d for d in dirs if not d.startswith(SIBLING_PREFIX)]
+            files.extend(os.path.join(root, name) for name in names
+                         if not name.startswith((SIBLING_PREFIX, DELTA_TEMP_PREFIX)))
+    else:
+        files.append(source)
+
+    sizes = {}
+    for file in files:
+        try:
+            sizes[file] = os.path.getsize(file)
+        except OSError:
+            continue
+    total = sum(sizes.values())
+    base = os.path.dirname(source.rstrip(os.sep))
+    partial = f"{dest}.partial"
+    done = 0
+    try:
+        with tarfile.open(partial, "w:gz") as tar:
+            for file, size in sizes.items():
+                tar.add(file, arcname=os.path.relpath(file, base), recursive=False)
+                done += size
+                if progress is not None:
+                    progress(done, total, os.path.basename(file))
+        os.replace(partial, dest)
+    except BaseException:
+        try:
+            os.unlink(partial)
+        except OSError:
+            pass
+        raise
+    return {"files": len(sizes), "input_size": total, "size": os.path.getsize(dest)}
+
+
+def _entry_rows(target_path: Path) -> Iterator[tuple]:
+    """(nombre, modo, tamaño, mtime_ns, mtime, es_directorio, es_archivo) de cada entrada"""
+    with os.scandir(target_path) as entries:
+        for entry in entries:
+            if entry.name.startswith((SIBLING_PREFIX, DELTA_TEMP_PREFIX)):
+                continue  # en espera del reaper o reconstrucción delta en curso
+            try:
+                stat = entry.stat()
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+            except (OSError, PermissionError):
+                continue  # Saltar archivos inaccesibles
+            yield entry.name, stat.st_mode, stat.st_size, stat.st_mtime_ns, stat.st_mtime, is_dir, is_file
+
+
+def _file_info(row: tuple, relative_dir: Path, owner: str) -> FileInfo:
+    name, mode, size, _mtime_ns, mtime, is_dir, is_file = row
+    return FileInfo(
+        name=name,
+        path=str(relative_dir / name),
+        type='directory' if is_dir else 'file',
+        size=size if is_file else 0,
+        modified=datetime.fromtimestamp(mtime),
+        permissions=oct(mode)[-3:],
+        owner=owner,
+        extension=os.path.splitext(name)[1] if is_file else None,
+        mime_type=mimetypes.guess_type(name)[0] if is_file else None
+    )
+
+
+class DirectoryListing:
+    """
+    Un recorrido de un directorio.
+    
+    El validador (ETag) sale de nombre, modo, tamaño y mtime de cada
+    entrada: cambia cuando un archivo crece en su sitio (el mtime del
+    directorio no) y es el mismo en todos los workers. Los FileInfo solo
+    se construyen si se piden (un 304 no los necesita).
+    """
+    
+    def __init__(self, rows: List[tuple], relative_dir: Path, owner: str):
+        self._rows = rows
+        self._relative_dir = relative_dir
+        self._owner = owner
+        self._files: Optional[List[FileInfo]] = None
+        
+        digest = hashlib.blake2b(digest_size=16)
+        for name, mode, size, mtime_ns, _mtime, _is_dir, _is_file in sorted(rows):
+            digest.update(f"{name}\0{mode}\0{size}\0{mtime_ns}\0".encode("utf-8", "surrogateescape"))
+        self.validator = digest.hexdigest()
+    
+    def iter_files(self) -> Iterator[FileInfo]:
+        """FileInfo en orden de directorio (streaming)"""
+        for row in self._rows:
+            yield _file_info(row, self._relative_dir, self._owner)
+    
+    def files(self) -> List[FileInfo]:
+        """FileInfo ordenados (directorios primero), construidos una sola vez"""
+        if self._files is None:
+            files = list(self.iter_files())
+            files.sort(key=lambda x: (x.type == 'file', x.name.lower()))
+            self._files = files
+        return self._files
+
+
 class UserFileManager:
     """
     Gestor de archivos para usuarios de AtrozGetaway
     """
     
-    def __init__(self, base_dir: str = "/home/leoatrox/users"):
+    def __init__(self, base_dir: str = "/home/leoatrox/users",
+                 trash_undo_seconds: float = 0.0, trash_unlink_rate: float = 5000.0):
         self.base_dir = Path(base_dir)
         self.allowed_extensions = {
             'scripts': {'.py', '.sh', '.r', '.m', '.cpp', '.c', '.f90', '.f'},
@@ -51,6 +183,21 @@ class UserFileManager:
             'results': {'.png', '.jpg', '.jpeg', '.pdf', '.svg', '.html', '.log'}
         }
         self.max_file_size = 100 * 1024 * 1024  # 100MB por defecto
+        
+        # Listados cacheados de los directorios vigilados (file_watcher)
+        self._listing_cache: Dict[Path, DirectoryListing] = {}
+        self._listing_versions: Dict[Path, int] = {}
+        # Versiones crecientes en todo el proceso: un directorio que deja de
+        # vigilarse y vuelve no repite versión
+        self._version_clock = itertools.count(1)
+        self._listing_hits, self._listing_misses = cache_counters("directory_listings")
+        
+        # Borrados: rename a la papelera y reclamación en segundo plano
+        self.trash = TrashManager(self.base_dir / ".trash",
+                                  undo_seconds=trash_undo_seconds, unlink_rate=trash_unlink_rate)
+        
+        # Firmas de bloques para la sincronización delta, por (ruta, tamaño, mtime)
+        self.signatures = SignatureCache()
     
     def get_user_directory(self, user_id: str) -> Path:
         """Obtiene el directorio base del usuario"""
@@ -67,43 +214,68 @@ class UserFileManager:
         """
         Lista el contenido de un directorio del usuario
         """
+        listing = self.directory_listing(user_id, path)
+        return listing.files() if listing is not None else []
+    
+    @coalesced("directory_listing")
+    def directory_listing(self, user_id: str, path: str = "/") -> Optional[DirectoryListing]:
+        """
+        Un recorrido del directorio con su validador, o None si no es un
+        directorio. Los directorios vigilados se sirven de caché hasta el
+        siguiente evento.
+        """
         try:
+            # Validar antes de consultar la caché: las claves son rutas
+            # resueltas y podrían ser de otro usuario
             user_dir = self.get_user_directory(user_id)
-            target_path = user_dir / path.lstrip('/')
+            target = self.resolve_path(user_id, path).resolve()
             
-            # Validar que el path esté dentro del directorio del usuario
-            if not self._is_safe_path(user_dir, target_path):
-                raise ValueError("Acceso denegado: path fuera del directorio del usuario")
+            version = self._listing_versions.get(target)
+            if version is not None:
+                cached = self._listing_cache.get(target)
+                if cached is not None:
+                    self._listing_hits.inc()
+                    return cached
+                self._listing_misses.inc()
             
-            files = []
+            if not target.is_dir():
+                return None
+            listing = DirectoryListing(list(_entry_rows(target)), target.relative_to(user_dir.resolve()), user_id)
             
-            if target_path.exists() and target_path.is_dir():
-                for item in target_path.iterdir():
-                    try:
-                        stat = item.stat()
-                        
-                        file_info = FileInfo(
-                            name=item.name,
-                            path=str(item.relative_to(user_dir)),
-                            type='directory' if item.is_dir() else 'file',
-                            size=stat.st_size if item.is_file() else 0,
-                            modified=datetime.fromtimestamp(stat.st_mtime),
-                            permissions=oct(stat.st_mode)[-3:],
-                            owner=user_id,
-                            extension=item.suffix if item.is_file() else None,
-                            mime_type=mimetypes.guess_type(str(item))[0] if item.is_file() else None
-                        )
-                        
-                        files.append(file_info)
-                        
-                    except (OSError, PermissionError):
-                        continue  # Saltar archivos inaccesibles
-            
-            return sorted(files, key=lambda x: (x.type == 'file', x.name.lower()))
+            # Solo se guarda si no hubo invalidación durante el recorrido
+            if version is not None and self._listing_versions.get(target) == version:
+                self._listing_cache[target] = listing
+            return listing
             
         except Exception as e:
             raise ValueError(f"Error listando directorio: {str(e)}")
     
+    def iter_directory(self, user_id: str, path: str = "/") -> Iterator[FileInfo]:
+        """
+        Itera el contenido de un directorio sin ordenar (streaming)
+        
+        Usa os.scandir: el tipo de entrada sale del propio directorio y
+        solo se hace un stat por elemento.
+        """
+        user_dir = self.get_user_directory(user_id)
+        target_path = user_dir / path.lstrip('/')
+        
+        # Validar que el path esté dentro del directorio del usuario
+        if not self._is_safe_path(user_dir, target_path):
+            raise ValueError("Acceso denegado: path fuera del directorio del usuario")
+        
+        # Validación inmediata; el recorrido es perezoso
+        return self._scan_directory(user_dir, target_path, user_id)
+    
+    def _scan_directory(self, user_dir: Path, target_path: Path, user_id: str) -> Iterator[FileInfo]:
+        """Generador de FileInfo para las entradas de un directorio"""
+        if not target_path.is_dir():
+            return
+        
+        relative_dir = target_path.resolve().relative_to(user_dir.resolve())
+        for row in _entry_rows(target_path):
+            yield _file_info(row, relative_dir, user_id)
+    
     def upload_file(self, user_id: str, file_data: BinaryIO, 
                    filename: str, destination_path: str = "/") -> Dict:
         """
@@ -136,6 +308,9 @@ class UserFileManager:
             with open(dest_file, 'wb') as f:
                 shutil.copyfileobj(file_data, f)
             
+            record_file_bytes("upload", file_size)
+            self.invalidate_directory(dest_dir.resolve())
+            
             # Calcular hash para verificación
             file_hash = self._calculate_file_hash(dest_file)
             
@@ -150,6 +325,60 @@ class UserFileManager:
         except Exception as e:
             return {"status": "error", "message": f"Error subiendo archivo: {str(e)}"}
     
+    def get_file_signature(self, user_id: str, file_path: str, block_size: Optional[int] = None) -> Dict:
+        """
+        Firma de bloques de un archivo para la sincronización delta
+        (cacheada mientras no cambien tamaño ni mtime)
+        """
+        try:
+            target_file = self.resolve_path(user_id, file_path)
+            if not target_file.is_file():
+                return {"status": "error", "message": "Archivo no encontrado"}
+            
+            signature, stat, block_size = self.signatures.get(target_file, block_size)
+            return {
+                "status": "success",
+                "signature": signature,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "block_size": block_size
+            }
+            
+        except Exception as e:
+            return {"status": "error", "message": f"Error calculando firma: {str(e)}"}
+    
+    def apply_file_delta(self, user_id: str, file_path: str, delta: BinaryIO) -> Dict:
+        """
+        Reconstruye un archivo a partir de un delta sobre su firma y lo
+        reemplaza con un rename atómico
+        """
+        try:
+            target_file = self.resolve_path(user_id, file_path)
+            if not target_file.is_file():
+                return {"status": "error", "message": "Archivo no encontrado"}
+            
+            if not self._is_allowed_file(target_file.name):
+                return {"status": "error", "message": "Tipo de archivo no permitido"}
+            
+            # El límite de subida se aplica a los datos nuevos transferidos
+            result = apply_delta(target_file, delta, max_literal_bytes=self.max_file_size)
+            
+            record_file_bytes("upload", result["literal_bytes"])
+            self.invalidate_directory(target_file.parent.resolve())
+            
+            user_dir = self.get_user_directory(user_id)
+            return {
+                "status": "success",
+                "message": "Archivo sincronizado exitosamente",
+                "path": str(target_file.relative_to(user_dir)),
+                **result
+            }
+            
+        except DeltaConflict as e:
+            return {"status": "error", "conflict": True, "message": str(e)}
+        except Exception as e:
+            return {"status": "error", "message": f"Error aplicando delta: {str(e)}"}
+    
     def download_file(self, user_id: str, file_path: str) -> Dict:
         """
         Prepara un archivo para descarga
@@ -164,10 +393,13 @@ class UserFileManager:
             if not target_file.exists() or not target_file.is_file():
                 return {"status": "error", "message": "Archivo no encontrado"}
             
+            file_size = target_file.stat().st_size
+            record_file_bytes("download", file_size)
+            
             return {
                 "status": "success",
                 "file_path": str(target_file),
-                "size": target_file.stat().st_size,
+                "size": file_size,
                 "mime_type": mimetypes.guess_type(str(target_file))[0],
                 "filename": target_file.name
             }
@@ -178,30 +410,63 @@ class UserFileManager:
     def delete_file(self, user_id: str, file_path: str) -> Dict:
         """
         Elimina un archivo o directorio
+        
+        El path se mueve a la papelera del usuario (rename atómico) y el
+        borrado real lo hace el reaper en segundo plano; durante la ventana
+        de deshacer se puede restaurar con restore_file.
         """
         try:
             user_dir = self.get_user_directory(user_id)
-            target_path = user_dir / file_path.lstrip('/')
+            target_path = user_dir / os.path.normpath(file_path.lstrip('/') or '.')
+            
+            # Sin resolver el último componente: si es un enlace simbólico se
+            # borra (y se restaura) el enlace, no su destino
+            link_path = target_path.parent.resolve() / target_path.name
+            
+            if target_path.name == '..' or not self._is_safe_path(user_dir, link_path.parent):
+                return {"status": "error", "message": "Acceso denegado"}
             
-            if not self._is_safe_path(user_dir, target_path):
+            # No se puede borrar el propio directorio del usuario
+            if link_path == user_dir.resolve():
                 return {"status": "error", "message": "Acceso denegado"}
             
-            if not target_path.exists():
+            if not os.path.lexists(link_path):
                 return {"status": "error", "message": "Archivo no encontrado"}
             
-            if target_path.is_dir():
-                shutil.rmtree(target_path)
-            else:
-                target_path.unlink()
+            relative_path = str(link_path.relative_to(user_dir.resolve()))
+            entry = self.trash.move_to_trash(user_id, link_path, relative_path)
+            self.invalidate_directory(link_path.parent)
             
-            return {
+            result = {
                 "status": "success",
-                "message": f"{'Directorio' if target_path.is_dir() else 'Archivo'} eliminado exitosamente"
+                "message": f"{'Directorio' if entry['is_dir'] else 'Archivo'} eliminado exitosamente",
+                "trash_id": entry["id"]
             }
+            if self.trash.undo_seconds > 0:
+                result["undo_until"] = datetime.fromtimestamp(entry["purge_after"])
+            return result
             
         except Exception as e:
             return {"status": "error", "message": f"Error eliminando: {str(e)}"}
     
+    def restore_file(self, user_id: str, trash_id: str) -> Dict:
+        """
+        Deshace un borrado mientras siga en la ventana de deshacer
+        """
+        try:
+            result = self.trash.restore(user_id, trash_id)
+            if result["status"] == "success":
+                self.invalidate_directory((self.get_user_directory(user_id) / result["path"]).parent.resolve())
+            return result
+        except Exception as e:
+            return {"status": "error", "message": f"Error restaurando: {str(e)}"}
+    
+    def list_trash(self, user_id: str) -> List[Dict]:
+        """
+        Entradas de la papelera del usuario con su progreso de borrado
+        """
+        return [TrashManager.public(entry) for entry in self.trash.list_entries(user_id)]
+    
     def create_directory(self, user_id: str, dir_path: str) -> Dict:
         """
         Crea un nuevo directorio
@@ -214,6 +479,7 @@ class UserFileManager:
                 return {"status": "error", "message": "Path inválido"}
             
             target_dir.mkdir(parents=True, exist_ok=False)
+            self.invalidate_directory(target_dir.parent.resolve())
             
             return {
                 "status": "success",
@@ -226,6 +492,7 @@ class UserFileManager:
         except Exception as e:
             return {"status": "error", "message": f"Error creando directorio: {str(e)}"}
     
+    @coalesced("preview_file")
     def preview_file(self, user_id: str, file_path: str, max_lines: int = 100) -> Dict:
         """
         Genera una vista previa del contenido de un archivo
@@ -262,6 +529,7 @@ class UserFileManager:
                             break
                         lines.append(line.rstrip())
                     
+                    record_file_bytes("preview", f.buffer.tell())
                     preview_data.update({
                         "type": "text",
                         "content": lines,
@@ -282,6 +550,7 @@ class UserFileManager:
                             break
                         rows.append(row)
                     
+                    record_file_bytes("preview", f.buffer.tell())
                     preview_data.update({
                         "type": "csv",
                         "headers": rows[0] if rows else [],
@@ -302,6 +571,14 @@ class UserFileManager:
                     except json.JSONDecodeError:
                         preview_data["type"] = "text"
                         preview_data["content"] = f.read(5000)
+                    record_file_bytes("preview", f.buffer.tell())
+            
+            # Imágenes y PDFs: la vista previa es la miniatura (/api/files/thumbnail)
+            elif target_file.suffix.lower() in THUMBNAIL_EXTENSIONS:
+                preview_data.update({
+                    "type": "pdf" if target_file.suffix.lower() in PDF_EXTENSIONS else "image",
+                    "thumbnail": True
+                })
             
             # Archivos binarios no soportados
             else:
@@ -315,6 +592,7 @@ class UserFileManager:
         except Exception as e:
             return {"status": "error", "message": f"Error generando vista previa: {str(e)}"}
     
+    @coalesced("get_disk_usage")
     def get_disk_usage(self, user_id: str) -> Dict:
         """
         Obtiene el uso de disco del usuario
@@ -337,12 +615,51 @@ class UserFileManager:
                 "status": "success",
                 "total_size": total_size,
                 "total_files": file_count,
-                "formatted_size": self._format_size(total_size)
+                "formatted_size": self._format_size(total_size),
+                "trash": self.trash.usage(user_id)
             }
             
         except Exception as e:
             return {"status": "error", "message": f"Error calculando uso de disco: {str(e)}"}
     
+    def resolve_path(self, user_id: str, path: str) -> Path:
+        """
+        Ruta absoluta de un path del usuario; ValueError si sale de su directorio
+        """
+        user_dir = self.get_user_directory(user_id)
+        target_path = user_dir / path.lstrip('/')
+        
+        if not self._is_safe_path(user_dir, target_path):
+            raise ValueError("Acceso denegado: path fuera del directorio del usuario")
+        
+        return target_path
+    
+    def stat_path(self, user_id: str, path: str) -> Optional[os.stat_result]:
+        """
+        stat de un path del usuario (para validadores HTTP), o None si no existe
+        """
+        target_path = self.resolve_path(user_id, path)
+        
+        try:
+            return target_path.stat()
+        except OSError:
+            return None
+    
+    def set_listing_cache(self, directory: Path, enabled: bool):
+        """Activa o desactiva la caché del listado de un directorio (ruta resuelta)"""
+        if enabled:
+            self._listing_versions.setdefault(directory, next(self._version_clock))
+        else:
+            self._listing_versions.pop(directory, None)
+            self._listing_cache.pop(directory, None)
+    
+    def invalidate_directory(self, directory: Path):
+        """Descarta el listado cacheado de un directorio (ruta resuelta)"""
+        version = self._listing_versions.get(directory)
+        if version is not None:
+            self._listing_versions[directory] = next(self._version_clock)
+            self._listing_cache.pop(directory, None)
+    
     def _is_safe_path(self, base_dir: Path, target_path: Path) -> bool:
         """Verifica que el path esté dentro del directorio base"""
         try:
@@ -363,11 +680,7 @@ class UserFileManager:
     
     def _calculate_file_hash(self, file_path: Path) -> str:
         """Calcula el hash SHA256 de un archivo"""
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
-        return sha256_hash.hexdigest()
+        return hash_file(str(file_path))["hash"]
     
     def _format_size(self, size_bytes: int) -> str:
         """Formatea el tamaño en bytes a una representación legible"""
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Notificaciones de cambios en el workspace
+========================================================
+
+Vigila los directorios que los usuarios tienen abiertos en el explorador
+de archivos y emite eventos created/modified/deleted:
+- inotify (vía ctypes sobre libc, sin dependencias) en sistemas de
+  archivos locales
+- Sondeo por mtime/tamaño cuando inotify no está disponible o el
+  directorio está en un sistema de archivos remoto (NFS, Lustre, GPFS...)
+  donde inotify no ve los cambios hechos desde otros nodos
+
+Cada directorio vigilado lleva un contador de referencias (una por
+suscriptor SSE). Al llegar a cero no se elimina de inmediato: caduca tras
+idle_timeout segundos sin suscriptores, así que recargar la página no
+cuesta una vigilancia nueva. Mientras un directorio está vigilado su
+listado se cachea en UserFileManager y cada evento lo invalida.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Sistemas de archivos donde inotify no ve cambios hechos desde otros nodos
+REMOTE_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "lustre", "gpfs", "beegfs",
+                      "ceph", "fuse.sshfs", "fuse.glusterfs", "9p"}
+
+# Cola máxima por suscriptor: si se llena se envía "overflow" (el cliente relista)
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Un evento modified por archivo como mucho cada este intervalo (salidas en
+# escritura); el último de la ventana se emite al cerrarla
+MODIFY_THROTTLE_SECONDS = 1.0
+
+
+class Inotify:
+    """Envoltorio mínimo de inotify(7) con ctypes"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name or not hasattr(os, "O_NONBLOCK"):
+            raise OSError(errno.ENOSYS, "inotify no disponible")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify no disponible")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+
+    def add_watch(self, path: Path, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), str(path))
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """(wd, mask, nombre) de los eventos pendientes"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def filesystem_type(path: Path) -> str:
+    """Tipo del sistema de archivos que contiene path (según /proc/mounts)"""
+    best, fstype = "", ""
+    try:
+        resolved = str(path.resolve())
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point = parts[1].replace("\\040", " ")
+                if (resolved == mount_point or resolved.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) > len(best):
+                    best, fstype = mount_point, parts[2]
+    except OSError:
+        pass
+    return fstype
+
+
+class Subscription:
+    """Suscripción de un cliente a un directorio; cerrar libera la referencia"""
+
+    def __init__(self, watcher: "WorkspaceWatcher", watch: "DirectoryWatch",
+                 loop: asyncio.AbstractEventLoop):
+        self.watcher = watcher
+        self.watch = watch
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._overflowed = False
+
+    def _deliver(self, event: Dict) -> None:
+        # Corre en el event loop del suscriptor
+        if self.queue.full():
+            if not self._overflowed:
+                self._overflowed = True
+                self.queue.get_nowait()
+                self.queue.put_nowait({"type": "overflow", "path": self.watch.relative_path})
+            return
+        self._overflowed = False
+        self.queue.put_nowait(event)
+
+    def notify(self, event: Dict) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:  # loop cerrado: el cliente ya se fue
+            pass
+
+    def close(self) -> None:
+        self.watcher.unsubscribe(self)
+
+
+class DirectoryWatch:
+    """Un directorio vigilado, compartido por todos sus suscriptores"""
+
+    def __init__(self, path: Path, relative_path: str, polling: bool):
+        self.path = path
+        self.relative_path = relative_path
+        self.polling = polling
+        self.wd: Optional[int] = None
+        self.subscribers: List[Subscription] = []
+        self.idle_since: Optional[float] = None
+        self.snapshot: Dict[str, Tuple[int, int, bool]] = {}
+        self.last_modified_sent: Dict[str, float] = {}
+        # Último 'modified' retenido por el throttle, por nombre: se emite al cerrar la ventana
+        self.deferred_modified: Dict[str, Dict] = {}
+
+    @property
+    def refcount(self) -> int:
+        return len(self.subscribers)
+
+    def scan(self) -> Dict[str, Tuple[int, int, bool]]:
+        """nombre -> (mtime_ns, tamaño, es_directorio) para el sondeo"""
+        entries = {}
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                        entries[entry.name] = (stat.st_mtime_ns, stat.st_size, entry.is_dir())
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return entries
+
+
+class WorkspaceWatcher:
+    """Vigilancia de directorios abiertos con refcount y caducidad por inactividad"""
+
+    def __init__(self, file_manager, idle_timeout: float = 60.0, poll_interval: float = 2.0,
+                 use_inotify: bool = True):
+        self.file_manager = file_manager
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self._watches: Dict[Path, DirectoryWatch] = {}
+        self._by_wd: Dict[int, DirectoryWatch] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[Path, List[Dict]], None]] = []
+        self._inotify: Optional[Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError:
+                self._inotify = None
+
+    # -- suscripciones ---------------------------------------------------
+
+    def subscribe(self, user_id: str, path: str, loop: asyncio.AbstractEventLoop) -> Subscription:
+        """
+        Suscribe al directorio path del usuario. Lanza ValueError si el path
+        no es seguro o no es un directorio.
+        """
+        user_dir = self.file_manager.get_user_directory(user_id)
+        target = self.file_manager.resolve_path(user_id, path).resolve()
+        if not target.is_dir():
+            raise ValueError("El path no es un directorio")
+
+        with self._lock:
+            watch = self._watches.get(target)
+            if watch is None:
+                watch = self._add_watch(target, str(target.relative_to(user_dir.resolve())))
+            subscription = Subscription(self, watch, loop)
+            watch.subscribers.append(subscription)
+            watch.idle_since = None
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            watch = subscription.watch
+            if subscription in watch.subscribers:
+                watch.subscribers.remove(subscription)
+                if not watch.subscribers:
+                    watch.idle_since = time.monotonic()
+
+    def _add_watch(self, target: Path, relative_path: str) -> DirectoryWatch:
+        polling = self._inotify is None or filesystem_type(target) in REMOTE_FILESYSTEMS
+        watch = DirectoryWatch(target, relative_path, polling)
+        if not polling:
+            try:
+                watch.wd = self._inotify.add_watch(target)
+                self._by_wd[watch.wd] = watch
+            except OSError:  # p. ej. límite de max_user_watches alcanzado
+                watch.polling = True
+        if watch.polling:
+            watch.snapshot = watch.scan()
+        self._watches[target] = watch
+        self.file_manager.set_listing_cache(target, True)
+        return watch
+
+    def _remove_watch(self, watch: DirectoryWatch) -> None:
+        self._watches.pop(watch.path, None)
+        if watch.wd is not None:
+            self._by_wd.pop(watch.wd, None)
+            try:
+                self._inotify.rm_watch(watch.wd)
+            except OSError:
+                pass
+            watch.wd = None
+        self.file_manager.set_listing_cache(watch.path, False)
+
+    def add_listener(self, listener: Callable[[Path, List[Dict]], None]) -> None:
+        """listener(directorio, eventos) se llama en el hilo del watcher tras cada lote"""
+        self._listeners.append(listener)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            watches = list(self._watches.values())
+        return {
+            "backend": "inotify" if self._inotify else "polling",
+            "watches": len(watches),
+            "polling_watches": sum(1 for w in watches if w.polling),
+            "idle_watches": sum(1 for w in watches if w.idle_since is not None),
+            "subscribers": sum(w.refcount for w in watches),
+        }
+
+    # -- hilo de vigilancia ----------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="atrox-file-watcher", daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+        with self._lock:
+            for watch in list(self._watches.values()):
+                self._remove_watch(watch)
+
+    def _run(self):
+        next_poll = time.monotonic()
+        next_flush: Optional[float] = None
+        while not self._stop.is_set():
+            deadline = next_poll if next_flush is None else min(next_poll, next_flush)
+            timeout = max(0.0, deadline - time.monotonic())
+            if self._inotify is not None:
+                ready, _, _ = select.select([self._inotify.fd], [], [], timeout)
+                if ready:
+                    self._handle_inotify(self._inotify.read())
+            elif self._stop.wait(timeout):
+                break
+
+            if time.monotonic() >= next_poll:
+                self._poll()
+                self._expire_idle()
+                next_poll = time.monotonic() + self.poll_interval
+            next_flush = self._flush_deferred()
+
+    def _handle_inotify(self, raw_events: List[Tuple[int, int, str]]) -> None:
+        pending: Dict[DirectoryWatch, Dict[str, Dict]] = {}
+        with self._lock:
+            for wd, mask, name in raw_events:
+                if mask & IN_Q_OVERFLOW:
+                    for watch in self._watches.values():
+                        pending.setdefault(watch, {})[""] = {"type": "overflow"}
+                    continue
+                watch = self._by_wd.get(wd)
+                if watch is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    pending.setdefault(watch, {})[""] = {"type": "deleted", "is_directory": True}
+                    if mask & IN_IGNORED:
+                        self._by_wd.pop(wd, None)
+                        watch.wd = None
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    kind = "created"
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    kind = "deleted"
+                else:
+                    kind = "modified"
+                events = pending.setdefault(watch, {})
+                # Creado y modificado en el mismo lote sigue siendo "created"
+                if kind == "modified" and events.get(name, {}).get("type") == "created":
+                    continue
+                events[name] = {"type": kind, "is_directory": bool(mask & IN_ISDIR)}
+
+        for watch, events in pending.items():
+            self._dispatch(watch, events)
+
+    def _poll(self) -> None:
+        with self._lock:
+            watches = [w for w in self._watches.values() if w.polling]
+        for watch in watches:
+            current = watch.scan()
+            previous = watch.snapshot
+            events = {}
+            for name, info in current.items():
+                before = previous.get(name)
+                if before is None:
+                    events[name] = {"type": "created", "is_directory": info[2]}
+                elif before[:2] != info[:2]:
+                    events[name] = {"type": "modified", "is_directory": info[2]}
+            for name in previous.keys() - current.keys():
+                events[name] = {"type": "deleted", "is_directory": previous[name][2]}
+            watch.snapshot = current
+            if events:
+                self._dispatch(watch, events)
+
+    def _expire_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for watch in list(self._watches.values()):
+                if watch.idle_since is not None and now - watch.idle_since >= self.idle_timeout:
+                    self._remove_watch(watch)
+
+    def _flush_deferred(self) -> Optional[float]:
+        """Emite los 'modified' retenidos cuya ventana cerró; devuelve el próximo vencimiento"""
+        now = time.monotonic()
+        next_due = None
+        with self._lock:
+            watches = [w for w in self._watches.values() if w.deferred_modified]
+        for watch in watches:
+            due = {}
+            for name in list(watch.deferred_modified):
+                deadline = watch.last_modified_sent.get(name, 0.0) + MODIFY_THROTTLE_SECONDS
+                if deadline <= now:
+                    due[name] = watch.deferred_modified.pop(name)
+                else:
+                    next_due = deadline if next_due is None else min(next_due, deadline)
+            if due:
+                self._dispatch(watch, due)
+        return next_due
+
+    def _dispatch(self, watch: DirectoryWatch, events: Dict[str, Dict]) -> None:
+        """Invalida la caché del listado y envía los eventos a los suscriptores"""
+        self.file_manager.invalidate_directory(watch.path)
+
+        now = time.monotonic()
+        timestamp = time.time()
+        outgoing = []
+        for name, event in events.items():
+            if event["type"] == "modified":
+                last = watch.last_modified_sent.get(name, 0.0)
+                if now - last < MODIFY_THROTTLE_SECONDS:
+                    # Dentro de la ventana: se guarda el último y se emite al cerrarla
+                    watch.deferred_modified[name] = event
+                    continue
+                watch.last_modified_sent[name] = now
+                watch.deferred_modified.pop(name, None)
+            else:
+                watch.deferred_modified.pop(name, None)
+                if event["type"] == "deleted":
+                    watch.last_modified_sent.pop(name, None)
+            path = os.path.join(watch.relative_path, name) if name else watch.relative_path
+            outgoing.append({**event, "name": name, "path": os.path.normpath(path), "timestamp": timestamp})
+
+        for listener in self._listeners:
+            try:
+                listener(watch.path, outgoing)
+            except Exception:
+                pass  # un listener no debe cortar la entrega a los clientes
+
+        with self._lock:
+            subscribers = list(watch.subscribers)
+        for event in outgoing:
+            for subscription in subscribers:
+                subscription.notify(event)
@@ -11,17 +11,37 @@ Funcionalidades principales:
 - Monitoreo de cola y estado
 - Gestión de archivos de usuario
 - Generación automática de scripts .slurm
+- Workflows (DAG) con dependencias de Slurm en un solo envío
 - Asistente inteligente para configuración de recursos
 """
 
+import fnmatch
 import os
+import re
+import shlex
+import shutil
 import subprocess
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import time
+import itertools
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from dataclasses import dataclass, field
 from pathlib import Path
 
+from efficiency import EfficiencyReport, GROUP_KEYS, JobColumns, sacct_command, simulate_sacct_output
+from metrics import cache_counters, observe_slurm_command
+from singleflight import coalesced
+
+
+# Valores que acaban en líneas #SBATCH o en nombres de archivo: sin
+# espacios, comillas ni saltos de línea
+JOB_NAME_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$"
+MEMORY_PATTERN = r"^[0-9]+[KMGT]?B?$"
+WALLTIME_PATTERN = r"^([0-9]+-)?[0-9]{1,3}(:[0-9]{2}){0,2}$"
+PARTITION_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+
 
 @dataclass
 class JobConfig:
@@ -36,6 +56,8 @@ class JobConfig:
     nodes: int = 1
     user_id: str = ""
     working_dir: str = ""
+    stage_in: List[str] = field(default_factory=list)  # rutas absolutas a copiar al tier de staging
+    stage_out: str = ""  # destino de $ATROX_STAGE_OUT al terminar
 
 
 @dataclass
@@ -51,6 +73,125 @@ class JobStatus:
     memory: str = ""
     user: str = ""
     progress: int = 0
+    partition: str = ""
+
+
+@dataclass
+class NodeStatus:
+    """Estado de un nodo de cómputo"""
+    name: str
+    state: str  # idle, mixed, allocated, drain, down
+    partition: str = "general"
+    cpus_total: int = 0
+    cpus_alloc: int = 0
+    cpu_load: float = 0.0
+    memory_total_mb: int = 0
+    memory_alloc_mb: int = 0
+    gpus_total: int = 0
+    gpus_alloc: int = 0
+
+
+@dataclass
+class WorkflowStep:
+    """Paso de un workflow: un trabajo con dependencias sobre otros pasos"""
+    step_id: str
+    config: JobConfig
+    depends_on: List[str] = field(default_factory=list)
+    array_size: int = 0  # > 0: fan-out como job array (--array=0-N)
+
+
+@dataclass
+class JobSelector:
+    """
+    Selección de trabajos para acciones en bloque: lista de ids y/o
+    filtros sobre la cola (se combinan con AND)
+    """
+    job_ids: List[str] = field(default_factory=list)
+    name: Optional[str] = None  # patrón glob, p.ej. "sweep_*"
+    state: Optional[str] = None  # running, queued, ...
+    partition: Optional[str] = None
+    array_id: Optional[str] = None  # job id padre de un job array
+    user: Optional[str] = None  # None: todos los usuarios (solo administradores)
+    
+    def is_empty(self) -> bool:
+        return not (self.job_ids or self.name or self.state or self.partition or self.array_id)
+    
+    def matches(self, job: "JobStatus") -> bool:
+        base_id = job.job_id.split("_")[0]
+        if self.job_ids and job.job_id not in self.job_ids and base_id not in self.job_ids:
+            return False
+        if self.name and not fnmatch.fnmatchcase(job.name, self.name):
+            return False
+        if self.state and job.status != self.state:
+            return False
+        if self.partition and job.partition != self.partition:
+            return False
+        if self.array_id and base_id != self.array_id:
+            return False
+        return self.user is None or job.user == self.user
+
+
+# Acciones en bloque -> comando de Slurm (admite muchos ids por llamada)
+BULK_ACTIONS = {
+    "cancel": ["scancel"],
+    "hold": ["scontrol", "hold"],
+    "release": ["scontrol", "release"],
+    "requeue": ["scontrol", "requeue"],
+}
+
+# Ids por invocación (límite de longitud de la línea de comandos)
+BULK_BATCH_SIZE = 500
+
+# "... job id 1234_5: Invalid job id specified" / "Job 1234: ..." en stderr
+_JOB_ERROR_LINE = re.compile(r"[Jj]ob(?: id)?\s+(\d+(?:_\d+)?)\b\W*(.*)")
+
+
+# Estados de Slurm -> estados de AtroxGetaway
+SLURM_STATE_MAP = {
+    "PENDING": "queued", "CONFIGURING": "queued", "REQUEUED": "queued",
+    "RUNNING": "running", "COMPLETING": "running", "SUSPENDED": "running",
+    "COMPLETED": "completed",
+    "FAILED": "failed", "CANCELLED": "failed", "TIMEOUT": "failed",
+    "OUT_OF_MEMORY": "failed", "NODE_FAIL": "failed", "PREEMPTED": "failed",
+    "BOOT_FAIL": "failed", "DEADLINE": "failed",
+}
+
+
+def topological_order(steps: List[WorkflowStep]) -> List[WorkflowStep]:
+    """
+    Ordena los pasos de un workflow (Kahn). Lanza ValueError si hay
+    identificadores duplicados, dependencias desconocidas o ciclos.
+    """
+    by_id = {}
+    for step in steps:
+        if step.step_id in by_id:
+            raise ValueError(f"Paso duplicado: {step.step_id}")
+        by_id[step.step_id] = step
+    
+    pending = {}
+    dependents: Dict[str, List[str]] = {step_id: [] for step_id in by_id}
+    for step in steps:
+        for dep in step.depends_on:
+            if dep not in by_id:
+                raise ValueError(f"El paso {step.step_id} depende de un paso inexistente: {dep}")
+            dependents[dep].append(step.step_id)
+        pending[step.step_id] = len(set(step.depends_on))
+    
+    ready = [step.step_id for step in steps if pending[step.step_id] == 0]
+    order = []
+    while ready:
+        step_id = ready.pop(0)
+        order.append(by_id[step_id])
+        for child in dependents[step_id]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                ready.append(child)
+    
+    if len(order) != len(steps):
+        cyclic = sorted(step_id for step_id, count in pending.items() if count > 0)
+        raise ValueError(f"El workflow contiene un ciclo entre: {', '.join(cyclic)}")
+    
+    return order
 
 
 class SlurmJobManager:
@@ -69,15 +210,92 @@ class SlurmJobManager:
         self.jobs_dir = self.base_dir / "jobs"
         self.scripts_dir = self.base_dir / "scripts"
         self.results_dir = self.base_dir / "results"
+        self.workflows_dir = self.jobs_dir / "workflows"
         
         # Crear directorios si no existen
-        for directory in [self.jobs_dir, self.scripts_dir, self.results_dir]:
+        for directory in [self.jobs_dir, self.scripts_dir, self.results_dir, self.workflows_dir]:
             directory.mkdir(parents=True, exist_ok=True)
+        
+        # Staging de datos al tier rápido (attach_stager)
+        self.stager = None
+        
+        # Sin Slurm instalado (desarrollo) los envíos se simulan
+        self.slurm_available = shutil.which("sbatch") is not None
+        self._simulated_ids = itertools.count(int(time.time()) % 1000000 * 10)
+        
+        # Datos de contabilidad ya parseados: (usuario, días) -> (instante, columnas)
+        self.accounting_ttl = float(os.environ.get("ATROX_ACCOUNTING_TTL", "60"))
+        self._accounting_cache: Dict[tuple, tuple] = {}
+        self._accounting_hits, self._accounting_misses = cache_counters("job_accounting")
+    
+    def _run_slurm_command(self, args: List[str], timeout: float = 30.0) -> subprocess.CompletedProcess:
+        """
+        Ejecuta un comando de Slurm registrando duración y código de salida
+        """
+        start = time.perf_counter()
+        exit_status = "error"
+        try:
+            result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+            exit_status = str(result.returncode)
+            return result
+        except subprocess.TimeoutExpired:
+            exit_status = "timeout"
+            raise
+        finally:
+            observe_slurm_command(os.path.basename(args[0]), time.perf_counter() - start, exit_status)
+    
+    def _sbatch(self, script_path: Path, extra_args: Optional[List[str]] = None) -> str:
+        """
+        Envía un script con sbatch --parsable y devuelve el job id
+        (simulado si Slurm no está disponible)
+        """
+        if not self.slurm_available:
+            return str(next(self._simulated_ids))
+        
+        result = self._run_slurm_command(['sbatch', '--parsable'] + (extra_args or []) + [str(script_path)])
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"sbatch terminó con código {result.returncode}")
+        # --parsable devuelve "jobid" o "jobid;cluster"
+        return result.stdout.strip().split(';')[0]
+    
+    def attach_stager(self, stager) -> None:
+        """
+        Activa el staging de datos: los trabajos con stage_in/stage_out se
+        liberan (o cancelan) según el resultado del stage-in y el stage-out
+        se lanza cuando Slurm los da por terminados
+        """
+        self.stager = stager
+        stager.job_states = self._query_job_states
+        stager.on_stage_in = lambda job_id, ok: self.control_jobs("release" if ok else "cancel", [job_id])
+    
+    @staticmethod
+    def validate_job_config(config: JobConfig) -> None:
+        """ValueError si algún campo no es seguro para pegarlo en el script"""
+        checks = [
+            ("name", config.name, JOB_NAME_PATTERN),
+            ("memory", config.memory, MEMORY_PATTERN),
+            ("walltime", config.walltime, WALLTIME_PATTERN),
+            ("partition", config.partition, PARTITION_PATTERN),
+        ]
+        for field_name, value, pattern in checks:
+            if not re.fullmatch(pattern, str(value)):
+                raise ValueError(f"Valor no válido para {field_name}: {value!r}")
+        for value in (config.script_path, config.working_dir, config.user_id):
+            if "\n" in value or "\r" in value or "\0" in value:
+                raise ValueError("Las rutas no pueden contener saltos de línea")
     
     def generate_slurm_script(self, config: JobConfig) -> str:
         """
         Genera un script .slurm basado en la configuración
+        
+        Los campos de #SBATCH se validan con patrones estrictos y las
+        rutas se citan para el shell
         """
+        self.validate_job_config(config)
+        script_path = shlex.quote(config.script_path)
+        working_dir = shlex.quote(config.working_dir) if config.working_dir else "~"
+        results_dir = self.user_results_dir(config.user_id)
+        
         script_content = f"""#!/bin/bash
 #SBATCH --job-name={config.name}
 #SBATCH --cpus-per-task={config.cpus}
@@ -85,24 +303,24 @@ class SlurmJobManager:
 #SBATCH --time={config.walltime}
 #SBATCH --partition={config.partition}
 #SBATCH --nodes={config.nodes}
-#SBATCH --output={self.results_dir}/{config.name}_%j.out
-#SBATCH --error={self.results_dir}/{config.name}_%j.err
+#SBATCH --output={results_dir}/{config.name}_%j.out
+#SBATCH --error={results_dir}/{config.name}_%j.err
 
 # Información del trabajo
 echo "================================================"
 echo "Trabajo: {config.name}"
-echo "Usuario: {config.user_id}"
+echo "Usuario:" {shlex.quote(config.user_id)}
 echo "Inicio: $(date)"
 echo "Nodo: $SLURM_NODELIST"
 echo "JobID: $SLURM_JOB_ID"
 echo "================================================"
 
 # Cambiar al directorio de trabajo
-cd {config.working_dir}
+cd {working_dir}
 
 # Ejecutar el script principal
-echo "Ejecutando: {config.script_path}"
-python {config.script_path}
+echo "Ejecutando:" {script_path}
+python {script_path}
 
 # Información de finalización
 echo "================================================"
@@ -125,7 +343,7 @@ echo "================================================"
         """
         Envía un trabajo a Slurm
         
-        TEMPLATE: En producción usaría subprocess.run(['sbatch', script_file])
+        Sin Slurm instalado el job_id es simulado
         """
         try:
             # Generar script Slurm
@@ -138,19 +356,33 @@ echo "================================================"
             with open(script_path, 'w') as f:
                 f.write(slurm_script)
             
-            # TEMPLATE: Aquí iría el comando real de sbatch
-            # result = subprocess.run(['sbatch', str(script_path)], 
-            #                        capture_output=True, text=True)
+            # Con staging el trabajo se envía retenido y se libera al terminar el stage-in
+            stage = None
+            extra_args = []
+            if (config.stage_in or config.stage_out) and self.stager is not None:
+                stage = self.stager.prepare(config.user_id, config.name, config.stage_out or None)
+                extra_args = [
+                    "--hold",
+                    f"--export=ALL,ATROX_STAGE_DIR={stage['input_dir']},ATROX_STAGE_OUT={stage['output_dir']}"
+                ]
             
-            # Simulación del job_id
-            job_id = f"job_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            try:
+                job_id = self._sbatch(script_path, extra_args)
+            except Exception:
+                if stage is not None:
+                    self.stager.discard(stage["id"], "El envío a Slurm falló")
+                raise
             
-            return {
+            result = {
                 "status": "success",
                 "job_id": job_id,
                 "script_path": str(script_path),
                 "message": f"Trabajo {config.name} enviado exitosamente"
             }
+            if stage is not None:
+                self.stager.start_stage_in(stage["id"], job_id, config.stage_in)
+                result["stage_id"] = stage["id"]
+            return result
             
         except Exception as e:
             return {
@@ -158,48 +390,239 @@ echo "================================================"
                 "message": f"Error al enviar trabajo: {str(e)}"
             }
     
+    def submit_workflow(self, name: str, steps: List[WorkflowStep], user_id: str = "") -> Dict:
+        """
+        Envía un workflow (DAG) completo en una sola llamada
+        
+        Cada paso se envía en orden topológico con --dependency=afterok
+        sobre los job ids de sus dependencias; los pasos con array_size > 0
+        se envían como job arrays. Si un paso falla, Slurm cancela los
+        dependientes (--kill-on-invalid-dep=yes).
+        """
+        try:
+            for step in steps:
+                if not re.fullmatch(JOB_NAME_PATTERN, step.step_id):
+                    raise ValueError(f"Identificador de paso no válido: {step.step_id!r}")
+            order = topological_order(steps)
+        except ValueError as e:
+            return {"status": "error", "message": f"Workflow inválido: {str(e)}"}
+        
+        workflow_id = f"wf_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        job_ids: Dict[str, str] = {}
+        
+        try:
+            for step in order:
+                script_path = self.jobs_dir / f"{workflow_id}_{step.step_id}.slurm"
+                with open(script_path, 'w') as f:
+                    f.write(self.generate_slurm_script(step.config))
+                
+                args = []
+                if step.depends_on:
+                    deps = ":".join(job_ids[dep] for dep in step.depends_on)
+                    args += [f"--dependency=afterok:{deps}", "--kill-on-invalid-dep=yes"]
+                if step.array_size > 0:
+                    args.append(f"--array=0-{step.array_size - 1}")
+                
+                job_ids[step.step_id] = self._sbatch(script_path, args)
+        
+        except Exception as e:
+            # Cancelar lo ya enviado: un workflow a medias no tiene sentido
+            for job_id in job_ids.values():
+                self.cancel_job(job_id)
+            return {"status": "error", "message": f"Error al enviar workflow: {str(e)}"}
+        
+        record = {
+            "workflow_id": workflow_id,
+            "name": name,
+            "user_id": user_id,
+            "submit_time": datetime.now().isoformat(),
+            "steps": [
+                {
+                    "step_id": step.step_id,
+                    "job_id": job_ids[step.step_id],
+                    "name": step.config.name,
+                    "depends_on": step.depends_on,
+                    "array_size": step.array_size
+                }
+                for step in order
+            ]
+        }
+        with open(self.workflows_dir / f"{workflow_id}.json", 'w') as f:
+            json.dump(record, f, indent=2)
+        
+        return {
+            "status": "success",
+            "workflow_id": workflow_id,
+            "job_ids": job_ids,
+            "message": f"Workflow {name} enviado exitosamente ({len(order)} pasos)"
+        }
+    
+    def get_workflow_status(self, workflow_id: str, user_id: Optional[str] = None) -> Dict:
+        """
+        Estado agregado de un workflow: por paso y global
+        """
+        record_path = self.workflows_dir / f"{Path(workflow_id).name}.json"
+        if not record_path.exists():
+            return {"status": "error", "message": "Workflow no encontrado"}
+        
+        with open(record_path) as f:
+            record = json.load(f)
+        
+        if user_id is not None and record.get("user_id") != user_id:
+            return {"status": "error", "message": "Workflow no encontrado"}
+        
+        states = self._query_job_states([step["job_id"] for step in record["steps"]])
+        for step in record["steps"]:
+            step["state"] = states.get(step["job_id"], "unknown")
+        
+        step_states = {step["state"] for step in record["steps"]}
+        if "failed" in step_states:
+            overall = "failed"
+        elif step_states == {"completed"}:
+            overall = "completed"
+        elif "running" in step_states or "completed" in step_states:
+            overall = "running"
+        else:
+            overall = "queued"
+        
+        record.update({"status": "success", "state": overall})
+        return record
+    
+    def _query_job_states(self, job_ids: List[str]) -> Dict[str, str]:
+        """
+        Estado de varios trabajos con un solo sacct; las tareas de un
+        array se agregan en el estado de su job padre
+        """
+        if not job_ids:
+            return {}
+        if not self.slurm_available:
+            return {job_id: "queued" for job_id in job_ids}
+        
+        result = self._run_slurm_command(
+            ['sacct', '-n', '-X', '-P', '-o', 'JobID,State', '-j', ','.join(job_ids)]
+        )
+        
+        # Prioridad al agregar tareas de un array: failed > running > queued > completed
+        priority = {"failed": 3, "running": 2, "queued": 1, "completed": 0}
+        states: Dict[str, str] = {}
+        for line in result.stdout.splitlines():
+            if '|' not in line:
+                continue
+            raw_id, raw_state = line.split('|', 1)
+            base_id = raw_id.split('_')[0]
+            state = SLURM_STATE_MAP.get(raw_state.split()[0] if raw_state else "", "unknown")
+            current = states.get(base_id)
+            if current is None or priority.get(state, 4) > priority.get(current, 4):
+                states[base_id] = state
+        return states
+    
+    @coalesced("get_queue_status")
     def get_queue_status(self) -> List[JobStatus]:
         """
         Obtiene el estado de la cola de trabajos
+        """
+        return list(self.iter_queue_status())
+    
+    def iter_queue_status(self) -> Iterator[JobStatus]:
+        """
+        Itera la cola de trabajos a medida que se parsea
         
         TEMPLATE: En producción usaría squeue
         """
-        # TEMPLATE: Comando real sería subprocess.run(['squeue', '-u', username])
+        # TEMPLATE: Comando real sería self._run_slurm_command(['squeue', '-u', username])
+        # y un JobStatus por cada línea de salida
         
         # Datos simulados para el template
-        mock_jobs = [
-            JobStatus(
-                job_id="job_001",
-                name="Análisis RNA-Seq",
-                status="running",
-                submit_time=datetime.now(),
-                cpus=8,
-                memory="16GB",
-                user="dr_garcia",
-                progress=75
+        yield JobStatus(
+            job_id="job_001",
+            name="Análisis RNA-Seq",
+            status="running",
+            submit_time=datetime.now(),
+            cpus=8,
+            memory="16GB",
+            user="dr_garcia",
+            progress=75,
+            partition="general"
+        )
+        yield JobStatus(
+            job_id="job_002", 
+            name="Simulación Molecular",
+            status="queued",
+            submit_time=datetime.now(),
+            cpus=16,
+            memory="32GB",
+            user="ana_lopez",
+            progress=0,
+            partition="general"
+        )
+    
+    @coalesced("get_node_status")
+    def get_node_status(self) -> List[NodeStatus]:
+        """
+        Obtiene el estado de los nodos de cómputo
+        
+        TEMPLATE: En producción usaría sinfo por nodo
+        """
+        # TEMPLATE: self._run_slurm_command(['sinfo', '-h', '-N', '-o', '%N %T %P %C %O %m %e %G'])
+        
+        # Datos simulados (nodos de nodes.conf)
+        return [
+            NodeStatus(
+                name="node-01",
+                state="mixed",
+                cpus_total=64,
+                cpus_alloc=40,
+                cpu_load=38.5,
+                memory_total_mb=256000,
+                memory_alloc_mb=160000
             ),
-            JobStatus(
-                job_id="job_002", 
-                name="Simulación Molecular",
-                status="queued",
-                submit_time=datetime.now(),
-                cpus=16,
-                memory="32GB",
-                user="ana_lopez",
-                progress=0
+            NodeStatus(
+                name="node-02",
+                state="allocated",
+                partition="gpu",
+                cpus_total=64,
+                cpus_alloc=64,
+                cpu_load=61.2,
+                memory_total_mb=512000,
+                memory_alloc_mb=384000,
+                gpus_total=4,
+                gpus_alloc=2
             )
         ]
-        
-        return mock_jobs
+    
+    def user_results_dir(self, user_id: str) -> Path:
+        """
+        Directorio de .out/.err de los trabajos de un usuario: cada usuario
+        solo ve los logs de los trabajos que envió él
+        """
+        if not re.fullmatch(JOB_NAME_PATTERN, user_id):
+            raise ValueError(f"Usuario no válido: {user_id!r}")
+        directory = self.results_dir / user_id
+        directory.mkdir(exist_ok=True)
+        return directory
+    
+    def get_log_path(self, job_id: str, stream: str = "out", user_id: str = "") -> Optional[Path]:
+        """
+        Ruta del .out/.err de un trabajo del usuario (--output/--error de
+        generate_slurm_script); None si no existe o no es suyo
+        """
+        if stream not in ("out", "err") or not job_id.replace("_", "").isalnum():
+            return None
+        try:
+            directory = self.user_results_dir(user_id)
+        except ValueError:
+            return None
+        matches = sorted(directory.glob(f"*_{job_id}.{stream}"))
+        return matches[0] if matches else None
     
     def cancel_job(self, job_id: str) -> Dict:
         """
         Cancela un trabajo
-        
-        TEMPLATE: En producción usaría scancel
         """
         try:
-            # TEMPLATE: subprocess.run(['scancel', job_id])
+            result = self.control_jobs("cancel", [job_id])[job_id]
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
             
             return {
                 "status": "success",
@@ -211,25 +634,143 @@ echo "================================================"
                 "message": f"Error al cancelar trabajo: {str(e)}"
             }
     
+    def bulk_control(self, action: str, selector: JobSelector, jobs: List[JobStatus]) -> Dict:
+        """
+        Acción en bloque (cancel, hold, release, requeue) sobre los trabajos
+        de `jobs` (snapshot de la cola) que cumplen el selector
+        """
+        if action not in BULK_ACTIONS:
+            return {"status": "error", "message": f"Acción desconocida: {action}"}
+        if selector.is_empty():
+            return {"status": "error", "message": "Indica ids o al menos un filtro"}
+        
+        matched = {}
+        for job in jobs:
+            if selector.matches(job):
+                matched.setdefault(job.job_id, job)
+        
+        # Ids pedidos que no están en la cola (o no pertenecen al usuario)
+        seen = {job_id for job_id in matched} | {job_id.split("_")[0] for job_id in matched}
+        not_found = [job_id for job_id in selector.job_ids if job_id not in seen]
+        
+        results = self.control_jobs(action, list(matched))
+        succeeded = sum(1 for result in results.values() if result["status"] == "success")
+        return {
+            "status": "success",
+            "action": action,
+            "matched": len(matched),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "not_found": not_found,
+            "results": [
+                {"job_id": job_id, "name": matched[job_id].name, **results[job_id]}
+                for job_id in matched
+            ]
+        }
+    
+    def control_jobs(self, action: str, job_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Aplica una acción a varios trabajos con una invocación de
+        scancel/scontrol por lote de BULK_BATCH_SIZE ids; resultado por trabajo
+        """
+        results: Dict[str, Dict] = {}
+        for i in range(0, len(job_ids), BULK_BATCH_SIZE):
+            results.update(self._control_batch(action, job_ids[i:i + BULK_BATCH_SIZE]))
+        return results
+    
+    def _control_batch(self, action: str, job_ids: List[str]) -> Dict[str, Dict]:
+        results = {job_id: {"status": "success", "message": ""} for job_id in job_ids}
+        if not self.slurm_available or not job_ids:
+            return results
+        
+        command = BULK_ACTIONS[action]
+        # scancel recibe ids separados; scontrol una lista separada por comas
+        args = command + job_ids if command[0] == "scancel" else command + [",".join(job_ids)]
+        result = self._run_slurm_command(args)
+        if result.returncode == 0 and not result.stderr.strip():
+            return results
+        
+        identified = False
+        for line in result.stderr.splitlines():
+            match = _JOB_ERROR_LINE.search(line)
+            if match and match.group(1) in results:
+                results[match.group(1)] = {"status": "error", "message": match.group(2) or line.strip()}
+                identified = True
+        
+        if not identified and result.returncode != 0:
+            if len(job_ids) == 1:
+                results[job_ids[0]] = {"status": "error", "message": result.stderr.strip() or "Error de Slurm"}
+            else:
+                # Error sin id identificable: se repite trabajo a trabajo
+                for job_id in job_ids:
+                    results.update(self._control_batch(action, [job_id]))
+        return results
+    
+    @coalesced("get_job_history")
     def get_job_history(self, user_id: str, days: int = 30) -> List[JobStatus]:
         """
         Obtiene el historial de trabajos de un usuario
+        """
+        return list(self.iter_job_history(user_id, days))
+    
+    def iter_job_history(self, user_id: str, days: int = 30) -> Iterator[JobStatus]:
+        """
+        Itera el historial de trabajos de un usuario a medida que se parsea
         
         TEMPLATE: En producción usaría sacct
         """
-        # TEMPLATE: subprocess.run(['sacct', '-u', user_id, '-S', start_date])
+        # TEMPLATE: self._run_slurm_command(['sacct', '-u', user_id, '-S', start_date])
         
         # Datos simulados
-        return [
-            JobStatus(
-                job_id="job_hist_001",
-                name="Trabajo Completado 1",
-                status="completed",
-                submit_time=datetime.now(),
-                end_time=datetime.now(),
-                user=user_id
-            )
-        ]
+        yield JobStatus(
+            job_id="job_hist_001",
+            name="Trabajo Completado 1",
+            status="completed",
+            submit_time=datetime.now(),
+            end_time=datetime.now(),
+            user=user_id
+        )
+    
+    def _accounting_columns(self, user_id: Optional[str], days: int) -> JobColumns:
+        """
+        Trabajos de la ventana en formato columnar con un único sacct
+        (cacheado ATROX_ACCOUNTING_TTL segundos)
+        """
+        key = (user_id, days)
+        cached = self._accounting_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.accounting_ttl:
+            self._accounting_hits.inc()
+            return cached[1]
+        self._accounting_misses.inc()
+        
+        if self.slurm_available:
+            start = datetime.now() - timedelta(days=days)
+            result = self._run_slurm_command(sacct_command(user_id, start), timeout=120)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or f"sacct terminó con código {result.returncode}")
+            lines = result.stdout.splitlines()
+        else:
+            # Datos simulados
+            lines = simulate_sacct_output(user_id)
+        
+        columns = JobColumns.from_sacct(lines)
+        if len(self._accounting_cache) >= 64:
+            self._accounting_cache.clear()
+        self._accounting_cache[key] = (time.monotonic(), columns)
+        return columns
+    
+    @coalesced("get_efficiency_report")
+    def get_efficiency_report(self, user_id: Optional[str], days: int = 30,
+                              group_by: tuple = GROUP_KEYS, limit: int = 20) -> Dict:
+        """
+        Informe de eficiencia tipo seff de todos los trabajos de la ventana
+        
+        user_id None: todos los usuarios (solo administradores)
+        """
+        report = EfficiencyReport(self._accounting_columns(user_id, days))
+        result = report.to_dict(group_by=group_by, limit=limit)
+        result.update({"user": user_id, "days": days})
+        return result
 
 
 class IntelligentJobAssistant:
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Búsqueda en logs
+===============================
+
+Búsqueda con expresiones regulares en logs y archivos de texto grandes
+(.out/.err de trabajos de varios GB) sin leerlos enteros:
+- mmap del archivo y regex compilada sobre bytes
+- Recorrido por bloques alineados a fin de línea; los archivos grandes
+  se reparten entre procesos (re no libera el GIL, así que los hilos no
+  paralelizarían el escaneo) manteniendo el orden del archivo
+- Resultados en streaming (un objeto por coincidencia) con número de
+  línea y contexto; límite de coincidencias y de bytes
+- Parada temprana: cerrar el generador (o que el cliente se desconecte)
+  cancela los bloques pendientes; el resumen final indica desde dónde
+  continuar (next_offset / next_line)
+- Plazo por bloque: re no se puede interrumpir (una regex con
+  backtracking catastrófico no termina), así que los bloques se escanean
+  en procesos propios y el que supera el plazo se mata
+"""
+
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Tamaño de bloque de escaneo
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# A partir de este tamaño el escaneo se reparte entre procesos
+PARALLEL_THRESHOLD_BYTES = 128 * 1024 * 1024
+
+# Longitud máxima de una línea devuelta (las líneas binarias pueden ser enormes)
+MAX_LINE_CHARS = 2000
+
+# Plazo de escaneo de un bloque
+CHUNK_TIMEOUT_SECONDS = 10.0
+
+# Intervalo de comprobación de plazos y cancelación mientras se espera
+POLL_SECONDS = 0.1
+
+_pool: Optional["_WorkerPool"] = None
+_pool_lock = threading.Lock()
+
+
+def compile_pattern(pattern: str, ignore_case: bool = False, literal: bool = False) -> re.Pattern:
+    """Compila el patrón sobre bytes; ValueError si no es válido"""
+    if literal:
+        pattern = re.escape(pattern)
+    try:
+        return re.compile(pattern.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    except re.error as e:
+        raise ValueError(f"Expresión regular inválida: {e}")
+
+
+def _decode(line: bytes) -> str:
+    return line[:MAX_LINE_CHARS * 4].decode("utf-8", "replace")[:MAX_LINE_CHARS]
+
+
+def _line_bounds(mm: mmap.mmap, pos: int, size: int) -> Tuple[int, int]:
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos, size)
+    return start, size if end < 0 else end
+
+
+def _scan_chunk(path: str, pattern: bytes, flags: int, start: int, end: int,
+                context: int, limit: int) -> Tuple[int, List[tuple]]:
+    """
+    Escanea [start, end) de path. Devuelve (saltos de línea del bloque,
+    coincidencias) con una coincidencia por línea como mucho:
+    (offset, fin de línea, línea relativa al bloque, texto, columna inicio,
+    columna fin, contexto anterior, contexto posterior).
+    """
+    regex = re.compile(pattern, flags)
+    matches = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        block = mm[start:end]
+        newlines = block.count(b"\n")
+        line_index = 0
+        counted_to = 0
+        last_line_start = -1
+
+        for match in regex.finditer(block):
+            line_start, line_end = _line_bounds(mm, start + match.start(), size)
+            if line_start == last_line_start:
+                continue  # ya se devolvió esta línea
+            last_line_start = line_start
+
+            line_index += block.count(b"\n", counted_to, match.start())
+            counted_to = match.start()
+
+            before = []
+            cursor = line_start
+            for _ in range(context):
+                if cursor == 0:
+                    break
+                prev_start = mm.rfind(b"\n", 0, cursor - 1) + 1
+                before.append(_decode(mm[prev_start:cursor - 1]))
+                cursor = prev_start
+            before.reverse()
+
+            after = []
+            cursor = line_end
+            for _ in range(context):
+                if cursor >= size - 1:
+                    break
+                next_end = mm.find(b"\n", cursor + 1, size)
+                next_end = size if next_end < 0 else next_end
+                after.append(_decode(mm[cursor + 1:next_end]))
+                cursor = next_end
+
+            line = mm[line_start:line_end]
+            col_start = len(line[:start + match.start() - line_start].decode("utf-8", "replace"))
+            col_end = col_start + len(match.group().decode("utf-8", "replace"))
+            matches.append((line_start, line_end, line_index, _decode(line), col_start, col_end, before, after))
+            if len(matches) >= limit:
+                break
+
+    return newlines, matches
+
+
+def _chunk_bounds(path: str, start: int, end: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Bloques de ~chunk_bytes que terminan justo después de un salto de línea"""
+    bounds = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        position = start
+        while position < end:
+            limit = min(position + chunk_bytes, end)
+            if limit < size:
+                newline = mm.find(b"\n", limit - 1, size)
+                limit = size if newline < 0 else newline + 1
+            bounds.append((position, limit))
+            position = limit
+    return bounds
+
+
+def _worker_main(conn) -> None:
+    """Bucle de un proceso de escaneo: argumentos de _scan_chunk -> (ok, resultado)"""
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, _scan_chunk(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class _ScanWorker:
+    """Proceso de escaneo propio: si un bloque supera su plazo se mata sin tocar a los demás"""
+
+    def __init__(self):
+        # forkserver: no hacer fork del proceso del servidor, que tiene muchos hilos
+        context = multiprocessing.get_context("forkserver")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,),
+                                       name="atrox-log-search", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, args: tuple) -> None:
+        self.conn.send(args)
+
+    def ready(self, timeout: float) -> bool:
+        return self.conn.poll(timeout)
+
+    def result(self) -> Tuple[int, List[tuple]]:
+        ok, value = self.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _WorkerPool:
+    """Procesos de escaneo reutilizables, como mucho max_workers a la vez"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._idle: List[_ScanWorker] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> Optional[_ScanWorker]:
+        """Un proceso libre, o None si no hay ninguno antes de timeout"""
+        if not (self._slots.acquire(timeout=timeout) if timeout > 0 else self._slots.acquire(blocking=False)):
+            return None
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return _ScanWorker()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, worker: _ScanWorker, healthy: bool = True) -> None:
+        """Devuelve el proceso; uno con un bloque a medias (o roto) se mata"""
+        if healthy:
+            with self._lock:
+                self._idle.append(worker)
+        else:
+            worker.kill()
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.kill()
+
+
+def _get_pool() -> _WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _WorkerPool(max(1, min(8, (os.cpu_count() or 2) - 1)))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def search_file(path: str, regex: re.Pattern, context: int = 2, max_matches: int = 1000,
+                max_bytes: Optional[int] = None, start_offset: int = 0, start_line: int = 1,
+                chunk_bytes: int = CHUNK_BYTES, parallel: Optional[bool] = None,
+                chunk_timeout: float = CHUNK_TIMEOUT_SECONDS,
+                cancelled: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """
+    Genera {"type": "match", ...} en orden de archivo y termina con
+    {"type": "summary", ...}. Los números de línea empiezan en start_line
+    (el que devolvió el resumen anterior al continuar desde start_offset).
+    
+    Un bloque que tarda más de chunk_timeout corta la búsqueda
+    (stopped_by "timeout"). Con cancelled activado el generador termina
+    sin resumen en cuanto lo comprueba.
+    """
+    size = os.path.getsize(path)
+    start_offset = min(max(0, start_offset), size)
+    end = size if max_bytes is None else min(size, start_offset + max_bytes)
+    context = max(0, context)
+
+    bounds = _chunk_bounds(path, start_offset, end, chunk_bytes) if size else []
+    if parallel is None:
+        parallel = end - start_offset >= PARALLEL_THRESHOLD_BYTES and len(bounds) > 1
+
+    pool = _get_pool()
+    window = pool.max_workers if parallel else 1
+    # Bloques en curso: (inicio, fin, proceso, plazo)
+    pending: deque = deque()
+    remaining = iter(bounds)
+
+    def is_cancelled() -> bool:
+        return cancelled is not None and cancelled.is_set()
+
+    def fill() -> bool:
+        """
+        Envía bloques hasta llenar la ventana. Solo espera un proceso libre
+        si no hay ninguno en curso; False si se canceló mientras esperaba.
+        """
+        while len(pending) < window:
+            worker = pool.acquire(0 if pending else POLL_SECONDS)
+            if worker is None:
+                if pending:
+                    return True
+                if is_cancelled():
+                    return False
+                continue
+            for chunk_start, chunk_end in remaining:
+                worker.submit((path, regex.pattern, regex.flags, chunk_start, chunk_end, context, max_matches))
+                pending.append((chunk_start, chunk_end, worker, time.monotonic() + chunk_timeout))
+                break
+            else:
+                pool.release(worker)
+                return True
+        return True
+
+    def results():
+        nonlocal stopped
+        if not fill():
+            return
+        while pending:
+            chunk_start, chunk_end, worker, deadline = pending[0]
+            while not worker.ready(min(POLL_SECONDS, max(0.0, deadline - time.monotonic()))):
+                if is_cancelled():
+                    return
+                if time.monotonic() >= deadline:
+                    stopped = "timeout"
+                    return
+            pending.popleft()
+            try:
+                result = worker.result()
+            except BaseException:
+                pool.release(worker, healthy=False)
+                raise
+            pool.release(worker)
+            if not fill():
+                return
+            yield chunk_start, chunk_end, result
+
+    found = 0
+    line_base = start_line
+    scanned_to = start_offset
+    stopped = None
+    try:
+        for chunk_start, chunk_end, (newlines, matches) in results():
+            for offset, line_end, line_index, text, col_start, col_end, before, after in matches:
+                yield {
+                    "type": "match",
+                    "line": line_base + line_index,
+                    "offset": offset,
+                    "text": text,
+                    "columns": [col_start, col_end],
+                    "before": before,
+                    "after": after,
+                }
+                found += 1
+                if found >= max_matches:
+                    stopped = "max_matches"
+                    # Continuar desde la línea siguiente a la última coincidencia
+                    scanned_to = min(line_end + 1, size)
+                    line_base += line_index + 1
+                    break
+            if stopped:
+                break
+            line_base += newlines
+            scanned_to = chunk_end
+    finally:
+        # Bloques a medias: sus procesos seguirían escaneando
+        while pending:
+            pool.release(pending.popleft()[2], healthy=False)
+
+    if is_cancelled():
+        return
+    if stopped is None and scanned_to < size:
+        stopped = "max_bytes"
+
+    yield {
+        "type": "summary",
+        "matches": found,
+        "bytes_scanned": scanned_to - start_offset,
+        "file_size": size,
+        "complete": stopped is None,
+        "stopped_by": stopped,
+        "next_offset": scanned_to if stopped else None,
+        "next_line": line_base if stopped else None,
+    }
+
+
+class SearchStream:
+    """
+    search_file consumido desde el threadpool. cancel() se puede llamar
+    desde otro hilo (el cliente se desconectó) aunque haya un next_item()
+    en curso: los bloques pendientes se cancelan sin esperar a que terminen.
+    """
+
+    def __init__(self, path: str, regex: re.Pattern, **kwargs):
+        self._cancelled = threading.Event()
+        self._results = search_file(path, regex, cancelled=self._cancelled, **kwargs)
+        self._lock = threading.Lock()
+
+    def next_item(self) -> Optional[Dict]:
+        """Siguiente objeto, o None al terminar o tras cancel()"""
+        with self._lock:
+            item = None if self._cancelled.is_set() else next(self._results, None)
+            if self._cancelled.is_set():
+                self._results.close()
+                return None
+            return item
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        # Si hay un next_item() en curso, él cierra el generador al volver
+        if self._lock.acquire(blocking=False):
+            try:
+                self._results.close()
+            finally:
+                self._lock.release()
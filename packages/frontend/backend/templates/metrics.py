@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Métricas Prometheus
+==================================
+
+Superficie de métricas del backend FastAPI:
+- Latencia por ruta (histograma) y peticiones en curso (gauge)
+- Duración y código de salida de comandos Slurm (sbatch, squeue, scancel, sacct)
+- Bytes subidos/descargados/previsualizados por UserFileManager
+- Aciertos/fallos de las cachés del backend
+- Llamadas ejecutadas/coalescidas por single-flight
+
+Las métricas se crean con sus hijos de etiquetas ya resueltos (pre-bound)
+para que instrumentar una petición no reserve diccionarios de etiquetas.
+
+Si prometheus_client no está instalado todas las métricas son no-op y
+/metrics devuelve un cuerpo vacío.
+"""
+
+import os
+import time
+from typing import Callable, Dict, Tuple
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _NoopMetric:
+    """Sustituto sin coste cuando prometheus_client no está disponible"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, amount):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+
+def _metric(kind: str, *args, **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[kind](*args, **kwargs)
+
+
+# Buckets pensados para una API interactiva y para comandos de Slurm
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLURM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+SLURM_COMMANDS = ("sbatch", "squeue", "scancel", "sacct")
+FILE_OPERATIONS = ("upload", "download", "preview")
+
+HTTP_REQUEST_DURATION = _metric(
+    "histogram", "atrox_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta", ["method", "route"], buckets=HTTP_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = _metric(
+    "gauge", "atrox_http_requests_in_flight",
+    "Peticiones HTTP en curso por ruta", ["method", "route"], multiprocess_mode="livesum",
+)
+HTTP_REQUESTS_TOTAL = _metric(
+    "counter", "atrox_http_requests",
+    "Peticiones HTTP completadas por ruta y código de estado", ["method", "route", "status"],
+)
+
+SLURM_COMMAND_DURATION = _metric(
+    "histogram", "atrox_slurm_command_duration_seconds",
+    "Duración de los comandos Slurm", ["command"], buckets=SLURM_BUCKETS,
+)
+SLURM_COMMANDS_TOTAL = _metric(
+    "counter", "atrox_slurm_commands",
+    "Comandos Slurm ejecutados por código de salida", ["command", "exit_status"],
+)
+
+FILE_BYTES = _metric(
+    "counter", "atrox_file_bytes",
+    "Bytes transferidos por UserFileManager", ["operation"],
+)
+
+CACHE_REQUESTS = _metric(
+    "counter", "atrox_cache_requests",
+    "Consultas a cachés del backend", ["cache", "result"],
+)
+
+SINGLEFLIGHT_CALLS = _metric(
+    "counter", "atrox_singleflight_calls",
+    "Llamadas a operaciones coalescidas (executed o coalesced)", ["operation", "result"],
+)
+
+
+# Hijos pre-resueltos: el camino caliente solo hace observe()/inc()
+_SLURM_DURATION_CHILDREN = {cmd: SLURM_COMMAND_DURATION.labels(cmd) for cmd in SLURM_COMMANDS}
+_SLURM_EXIT_CHILDREN: Dict[Tuple[str, str], object] = {}
+FILE_BYTES_CHILDREN = {op: FILE_BYTES.labels(op) for op in FILE_OPERATIONS}
+
+
+class RouteMetrics:
+    """Hijos de métricas de una ruta concreta, resueltos una sola vez"""
+
+    __slots__ = ("method", "route", "duration", "in_flight", "_status_children")
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.duration = HTTP_REQUEST_DURATION.labels(method, route)
+        self.in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        self._status_children: Dict[int, object] = {}
+
+    def status(self, code: int):
+        child = self._status_children.get(code)
+        if child is None:
+            child = HTTP_REQUESTS_TOTAL.labels(self.method, self.route, str(code))
+            self._status_children[code] = child
+        return child
+
+
+def observe_slurm_command(command: str, duration: float, exit_status: str) -> None:
+    """Registra la ejecución de un comando Slurm (exit_status: código como texto, 'timeout' o 'error')"""
+    child = _SLURM_DURATION_CHILDREN.get(command)
+    if child is None:
+        child = _SLURM_DURATION_CHILDREN[command] = SLURM_COMMAND_DURATION.labels(command)
+    child.observe(duration)
+
+    key = (command, exit_status)
+    counter = _SLURM_EXIT_CHILDREN.get(key)
+    if counter is None:
+        counter = _SLURM_EXIT_CHILDREN[key] = SLURM_COMMANDS_TOTAL.labels(*key)
+    counter.inc()
+
+
+def record_file_bytes(operation: str, amount: int) -> None:
+    """Suma bytes a la operación de archivos indicada (upload/download/preview)"""
+    if amount > 0:
+        FILE_BYTES_CHILDREN[operation].inc(amount)
+
+
+def cache_counters(cache_name: str):
+    """
+    Devuelve los contadores (hit, miss) pre-resueltos de una caché.
+
+    Uso:
+        hits, misses = cache_counters("user_tokens")
+        ...
+        hits.inc() if found else misses.inc()
+    """
+    return CACHE_REQUESTS.labels(cache_name, "hit"), CACHE_REQUESTS.labels(cache_name, "miss")
+
+
+def singleflight_counters(operation: str):
+    """Devuelve los contadores (executed, coalesced) pre-resueltos de una operación"""
+    return (SINGLEFLIGHT_CALLS.labels(operation, "executed"),
+            SINGLEFLIGHT_CALLS.labels(operation, "coalesced"))
+
+
+def instrument_handler(route_metrics: RouteMetrics, handler: Callable) -> Callable:
+    """Envuelve el handler ASGI de una ruta con latencia, in-flight y estado"""
+    duration = route_metrics.duration
+    in_flight = route_metrics.in_flight
+    perf_counter = time.perf_counter
+
+    async def instrumented(request):
+        in_flight.inc()
+        start = perf_counter()
+        status_code = 500
+        try:
+            response = await handler(request)
+            status_code = response.status_code
+            return response
+        except Exception as exc:
+            status_code = getattr(exc, "status_code", 500)
+            raise
+        finally:
+            duration.observe(perf_counter() - start)
+            in_flight.dec()
+            route_metrics.status(status_code).inc()
+
+    return instrumented
+
+
+def render_latest() -> bytes:
+    """Genera la exposición de texto de Prometheus (multiproceso si está configurado)"""
+    if not PROMETHEUS_AVAILABLE:
+        return b""
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Profiling de peticiones
+======================================
+
+Middleware ASGI para diagnosticar peticiones lentas:
+- Profiling bajo demanda de una petición (cabecera X-Atrox-Profile o
+  parámetro ?__profile=) con un profiler de muestreo o con cProfile.
+  Solo se activa si `authorize` confirma que el usuario es admin.
+- Captura automática de muestras de pila y tiempos de cualquier petición
+  que supere un umbral, guardadas en un ring buffer acotado.
+
+Solo se muestrean los hilos de la propia petición: los endpoints síncronos
+corren en el threadpool, así que la ruta los envuelve con
+bind_request_thread para asociar el hilo que los ejecuta (y perfilarlo con
+cProfile en ese hilo). Sin endpoint síncrono en curso se usa el hilo del
+bucle de eventos.
+
+Los perfiles de muestreo se guardan en formato "folded" (una pila por
+línea con su número de muestras), listo para flamegraph.pl o speedscope.
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import itertools
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from urllib.parse import parse_qs
+
+PROFILE_HEADER = b"x-atrox-profile"
+PROFILE_QUERY_PARAM = "__profile"
+PROFILE_ID_HEADER = b"x-atrox-profile-id"
+
+
+def _fold_stack(frame) -> str:
+    """Convierte un frame en una pila folded 'raíz;...;hoja'"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class _RequestThreads:
+    """Hilos que trabajan para una petición"""
+    __slots__ = ("loop_thread", "workers", "cprofile", "profiles")
+
+    def __init__(self, cprofile: bool = False):
+        self.loop_thread = threading.get_ident()
+        self.workers: set = set()
+        # Modo cProfile: un perfil por ejecución en el threadpool
+        self.cprofile = cprofile
+        self.profiles: List[cProfile.Profile] = []
+
+    def idents(self) -> tuple:
+        """Hilos a muestrear: los del threadpool en curso o, si no hay, el del bucle"""
+        return tuple(self.workers) or (self.loop_thread,)
+
+
+_current_request: ContextVar[Optional[_RequestThreads]] = ContextVar("atrox_request_threads", default=None)
+
+
+def bind_request_thread(call: Callable) -> Callable:
+    """
+    Envuelve un endpoint síncrono para que el hilo del threadpool que lo
+    ejecuta quede asociado a la petición en curso. Los endpoints async se
+    devuelven tal cual (corren en el hilo del bucle).
+    """
+    if inspect.iscoroutinefunction(call) or inspect.iscoroutinefunction(getattr(call, "__call__", None)):
+        return call
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        threads = _current_request.get()
+        if threads is None:
+            return call(*args, **kwargs)
+        ident = threading.get_ident()
+        threads.workers.add(ident)
+        profiler = None
+        if threads.cprofile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python >= 3.12: el perfil del bucle ya es global y cubre este hilo
+                profiler = None
+        try:
+            return call(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                threads.profiles.append(profiler)
+            threads.workers.discard(ident)
+
+    wrapper.__atrox_bound__ = True
+    return wrapper
+
+
+def _sample_threads(idents: tuple, samples: Counter, max_stacks: int, frames: Optional[Dict] = None):
+    """Toma una muestra de la pila de los hilos indicados"""
+    if frames is None:
+        frames = sys._current_frames()
+    for thread_id in idents:
+        frame = frames.get(thread_id)
+        if frame is None:
+            continue
+        stack = _fold_stack(frame)
+        if stack in samples or len(samples) < max_stacks:
+            samples[stack] += 1
+
+
+def to_folded(samples: Counter) -> str:
+    """Serializa muestras en formato folded (flamegraph)"""
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+
+
+class SamplingProfiler:
+    """
+    Profiler de muestreo basado en sys._current_frames().
+    Muestrea desde un hilo propio solo los hilos de una petición.
+    """
+
+    def __init__(self, threads: _RequestThreads, interval: float = 0.002, max_stacks: int = 5000):
+        self.threads = threads
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="atrox-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            _sample_threads(self.threads.idents(), self.samples, self.max_stacks)
+
+
+class ProfileStore:
+    """Ring buffers acotados de perfiles bajo demanda y peticiones lentas"""
+
+    def __init__(self, max_profiles: int = 20, max_slow_requests: int = 100):
+        self.profiles: Dict[int, Dict] = {}
+        self._profile_order: Deque[int] = deque()
+        self.max_profiles = max_profiles
+        self.slow_requests: Deque[Dict] = deque(maxlen=max_slow_requests)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_profile(self, profile: Dict) -> int:
+        with self._lock:
+            profile_id = next(self._ids)
+            profile["id"] = profile_id
+            self.profiles[profile_id] = profile
+            self._profile_order.append(profile_id)
+            while len(self._profile_order) > self.max_profiles:
+                self.profiles.pop(self._profile_order.popleft(), None)
+            return profile_id
+
+    def get_profile(self, profile_id: int) -> Optional[Dict]:
+        return self.profiles.get(profile_id)
+
+    def list_profiles(self) -> List[Dict]:
+        return [
+            {k: v for k, v in self.profiles[pid].items() if k != "output"}
+            for pid in reversed(self._profile_order) if pid in self.profiles
+        ]
+
+    def add_slow_request(self, entry: Dict):
+        with self._lock:
+            entry["id"] = next(self._ids)
+            self.slow_requests.append(entry)
+
+
+class _ActiveRequest:
+    __slots__ = ("method", "path", "start", "threads", "samples")
+
+    def __init__(self, method: str, path: str, start: float, threads: _RequestThreads):
+        self.method = method
+        self.path = path
+        self.start = start
+        self.threads = threads
+        self.samples: Optional[Counter] = None
+
+
+class SlowRequestWatchdog:
+    """
+    Hilo vigilante que muestrea las pilas mientras haya peticiones por
+    encima del umbral. Sin peticiones lentas solo despierta y compara tiempos.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.01, max_stacks: int = 500):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.active: Dict[int, _ActiveRequest] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="atrox-slow-watchdog", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            slow = [req for req in list(self.active.values()) if now - req.start >= self.threshold]
+            if not slow:
+                continue
+
+            # Una sola captura de pilas; cada petición lenta se queda con las de sus hilos
+            frames = sys._current_frames()
+            for req in slow:
+                if req.samples is None:
+                    req.samples = Counter()
+                _sample_threads(req.threads.idents(), req.samples, self.max_stacks, frames)
+            del frames
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI de profiling bajo demanda y captura de peticiones lentas
+
+    authorize(scope) debe devolver True solo para administradores.
+    """
+
+    def __init__(self, app, store: ProfileStore,
+                 authorize: Callable[[Dict], Awaitable[bool]],
+                 slow_threshold: float = 1.0,
+                 sample_interval: float = 0.002):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        self.sample_interval = sample_interval
+        self.watchdog = SlowRequestWatchdog(slow_threshold) if slow_threshold > 0 else None
+        self._request_ids = itertools.count()
+        # cProfile no admite dos perfiles activos a la vez en el mismo proceso
+        self._cprofile_lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        if mode and await self.authorize(scope):
+            await self._profile_request(scope, receive, send, mode)
+            return
+
+        if self.watchdog is None:
+            await self.app(scope, receive, send)
+            return
+
+        self.watchdog.ensure_started()
+        request_id = next(self._request_ids)
+        threads = _RequestThreads()
+        active = _ActiveRequest(scope["method"], scope["path"], time.perf_counter(), threads)
+        status_holder = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        self.watchdog.active[request_id] = active
+        context_token = _current_request.set(threads)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(context_token)
+            self.watchdog.active.pop(request_id, None)
+            duration = time.perf_counter() - active.start
+            if duration >= self.watchdog.threshold:
+                self.store.add_slow_request({
+                    "method": active.method,
+                    "path": active.path,
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status_holder[0],
+                    "duration_ms": round(duration * 1000, 2),
+                    "timestamp": datetime.now().isoformat(),
+                    "samples": sum(active.samples.values()) if active.samples else 0,
+                    "folded": to_folded(active.samples) if active.samples else "",
+                })
+
+    def _requested_mode(self, scope) -> Optional[str]:
+        """Modo de profiling pedido: 'sample', 'cprofile' o None"""
+        value = None
+        for name, header_value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                value = header_value.decode("latin-1")
+                break
+
+        if value is None and PROFILE_QUERY_PARAM.encode() in scope.get("query_string", b""):
+            params = parse_qs(scope["query_string"].decode("latin-1"))
+            value = params.get(PROFILE_QUERY_PARAM, [None])[0]
+
+        if not value or value in {"0", "false"}:
+            return None
+        return "cprofile" if value == "cprofile" else "sample"
+
+    async def _profile_request(self, scope, receive, send, mode: str):
+        """Ejecuta una petición bajo el profiler y guarda el resultado"""
+        profile = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "mode": mode,
+            "timestamp": datetime.now().isoformat(),
+        }
+        profile_id = self.store.add_profile(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER, str(profile_id).encode())
+                ]
+            await send(message)
+
+        if mode == "cprofile" and not self._cprofile_lock.acquire(blocking=False):
+            mode = profile["mode"] = "sample"
+
+        threads = _RequestThreads(cprofile=mode == "cprofile")
+        context_token = _current_request.set(threads)
+        start = time.perf_counter()
+        if mode == "cprofile":
+            # El perfil del bucle solo se usa si la petición no pasó por el
+            # threadpool (endpoint async): puede incluir otras peticiones
+            loop_profiler = cProfile.Profile()
+            loop_profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                loop_profiler.disable()
+                _current_request.reset(context_token)
+                self._cprofile_lock.release()
+                output = io.StringIO()
+                profiles = threads.profiles or [loop_profiler]
+                pstats.Stats(*profiles, stream=output).sort_stats("cumulative").print_stats(60)
+                profile["format"] = "pstats"
+                profile["thread"] = "threadpool" if threads.profiles else "event_loop"
+                profile["output"] = output.getvalue()
+        else:
+            sampler = SamplingProfiler(threads, self.sample_interval)
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _current_request.reset(context_token)
+                samples = sampler.stop()
+                profile["format"] = "folded"
+                profile["samples"] = sum(samples.values())
+                profile["output"] = to_folded(samples)
+
+        profile["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Serialización rápida
+===================================
+
+Respuestas JSON rápidas y streaming NDJSON para los endpoints de listas:
+- FastJSONResponse: usa orjson (dataclasses, datetime y Path nativos)
+  y cae a json estándar si orjson no está instalado
+- ndjson_response: emite un objeto por línea a medida que el generador
+  de origen los produce (primer byte inmediato, memoria constante)
+- list_response: elige entre ambos según la cabecera Accept
+"""
+
+import dataclasses
+import json
+from datetime import date, datetime
+from pathlib import PurePath
+from typing import Any, Iterable, Iterator
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Tamaño de los bloques NDJSON tras el primer elemento
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+def _default(obj: Any):
+    """Tipos que ninguno de los serializadores conoce de forma nativa"""
+    if hasattr(obj, "model_dump"):  # Pydantic v2
+        return obj.model_dump()
+    if hasattr(obj, "dict"):  # Pydantic v1
+        return obj.dict()
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Solo se llega aquí sin orjson
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        """Serializa a JSON (bytes)"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps_line(obj: Any) -> bytes:
+        """Serializa a una línea NDJSON (bytes terminados en salto de línea)"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+    def loads(data) -> Any:
+        """Deserializa JSON desde bytes o memoryview (sin copiar con orjson)"""
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> bytes:
+        """Serializa a JSON (bytes)"""
+        return _encoder.encode(obj).encode("utf-8")
+
+    def dumps_line(obj: Any) -> bytes:
+        """Serializa a una línea NDJSON (bytes terminados en salto de línea)"""
+        return dumps(obj) + b"\n"
+
+    def loads(data) -> Any:
+        """Deserializa JSON desde bytes o memoryview"""
+        return json.loads(bytes(data))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que serializa con orjson cuando está disponible"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def iter_ndjson(items: Iterable[Any]) -> Iterator[bytes]:
+    """
+    Convierte un iterable en bloques NDJSON.
+    El primer elemento sale solo (TTFB mínimo); el resto se agrupa en
+    bloques de ~64KB para no pagar un envío ASGI por elemento.
+    """
+    iterator = iter(items)
+    for first in iterator:
+        yield dumps_line(first)
+        break
+
+    buffer = []
+    size = 0
+    for item in iterator:
+        line = dumps_line(item)
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer.clear()
+            size = 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def ndjson_response(items: Iterable[Any], headers=None) -> StreamingResponse:
+    """Respuesta NDJSON en streaming (generadores síncronos van al threadpool)"""
+    return StreamingResponse(iter_ndjson(items), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+def wants_ndjson(request: Request) -> bool:
+    """True si el cliente pide NDJSON en la cabecera Accept"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def list_response(request: Request, items: Iterable[Any], headers=None):
+    """
+    Devuelve una lista como NDJSON en streaming o como un único JSON.
+    Se salta la validación de response_model: los elementos ya vienen
+    tipados de los managers (dataclasses) o de modelos Pydantic.
+    """
+    if wants_ndjson(request):
+        return ndjson_response(items, headers=headers)
+    return FastJSONResponse(list(items), headers=headers)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Estado compartido entre workers
+==============================================
+
+Snapshots de cola de trabajos y nodos compartidos entre workers de uvicorn:
+- Un único worker (líder elegido) consulta Slurm y publica los snapshots
+- El resto los lee sin volver a consultar Slurm
+
+Backends:
+- local: en proceso (un solo worker, desarrollo)
+- shm: memoria compartida POSIX con seqlock; los lectores deserializan
+  directamente sobre el buffer compartido (sin copia) y la elección de
+  líder usa flock sobre un archivo de bloqueo
+- redis: Redis local (el mismo REDIS_URL que usa el lado Node); la
+  elección de líder usa SET NX con expiración
+
+Formato compacto: {"fields": [...], "rows": [[...], ...]} serializado con
+orjson. Cada worker mantiene el snapshot decodificado por generación, así
+que solo decodifica cuando el líder publica uno nuevo.
+"""
+
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+import typing
+import uuid
+from dataclasses import fields as dataclass_fields
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from serialization import dumps, loads
+
+# Cabecera del segmento shm: generación (seqlock), longitud del payload, timestamp
+_SHM_HEADER = struct.Struct("<QQd")
+
+
+class SnapshotCodec:
+    """Codifica listas de dataclasses en formato columnar compacto y las reconstruye"""
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.fields = [f.name for f in dataclass_fields(cls)]
+        hints = typing.get_type_hints(cls)
+        self._datetime_indexes = [
+            i for i, name in enumerate(self.fields)
+            if hints[name] is datetime or datetime in typing.get_args(hints[name])
+        ]
+
+    def encode(self, items) -> bytes:
+        names = self.fields
+        return dumps({"fields": names, "rows": [[getattr(item, n) for n in names] for item in items]})
+
+    def decode(self, data) -> list:
+        payload = loads(data)
+        names = payload["fields"]
+        if names != self.fields:  # snapshot publicado por otra versión del código
+            return []
+        cls = self.cls
+        items = []
+        for row in payload["rows"]:
+            for i in self._datetime_indexes:
+                if row[i] is not None:
+                    row[i] = datetime.fromisoformat(row[i])
+            items.append(cls(*row))
+        return items
+
+
+# ---------------------------------------------------------------------------
+# Backends de almacenamiento
+# ---------------------------------------------------------------------------
+
+class LocalBackend:
+    """Snapshots en memoria del propio proceso"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[int, bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, name: str, payload: bytes):
+        with self._lock:
+            generation = self._data.get(name, (0, b"", 0.0))[0] + 1
+            self._data[name] = (generation, payload, time.time())
+
+    def touch(self, name: str):
+        with self._lock:
+            if name in self._data:
+                generation, payload, _ = self._data[name]
+                self._data[name] = (generation, payload, time.time())
+
+    def header(self, name: str) -> Tuple[int, float]:
+        entry = self._data.get(name, (0, b"", 0.0))
+        return entry[0], entry[2]
+
+    def read(self, name: str, decode: Callable):
+        """Devuelve (generación, objeto decodificado, timestamp) o None"""
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        return entry[0], decode(entry[1]), entry[2]
+
+    def close(self):
+        pass
+
+
+class SharedMemoryBackend:
+    """
+    Un segmento de memoria compartida por snapshot, protegido por seqlock:
+    el escritor pone la generación en impar mientras escribe y en par al
+    terminar; el lector reintenta si la generación cambia durante la lectura.
+    """
+
+    def __init__(self, prefix: str = "atrox_state", size: int = 16 * 1024 * 1024):
+        self.prefix = prefix
+        self.size = size
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def _segment(self, name: str):
+        segment = self._segments.get(name)
+        if segment is not None:
+            return segment
+
+        from multiprocessing import resource_tracker, shared_memory
+
+        with self._lock:
+            if name in self._segments:
+                return self._segments[name]
+            shm_name = f"{self.prefix}_{name}"
+            try:
+                segment = shared_memory.SharedMemory(name=shm_name, create=True, size=self.size)
+            except FileExistsError:
+                segment = shared_memory.SharedMemory(name=shm_name)
+            # El segmento vive más que cualquier worker: que el resource_tracker
+            # no lo elimine cuando el worker que lo creó termine
+            try:
+                resource_tracker.unregister(segment._name, "shared_memory")
+            except Exception:
+                pass
+            self._segments[name] = segment
+            return segment
+
+    def publish(self, name: str, payload: bytes):
+        segment = self._segment(name)
+        capacity = segment.size - _SHM_HEADER.size
+        if len(payload) > capacity:
+            raise ValueError(f"Snapshot '{name}' ({len(payload)} bytes) excede el segmento ({capacity} bytes)")
+
+        buf = segment.buf
+        generation, length, published_at = _SHM_HEADER.unpack_from(buf, 0)
+        if generation % 2:  # un líder anterior murió a mitad de escritura
+            generation += 1
+        _SHM_HEADER.pack_into(buf, 0, generation + 1, length, published_at)
+        buf[_SHM_HEADER.size:_SHM_HEADER.size + len(payload)] = payload
+        _SHM_HEADER.pack_into(buf, 0, generation + 2, len(payload), time.time())
+
+    def touch(self, name: str):
+        # Solo el timestamp (offset 16): no invalida a los lectores
+        struct.pack_into("<d", self._segment(name).buf, 16, time.time())
+
+    def header(self, name: str) -> Tuple[int, float]:
+        generation, _, published_at = _SHM_HEADER.unpack_from(self._segment(name).buf, 0)
+        return generation - (generation % 2), published_at
+
+    def read(self, name: str, decode: Callable, retries: int = 50):
+        buf = self._segment(name).buf
+        for _ in range(retries):
+            generation, length, published_at = _SHM_HEADER.unpack_from(buf, 0)
+            if generation == 0:
+                return None
+            if generation % 2:
+                time.sleep(0.0005)
+                continue
+            view = buf[_SHM_HEADER.size:_SHM_HEADER.size + length]
+            try:
+                value = decode(view)
+            except ValueError:
+                value = None  # escritura concurrente: payload inconsistente
+            finally:
+                view.release()
+            if value is not None and _SHM_HEADER.unpack_from(buf, 0)[0] == generation:
+                return generation, value, published_at
+        return None
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
+
+class RedisBackend:
+    """Snapshots en Redis: {prefix}:{name}:gen / :data / :ts"""
+
+    def __init__(self, url: str, prefix: str = "atrox:state"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _keys(self, name: str):
+        base = f"{self.prefix}:{name}"
+        return f"{base}:gen", f"{base}:data", f"{base}:ts"
+
+    def publish(self, name: str, payload: bytes):
+        gen_key, data_key, ts_key = self._keys(name)
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(data_key, payload)
+            pipe.set(ts_key, time.time())
+            pipe.incr(gen_key)
+            pipe.execute()
+
+    def touch(self, name: str):
+        self.client.set(self._keys(name)[2], time.time())
+
+    def header(self, name: str) -> Tuple[int, float]:
+        gen_key, _, ts_key = self._keys(name)
+        generation, published_at = self.client.mget(gen_key, ts_key)
+        return int(generation or 0), float(published_at or 0)
+
+    def read(self, name: str, decode: Callable):
+        generation, payload, published_at = self.client.mget(*self._keys(name))
+        if generation is None or payload is None:
+            return None
+        return int(generation), decode(payload), float(published_at or 0)
+
+    def close(self):
+        self.client.close()
+
+
+# ---------------------------------------------------------------------------
+# Elección de líder
+# ---------------------------------------------------------------------------
+
+class AlwaysLeader:
+    """Un solo worker: siempre es el líder"""
+
+    def try_acquire(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+
+class FileLockLeader:
+    """
+    Líder = el worker que tiene el flock exclusivo. Si muere, el kernel
+    libera el bloqueo y otro worker lo toma en su siguiente intento.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class RedisLeader:
+    """Líder = quien tiene la clave de bloqueo en Redis (SET NX PX, renovada)"""
+
+    _RENEW = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    )
+
+    def __init__(self, client, key: str, ttl: float):
+        self.client = client
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.token = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._renew = client.register_script(self._RENEW)
+
+    def try_acquire(self) -> bool:
+        if self._renew(keys=[self.key], args=[self.token, self.ttl_ms]):
+            return True
+        return bool(self.client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def release(self):
+        if self.client.get(self.key) == self.token.encode():
+            self.client.delete(self.key)
+
+
+# ---------------------------------------------------------------------------
+# Almacén de snapshots
+# ---------------------------------------------------------------------------
+
+class _Snapshot:
+    __slots__ = ("name", "codec", "producer", "generation", "items", "last_digest")
+
+    def __init__(self, name: str, codec: SnapshotCodec, producer: Callable[[], list]):
+        self.name = name
+        self.codec = codec
+        self.producer = producer
+        self.generation = 0
+        self.items: Optional[list] = None
+        self.last_digest: Optional[bytes] = None
+
+
+class SnapshotStore:
+    """
+    Snapshots compartidos de estado de Slurm.
+
+    Todos los workers ejecutan el hilo de refresco, pero solo el líder
+    llama a los productores y publica; los demás únicamente leen.
+    """
+
+    def __init__(self, backend, leader, interval: float = 5.0, max_age: Optional[float] = None):
+        self.backend = backend
+        self.leader = leader
+        self.interval = interval
+        # Un snapshot más viejo que max_age se ignora (p.ej. líder caído)
+        self.max_age = max_age if max_age is not None else interval * 6
+        self._snapshots: Dict[str, _Snapshot] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._read_lock = threading.Lock()
+
+    def register(self, name: str, cls, producer: Callable[[], list]):
+        """Registra un snapshot de una lista de dataclasses `cls`"""
+        self._snapshots[name] = _Snapshot(name, SnapshotCodec(cls), producer)
+
+    def get(self, name: str) -> Optional[list]:
+        """Lista del último snapshot publicado, o None si no hay uno vigente"""
+        result = self.get_with_generation(name)
+        return result[1] if result else None
+
+    def get_with_generation(self, name: str) -> Optional[Tuple[int, list]]:
+        """
+        (generación, lista) del último snapshot vigente, o None.
+        La generación solo cambia cuando cambia el contenido, así que sirve
+        como validador HTTP.
+        """
+        snapshot = self._snapshots[name]
+        generation, published_at = self.backend.header(name)
+        if generation == 0 or time.time() - published_at > self.max_age:
+            return None
+
+        if generation != snapshot.generation:
+            with self._read_lock:
+                if generation != snapshot.generation:
+                    result = self.backend.read(name, snapshot.codec.decode)
+                    if result is None:
+                        return None
+                    snapshot.generation, snapshot.items, _ = result
+
+        return snapshot.generation, snapshot.items
+
+    def refresh(self) -> bool:
+        """Publica todos los snapshots si este worker es el líder"""
+        if not self.leader.try_acquire():
+            return False
+        for snapshot in self._snapshots.values():
+            try:
+                items = snapshot.producer()
+            except Exception:
+                continue  # se mantiene el snapshot anterior hasta max_age
+            payload = snapshot.codec.encode(items)
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            if digest == snapshot.last_digest:
+                # Sin cambios: se renueva la vigencia sin nueva generación
+                self.backend.touch(snapshot.name)
+                continue
+            self.backend.publish(snapshot.name, payload)
+            snapshot.last_digest = digest
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="atrox-snapshots", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        self.leader.release()
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                return
+
+
+def create_snapshot_store(mode: str = "local", interval: float = 5.0,
+                          shm_size: int = 16 * 1024 * 1024,
+                          redis_url: str = "redis://127.0.0.1:6379",
+                          namespace: str = "atrox_state") -> SnapshotStore:
+    """Crea el almacén de snapshots para el modo de despliegue indicado"""
+    if mode == "shm":
+        backend = SharedMemoryBackend(prefix=namespace, size=shm_size)
+        leader = FileLockLeader(os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else "/tmp",
+                                             f"{namespace}.lock"))
+    elif mode == "redis":
+        backend = RedisBackend(redis_url, prefix=namespace.replace("_", ":"))
+        leader = RedisLeader(backend.client, f"{backend.prefix}:leader", ttl=interval * 3)
+    elif mode == "local":
+        backend = LocalBackend()
+        leader = AlwaysLeader()
+    else:
+        raise ValueError(f"Modo de estado compartido desconocido: {mode}")
+
+    return SnapshotStore(backend, leader, interval=interval)
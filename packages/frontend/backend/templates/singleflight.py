@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Single-flight
+============================
+
+Colapsa llamadas concurrentes idénticas (mismo usuario, misma operación,
+mismos parámetros) en una sola ejecución y comparte el resultado con
+todos los que esperan.
+
+Pensado para los métodos síncronos de los managers, que FastAPI ejecuta
+en su threadpool. Los resultados compartidos deben tratarse como de solo
+lectura: todos los que esperaban reciben el mismo objeto.
+"""
+
+import functools
+import threading
+from typing import Callable, Dict, Hashable
+
+from metrics import singleflight_counters
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _OperationStats:
+    __slots__ = ("executions", "coalesced", "in_flight", "_executions_counter", "_coalesced_counter")
+
+    def __init__(self, name: str):
+        self.executions = 0
+        self.coalesced = 0
+        self.in_flight = 0
+        self._executions_counter, self._coalesced_counter = singleflight_counters(name)
+
+
+class SingleFlight:
+    """Grupo de single-flight con estadísticas por operación"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats: Dict[str, _OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name: str) -> _OperationStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats.setdefault(name, _OperationStats(name))
+        return stats
+
+    def do(self, name: str, key: Hashable, fn: Callable, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) o espera a la ejecución en curso con la misma clave"""
+        stats = self._operation(name)
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                stats.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                stats.executions += 1
+                stats.in_flight += 1
+                leader = True
+
+        if not leader:
+            stats._coalesced_counter.inc()
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        stats._executions_counter.inc()
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                stats.in_flight -= 1
+            call.event.set()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Estadísticas de coalescencia por operación"""
+        result = {}
+        for name, stats in list(self._stats.items()):
+            calls = stats.executions + stats.coalesced
+            result[name] = {
+                "calls": calls,
+                "executions": stats.executions,
+                "coalesced": stats.coalesced,
+                "in_flight": stats.in_flight,
+                "coalesced_ratio": round(stats.coalesced / calls, 3) if calls else 0.0,
+            }
+        return result
+
+
+# Grupo compartido por los managers del proceso
+default_group = SingleFlight()
+
+
+def coalesced(name: str, group: SingleFlight = None):
+    """
+    Decorador de métodos: las llamadas concurrentes con la misma instancia
+    y los mismos argumentos comparten una única ejecución.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (name, id(self), args, tuple(sorted(kwargs.items())) if kwargs else ())
+            try:
+                hash(key)
+            except TypeError:  # argumentos no hashables: sin coalescencia
+                return method(self, *args, **kwargs)
+            return (group or default_group).do(name, key, method, self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Backend slurmrestd
+=================================
+
+Alternativa a los comandos de Slurm (sbatch, squeue, scancel, sacct):
+habla con slurmrestd por HTTP/1.1 sobre TCP o socket Unix.
+- Pool de conexiones keep-alive (sin fork/exec ni parseo de slurm.conf
+  por llamada)
+- Peticiones en pipeline: varias consultas por conexión sin esperar a
+  cada respuesta (p. ej. el estado de todos los trabajos de un workflow)
+- JSON parseado directamente a JobStatus / NodeStatus
+
+SlurmRestJobManager mantiene las firmas de SlurmJobManager; el backend se
+elige por despliegue con ATROX_SLURM_BACKEND=cli|rest (get_job_manager en fastapi_main).
+
+StandInSlurmrestd es un servidor local que imita las rutas usadas, para
+probar el backend sin Slurm:
+
+    python slurm_rest.py
+"""
+
+import http.client
+import os
+import queue
+import re
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from job_manager import SLURM_STATE_MAP, JobStatus, NodeStatus, SlurmJobManager
+from metrics import observe_slurm_command
+from serialization import dumps, loads
+from singleflight import coalesced
+
+DEFAULT_API_VERSION = "v0.0.40"
+
+# Errores de una conexión keep-alive que el servidor ya cerró
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError,
+                            BrokenPipeError, http.client.CannotSendRequest)
+
+
+class SlurmRestError(RuntimeError):
+    """Respuesta de error de slurmrestd"""
+
+    def __init__(self, status: int, errors: Sequence):
+        self.status = status
+        self.errors = list(errors)
+        messages = [e.get("description") or e.get("error") or str(e) if isinstance(e, dict) else str(e)
+                    for e in self.errors]
+        super().__init__(f"slurmrestd {status}: {'; '.join(messages) or 'error'}")
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection sobre un socket Unix"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class _NonClosingReader:
+    """Lector compartido por las respuestas de un pipeline (close no lo cierra)"""
+
+    def __init__(self, fp):
+        self._fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def close(self):
+        pass
+
+
+class _PipelineSocket:
+    """Lo que HTTPResponse espera de un socket: solo makefile()"""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def makefile(self, *args, **kwargs):
+        return _NonClosingReader(self._reader)
+
+
+class SlurmRestClient:
+    """
+    Cliente HTTP/1.1 de slurmrestd con pool de conexiones persistentes.
+    url: "unix:///run/slurmrestd.socket" o "http://host:6820"
+    """
+
+    def __init__(self, url: str, token: Optional[str] = None, user: Optional[str] = None,
+                 api_version: str = DEFAULT_API_VERSION, pool_size: int = 8, timeout: float = 30.0,
+                 idle_timeout: float = 4.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.socket_path = parts.path if parts.scheme == "unix" else None
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6820
+        self.api_version = api_version
+        self.timeout = timeout
+        # Conexiones ociosas más tiempo que esto se descartan: el servidor
+        # puede haberlas cerrado ya (keep-alive del lado de slurmrestd)
+        self.idle_timeout = idle_timeout
+        # (conexión, instante en que volvió al pool)
+        self._pool: "queue.LifoQueue[Tuple[http.client.HTTPConnection, float]]" = queue.LifoQueue(maxsize=pool_size)
+        self.headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if token:
+            self.headers["X-SLURM-USER-TOKEN"] = token
+        if user:
+            self.headers["X-SLURM-USER-NAME"] = user
+
+    # -- pool ----------------------------------------------------------------
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.socket_path:
+            return _UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self, fresh: bool = False) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        (conexión, reutilizada). fresh=True abre siempre una conexión nueva:
+        para peticiones que no se pueden repetir si la reutilizada estaba cerrada
+        """
+        if not fresh:
+            now = time.monotonic()
+            while True:
+                try:
+                    conn, released_at = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                if now - released_at < self.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self._new_connection(), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait((conn, time.monotonic()))
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn, _released_at = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    # -- peticiones --------------------------------------------------------
+
+    def path(self, plugin: str, resource: str, params: Optional[Dict] = None) -> str:
+        """/slurm/v0.0.40/jobs?..."""
+        path = f"/{plugin}/{self.api_version}/{resource.lstrip('/')}"
+        if params:
+            path += "?" + urlencode({k: v for k, v in params.items() if v is not None})
+        return path
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None) -> Dict:
+        """Una petición; reintenta una vez si la conexión reutilizada estaba cerrada"""
+        payload = dumps(body) if body is not None else None
+        headers = dict(self.headers)
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(2):
+                # Un POST no se repite (podría haberse procesado): va siempre
+                # por una conexión nueva, que no puede estar cerrada por inactividad
+                conn, reused = self._acquire(fresh=method == "POST")
+                try:
+                    conn.request(method, path, body=payload, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except _STALE_CONNECTION_ERRORS:
+                    conn.close()
+                    if not reused or attempt:
+                        raise
+                    continue
+                except BaseException:
+                    conn.close()
+                    raise
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(conn)
+                status = str(response.status)
+                return self._decode(response.status, data)
+        finally:
+            observe_slurm_command("slurmrestd", time.perf_counter() - start, status)
+
+    def pipeline(self, requests: Sequence[Tuple[str, str]]) -> List[Dict]:
+        """
+        Envía varias peticiones sin cuerpo (GET/DELETE) por una sola
+        conexión sin esperar respuestas intermedias y las lee en orden.
+        Si el pipeline falla, las pendientes se repiten una a una.
+        """
+        if len(requests) <= 1:
+            return [self.request(method, path) for method, path in requests]
+
+        header_lines = "".join(f"{name}: {value}\r\n" for name, value in self.headers.items())
+        raw = "".join(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n{header_lines}\r\n"
+            for method, path in requests
+        ).encode("latin-1")
+
+        results: List[Dict] = []
+        start = time.perf_counter()
+        conn, _reused = self._acquire()
+        keep = True
+        try:
+            if conn.sock is None:
+                conn.connect()
+            conn.sock.sendall(raw)
+            reader = conn.sock.makefile("rb")
+            for method, _path in requests:
+                response = http.client.HTTPResponse(_PipelineSocket(reader), method=method)
+                response.begin()
+                data = response.read()
+                results.append(self._decode(response.status, data, raise_errors=False))
+                if response.will_close:
+                    keep = False
+                    break
+            observe_slurm_command("slurmrestd", time.perf_counter() - start, "200")
+        except (OSError, http.client.HTTPException):
+            keep = False
+        finally:
+            if keep and len(results) == len(requests):
+                self._release(conn)
+            else:
+                conn.close()
+
+        for method, path in requests[len(results):]:
+            try:
+                results.append(self.request(method, path))
+            except SlurmRestError as e:
+                results.append({"errors": e.errors, "_status": e.status})
+        return results
+
+    @staticmethod
+    def _decode(status: int, data: bytes, raise_errors: bool = True) -> Dict:
+        payload = loads(data) if data else {}
+        if not isinstance(payload, dict):
+            payload = {"data": payload}
+        if status >= 400:
+            if raise_errors:
+                raise SlurmRestError(status, payload.get("errors") or [])
+            payload["_status"] = status
+        return payload
+
+
+# ---------------------------------------------------------------------------
+# JSON de slurmrestd -> dataclasses
+# ---------------------------------------------------------------------------
+
+def _number(value, default=0):
+    """Números de la API: enteros o {"set": bool, "infinite": bool, "number": n}"""
+    if isinstance(value, dict):
+        if not value.get("set", True) or value.get("infinite"):
+            return default
+        return value.get("number", default)
+    return default if value is None else value
+
+
+def _timestamp(value) -> Optional[datetime]:
+    seconds = _number(value, 0)
+    return datetime.fromtimestamp(seconds) if seconds else None
+
+
+def _first(value, default=""):
+    """Estados y particiones: lista (API nueva), cadena o cadena separada por comas"""
+    if isinstance(value, list):
+        return value[0] if value else default
+    if isinstance(value, str):
+        return value.split(",")[0] if value else default
+    return default
+
+
+def _format_memory(mb: int) -> str:
+    if not mb:
+        return ""
+    return f"{mb // 1024}GB" if mb % 1024 == 0 else f"{mb}MB"
+
+
+def _gres_gpus(gres: str) -> int:
+    """'gpu:a100:4(S:0-1),shard:8' -> 4"""
+    total = 0
+    for item in (gres or "").split(","):
+        fields = item.split("(")[0].split(":")
+        if fields and fields[0] == "gpu" and fields[-1].isdigit():
+            total += int(fields[-1])
+    return total
+
+
+def job_from_json(job: Dict) -> JobStatus:
+    """Trabajo de /slurm/*/jobs"""
+    state = _first(job.get("job_state"), "PENDING")
+    status = SLURM_STATE_MAP.get(state, "queued")
+    start_time = _timestamp(job.get("start_time"))
+    end_time = _timestamp(job.get("end_time"))
+    cpus = _number(job.get("cpus"), 0)
+
+    memory_mb = _number(job.get("memory_per_node"), 0) or _number(job.get("memory_per_cpu"), 0) * cpus
+
+    progress = 0
+    if status == "completed":
+        progress = 100
+    elif status == "running" and start_time:
+        limit = _number(job.get("time_limit"), 0) * 60
+        if limit:
+            elapsed = (datetime.now() - start_time).total_seconds()
+            progress = max(0, min(99, int(100 * elapsed / limit)))
+
+    return JobStatus(
+        job_id=str(job.get("job_id")),
+        name=job.get("name", ""),
+        status=status,
+        submit_time=_timestamp(job.get("submit_time")) or datetime.now(),
+        start_time=start_time if status != "queued" else None,
+        end_time=end_time if status in ("completed", "failed") else None,
+        cpus=cpus,
+        memory=_format_memory(memory_mb),
+        user=job.get("user_name", ""),
+        progress=progress,
+        partition=job.get("partition", ""),
+    )
+
+
+def accounting_job_from_json(job: Dict) -> JobStatus:
+    """Trabajo de /slurmdb/*/jobs"""
+    state = job.get("state", {})
+    state = _first(state.get("current") if isinstance(state, dict) else state, "COMPLETED")
+    times = job.get("time", {})
+    required = job.get("required", {})
+    status = SLURM_STATE_MAP.get(state, "completed")
+    return JobStatus(
+        job_id=str(job.get("job_id")),
+        name=job.get("name", ""),
+        status=status,
+        submit_time=_timestamp(times.get("submission")) or datetime.now(),
+        start_time=_timestamp(times.get("start")),
+        end_time=_timestamp(times.get("end")),
+        cpus=_number(required.get("CPUs"), 0),
+        memory=_format_memory(_number(required.get("memory_per_node"), 0)),
+        user=job.get("user", ""),
+        progress=100 if status == "completed" else 0,
+        partition=job.get("partition", ""),
+    )
+
+
+def node_from_json(node: Dict) -> NodeStatus:
+    """Nodo de /slurm/*/nodes (cpu_load viene multiplicado por 100)"""
+    return NodeStatus(
+        name=node.get("name", ""),
+        state=_first(node.get("state"), "unknown").lower(),
+        partition=_first(node.get("partitions"), "general"),
+        cpus_total=_number(node.get("cpus"), 0),
+        cpus_alloc=_number(node.get("alloc_cpus"), 0),
+        cpu_load=_number(node.get("cpu_load"), 0) / 100.0,
+        memory_total_mb=_number(node.get("real_memory"), 0),
+        memory_alloc_mb=_number(node.get("alloc_memory"), 0),
+        gpus_total=_gres_gpus(node.get("gres", "")),
+        gpus_alloc=_gres_gpus(node.get("gres_used", "")),
+    )
+
+
+# Directivas #SBATCH -> campos de job_desc_msg
+_SBATCH_LINE = re.compile(r"^#SBATCH\s+--([\w-]+)(?:[=\s]+(\S+))?", re.MULTILINE)
+
+
+def _memory_mb(value: str) -> int:
+    match = re.fullmatch(r"(\d+)([KMGT]?)B?", value.upper())
+    if not match:
+        return 0
+    amount, unit = int(match.group(1)), match.group(2) or "M"
+    return {"K": amount // 1024, "M": amount, "G": amount * 1024, "T": amount * 1024 * 1024}[unit]
+
+
+def _minutes(value: str) -> int:
+    """
+    Límite de tiempo de Slurm -> minutos (los segundos redondean hacia arriba).
+    Formatos: M, M:S, H:M:S, D-H, D-H:M, D-H:M:S
+    """
+    days, _, clock = value.rpartition("-")
+    parts = [int(p) for p in clock.split(":")]
+    if days:
+        # Con días, lo que sigue empieza siempre por las horas
+        parts += [0] * (3 - len(parts))
+        hours, minutes, seconds = parts
+        hours += int(days) * 24
+    elif len(parts) == 3:
+        hours, minutes, seconds = parts
+    else:
+        parts += [0] * (2 - len(parts))
+        hours, (minutes, seconds) = 0, parts
+    return hours * 60 + minutes + (1 if seconds else 0)
+
+
+def job_description(script: str, extra_args: Sequence[str], cwd: str) -> Dict:
+    """Descripción del trabajo para /job/submit a partir del script y de los argumentos de sbatch"""
+    job: Dict = {"current_working_directory": cwd, "environment": ["PATH=/usr/local/bin:/usr/bin:/bin"]}
+    options = [(m.group(1), m.group(2) or "") for m in _SBATCH_LINE.finditer(script)]
+    options += [tuple(arg[2:].split("=", 1)) if "=" in arg else (arg[2:], "") for arg in extra_args]
+
+    for key, value in options:
+        if key == "job-name":
+            job["name"] = value
+        elif key == "partition":
+            job["partition"] = value
+        elif key == "cpus-per-task":
+            job["cpus_per_task"] = int(value)
+        elif key == "ntasks":
+            job["tasks"] = int(value)
+        elif key == "mem":
+            job["memory_per_node"] = {"set": True, "number": _memory_mb(value)}
+        elif key == "time":
+            job["time_limit"] = {"set": True, "number": _minutes(value)}
+        elif key == "gres":
+            job["tres_per_node"] = "gres/" + value
+        elif key == "output":
+            job["standard_output"] = value
+        elif key == "error":
+            job["standard_error"] = value
+        elif key == "dependency":
+            job["dependency"] = value
+        elif key == "kill-on-invalid-dep":
+            job["kill_on_invalid_dependency"] = value == "yes"
+        elif key == "array":
+            job["array"] = value
+        elif key == "hold":
+            job["hold"] = True
+        elif key == "export":
+            job["environment"] += [item for item in value.split(",") if "=" in item]
+    return job
+
+
+# ---------------------------------------------------------------------------
+# Gestor de trabajos sobre slurmrestd
+# ---------------------------------------------------------------------------
+
+class SlurmRestJobManager(SlurmJobManager):
+    """SlurmJobManager que usa slurmrestd en lugar de los comandos de Slurm"""
+
+    def __init__(self, base_dir: str = "/home/leoatrox", client: Optional[SlurmRestClient] = None):
+        super().__init__(base_dir)
+        self.client = client or SlurmRestClient("unix:///run/slurmrestd/slurmrestd.socket")
+
+    def _sbatch(self, script_path: Path, extra_args: Optional[List[str]] = None) -> str:
+        script = Path(script_path).read_text()
+        body = {"script": script, "job": job_description(script, extra_args or [], str(self.jobs_dir))}
+        result = self.client.request("POST", self.client.path("slurm", "job/submit"), body)
+        if result.get("errors"):
+            raise SlurmRestError(200, result["errors"])
+        return str(result.get("job_id") or result.get("result", {}).get("job_id"))
+
+    def iter_queue_status(self) -> Iterator[JobStatus]:
+        result = self.client.request("GET", self.client.path("slurm", "jobs"))
+        for job in result.get("jobs", []):
+            yield job_from_json(job)
+
+    @coalesced("get_node_status")
+    def get_node_status(self) -> List[NodeStatus]:
+        result = self.client.request("GET", self.client.path("slurm", "nodes"))
+        return [node_from_json(node) for node in result.get("nodes", [])]
+
+    def cancel_job(self, job_id: str) -> Dict:
+        try:
+            self.client.request("DELETE", self.client.path("slurm", f"job/{job_id}"))
+            return {
+                "status": "success",
+                "message": f"Trabajo {job_id} cancelado exitosamente"
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Error al cancelar trabajo: {str(e)}"
+            }
+
+    def _control_batch(self, action: str, job_ids: List[str]) -> Dict[str, Dict]:
+        """cancel: DELETE en pipeline; hold/release: actualización del trabajo; requeue: scontrol"""
+        if action == "requeue":
+            # slurmrestd no expone requeue
+            if shutil.which("scontrol"):
+                return super()._control_batch(action, job_ids)
+            return {job_id: {"status": "error", "message": "requeue no disponible en slurmrestd"}
+                    for job_id in job_ids}
+
+        if action == "cancel":
+            responses = self.client.pipeline(
+                [("DELETE", self.client.path("slurm", f"job/{job_id}")) for job_id in job_ids])
+        else:
+            responses = []
+            for job_id in job_ids:
+                try:
+                    responses.append(self.client.request(
+                        "POST", self.client.path("slurm", f"job/{job_id}"), {"hold": action == "hold"}))
+                except SlurmRestError as e:
+                    responses.append({"errors": e.errors, "_status": e.status})
+
+        results = {}
+        for job_id, response in zip(job_ids, responses):
+            errors = response.get("errors") or []
+            if errors:
+                results[job_id] = {"status": "error", "message": str(SlurmRestError(response.get("_status", 200), errors))}
+            else:
+                results[job_id] = {"status": "success", "message": ""}
+        return results
+
+    def _query_job_states(self, job_ids: List[str]) -> Dict[str, str]:
+        """Un GET por trabajo, en pipeline; los que ya no están en slurmctld se buscan en slurmdbd"""
+        states: Dict[str, str] = {}
+        responses = self.client.pipeline([("GET", self.client.path("slurm", f"job/{job_id}")) for job_id in job_ids])
+        missing = []
+        for job_id, response in zip(job_ids, responses):
+            jobs = response.get("jobs") or []
+            if not jobs:
+                missing.append(job_id)
+                continue
+            # Un job array devuelve una entrada por tarea: se agrega como en sacct
+            job_states = {job_from_json(job).status for job in jobs}
+            states[job_id] = next(
+                (s for s in ("failed", "running", "queued", "completed") if s in job_states), "unknown"
+            )
+
+        if missing:
+            responses = self.client.pipeline([("GET", self.client.path("slurmdb", f"job/{job_id}")) for job_id in missing])
+            for job_id, response in zip(missing, responses):
+                jobs = response.get("jobs") or []
+                states[job_id] = accounting_job_from_json(jobs[0]).status if jobs else "unknown"
+        return states
+
+    def iter_job_history(self, user_id: str, days: int = 30) -> Iterator[JobStatus]:
+        start = int((datetime.now() - timedelta(days=days)).timestamp())
+        result = self.client.request("GET", self.client.path("slurmdb", "jobs", {"users": user_id, "start_time": start}))
+        for job in result.get("jobs", []):
+            yield accounting_job_from_json(job)
+
+
+# ---------------------------------------------------------------------------
+# Servidor local que imita slurmrestd (pruebas y desarrollo)
+# ---------------------------------------------------------------------------
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive y pipelining
+
+    def address_string(self):
+        return str(self.client_address or "unix")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict):
+        body = dumps(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method: str):
+        state: "StandInSlurmrestd" = self.server.stand_in
+        state.count_request()
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) < 3:
+            return self._send(404, {"errors": [{"description": "Ruta desconocida"}]})
+        plugin, resource, rest = parts[0], parts[2], parts[3:]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = loads(self.rfile.read(length)) if length else None
+        status, payload = state.handle(method, plugin, resource, rest, parse_qs(url.query), body)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class _CountingMixin:
+    def get_request(self):
+        request = super().get_request()
+        self.stand_in.count_connection()
+        return request
+
+
+class _TCPServer(_CountingMixin, ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(_CountingMixin, ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class StandInSlurmrestd:
+    """
+    Servidor mínimo con las rutas de slurmrestd que usa SlurmRestJobManager.
+    address: ruta de socket Unix, o None para TCP en 127.0.0.1 (puerto libre).
+    """
+
+    def __init__(self, address: Optional[str] = None, api_version: str = DEFAULT_API_VERSION):
+        self.api_version = api_version
+        self.jobs: Dict[int, Dict] = {}
+        self.connections = 0
+        self.requests = 0
+        self._next_id = 1000
+        self._lock = threading.Lock()
+        if address:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixServer(address, _StandInHandler)
+            self.url = f"unix://{address}"
+        else:
+            self.server = _TCPServer(("127.0.0.1", 0), _StandInHandler)
+            self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.server.stand_in = self
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def handle(self, method, plugin, resource, rest, query, body) -> Tuple[int, Dict]:
+        now = int(time.time())
+        with self._lock:
+            if plugin == "slurm" and resource == "job" and rest == ["submit"] and method == "POST":
+                job = body.get("job", {})
+                self._next_id += 1
+                self.jobs[self._next_id] = {
+                    "job_id": self._next_id,
+                    "name": job.get("name", "job"),
+                    "job_state": ["PENDING"],
+                    "submit_time": {"set": True, "number": now},
+                    "start_time": {"set": True, "number": 0},
+                    "end_time": {"set": True, "number": 0},
+                    "cpus": {"set": True, "number": job.get("cpus_per_task", 1)},
+                    "memory_per_node": job.get("memory_per_node", {"set": False, "number": 0}),
+                    "time_limit": job.get("time_limit", {"set": True, "number": 60}),
+                    "user_name": "atrox",
+                    "partition": job.get("partition", "general"),
+                }
+                return 200, {"job_id": self._next_id, "errors": []}
+
+            if plugin == "slurm" and resource == "jobs":
+                return 200, {"jobs": list(self.jobs.values()), "errors": []}
+
+            if resource == "job" and rest:
+                job = self.jobs.get(int(rest[0])) if rest[0].isdigit() else None
+                if job is None:
+                    return 404, {"jobs": [], "errors": [{"description": "Trabajo no encontrado"}]}
+                if method == "POST":
+                    job["job_state"] = ["PENDING"]
+                    job["hold"] = bool(body.get("hold"))
+                    return 200, {"errors": []}
+                if method == "DELETE":
+                    job["job_state"] = ["CANCELLED"]
+                    job["end_time"] = {"set": True, "number": now}
+                    return 200, {"errors": []}
+                if plugin == "slurmdb":
+                    return 200, {"jobs": [self._accounting(job)], "errors": []}
+                return 200, {"jobs": [job], "errors": []}
+
+            if plugin == "slurm" and resource == "nodes":
+                return 200, {"nodes": [
+                    {"name": "node-01", "state": ["MIXED"], "partitions": ["general"], "cpus": 64,
+                     "alloc_cpus": 40, "cpu_load": 3850, "real_memory": 256000, "alloc_memory": 160000,
+                     "gres": "", "gres_used": ""},
+                    {"name": "node-02", "state": ["ALLOCATED"], "partitions": ["gpu"], "cpus": 64,
+                     "alloc_cpus": 64, "cpu_load": 6120, "real_memory": 512000, "alloc_memory": 384000,
+                     "gres": "gpu:a100:4(S:0-1)", "gres_used": "gpu:a100:2(IDX:0-1)"},
+                ], "errors": []}
+
+            if plugin == "slurmdb" and resource == "jobs":
+                users = query.get("users", [None])[0]
+                jobs = [self._accounting(j) for j in self.jobs.values() if users in (None, j["user_name"])]
+                return 200, {"jobs": jobs, "errors": []}
+
+        return 404, {"errors": [{"description": f"Ruta no soportada: {plugin}/{resource}"}]}
+
+    @staticmethod
+    def _accounting(job: Dict) -> Dict:
+        return {
+            "job_id": job["job_id"],
+            "name": job["name"],
+            "user": job["user_name"],
+            "partition": job["partition"],
+            "state": {"current": job["job_state"]},
+            "time": {"submission": job["submit_time"]["number"], "start": job["start_time"]["number"],
+                     "end": job["end_time"]["number"]},
+            "required": {"CPUs": job["cpus"]["number"], "memory_per_node": job["memory_per_node"]},
+        }
+
+
+if __name__ == "__main__":
+    # Comprobación del backend contra el servidor local
+    import tempfile
+
+    from job_manager import JobConfig, JobSelector, WorkflowStep
+
+    # Formatos de --time de Slurm: un número solo son minutos, D-H son días-horas
+    assert [_minutes(v) for v in ("60", "5:30", "1:00:00", "1-12", "2-3:15", "1-0:0:1")] == \
+        [60, 6, 60, 2160, 3075, 1441]
+
+    workdir = tempfile.mkdtemp(prefix="atrox_slurmrest_")
+    with StandInSlurmrestd(os.path.join(workdir, "slurmrestd.socket")) as server:
+        manager = SlurmRestJobManager(workdir, client=SlurmRestClient(server.url, token="dev"))
+        config = JobConfig(name="demo", script_path="/bin/true", cpus=4, memory="8GB",
+                           walltime="01:00:00", user_id="atrox")
+
+        submitted = manager.submit_job(config)
+        assert submitted["status"] == "success", submitted
+        workflow = manager.submit_workflow("wf", [
+            WorkflowStep("prep", config),
+            WorkflowStep("run", config, depends_on=["prep"], array_size=4),
+        ], "atrox")
+        assert workflow["status"] == "success", workflow
+
+        queue_status = manager.get_queue_status()
+        assert {job.job_id for job in queue_status} >= {submitted["job_id"], *workflow["job_ids"].values()}
+        assert manager.get_workflow_status(workflow["workflow_id"])["state"] == "queued"
+        assert manager.cancel_job(submitted["job_id"])["status"] == "success"
+        bulk = manager.bulk_control("hold", JobSelector(array_id=workflow["job_ids"]["run"], user="atrox"),
+                                    manager.get_queue_status())
+        assert bulk["matched"] == 1 and bulk["succeeded"] == 1, bulk
+        assert any(job.status == "failed" for job in manager.get_job_history("atrox"))
+        nodes = manager.get_node_status()
+        assert nodes[1].gpus_total == 4 and nodes[1].cpu_load == 61.2
+
+        calls = 200
+        start = time.perf_counter()
+        for _ in range(calls):
+            list(manager.iter_queue_status())
+        elapsed = time.perf_counter() - start
+
+        print(f"OK: {server.requests} peticiones en {server.connections} conexiones; "
+              f"cola: {1000 * elapsed / calls:.2f} ms/llamada")
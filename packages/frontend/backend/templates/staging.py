@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Staging de datos
+===============================
+
+Copia asíncrona de las entradas de un trabajo a un tier de almacenamiento
+rápido (el export de node-storage de nodes.conf, o scratch local) antes de
+que arranque, y copia opcional de los resultados de vuelta al terminar:
+- El trabajo se envía retenido (sbatch --hold) y se libera cuando termina
+  el stage-in; si el stage-in falla se cancela
+- Copias en paralelo (pool de hilos: la E/S libera el GIL)
+- Deduplicación por contenido: objetos SHA-256 en <tier>/objects; un
+  archivo ya copiado (mismo path, tamaño y mtime) no se vuelve a leer
+- El directorio de cada trabajo son hardlinks a los objetos (solo lectura)
+- Expulsión LRU (mtime de los objetos, que se actualiza al usarlos) cuando
+  el tier supera su capacidad; los objetos de trabajos activos no se expulsan
+- Stage-out: un hilo consulta el estado de los trabajos listos y, al
+  terminar, copia $ATROX_STAGE_OUT al destino del usuario
+- Estado compartido entre workers en SQLite (<tier>/staging.db): registros,
+  ocupación del tier, contadores y caché de hashes. El stage-in y el
+  stage-out los ejecuta el worker que los reclama con un lease; si ese
+  worker muere, otro reanuda el staging cuando el lease vence
+
+El trabajo ve ATROX_STAGE_DIR (entradas) y ATROX_STAGE_OUT (resultados).
+Los tiers son directorios, así que se prueba con directorios locales:
+
+    python staging.py
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Estados de un staging
+STAGING_IN = "staging_in"
+READY = "ready"  # trabajo liberado; esperando a que termine
+STAGING_OUT = "staging_out"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATES = (STAGING_IN, READY, STAGING_OUT)
+
+_COPY_BYTES = 4 * 1024 * 1024
+
+# Un stage-in preparado que no llegó a tener job id en este tiempo se da
+# por abandonado (el worker murió entre prepare y sbatch)
+_PREPARE_TIMEOUT = 3600.0
+
+_COUNTERS = ("used_bytes", "copied_bytes", "deduplicated_bytes", "evicted_bytes", "evicted_objects")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stagings (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    job_id TEXT,
+    worker TEXT,
+    lease_until REAL,
+    updated REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stagings_state ON stagings (state);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS hashes (key TEXT PRIMARY KEY, digest TEXT NOT NULL);
+"""
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _iter_sources(source: Path) -> Iterator[Tuple[Path, Path]]:
+    """
+    (archivo, ruta relativa en el directorio del trabajo) de un archivo o
+    árbol. Los enlaces simbólicos se ignoran: podrían apuntar a archivos
+    de otros usuarios que el gateway sí puede leer.
+    """
+    if source.is_symlink():
+        raise OSError(f"No se admiten enlaces simbólicos: {source.name}")
+    if source.is_dir():
+        for directory, _dirs, files in os.walk(source):  # os.walk no sigue enlaces a directorios
+            for name in files:
+                path = Path(directory) / name
+                if path.is_symlink():
+                    continue
+                yield path, Path(source.name) / path.relative_to(source)
+    else:
+        yield source, Path(source.name)
+
+
+def _is_safe_path(base_dir: Path, target_path: Path) -> bool:
+    """Verifica que el path (enlaces resueltos) esté dentro del directorio base"""
+    try:
+        target_path.resolve().relative_to(base_dir.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+class DataStager:
+    """Staging de entradas/salidas de trabajos en un tier con caché por contenido"""
+
+    def __init__(self, root: str, capacity_bytes: int, workers: int = 8, poll_interval: float = 15.0):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.jobs_dir = self.root / "jobs"
+        self.tmp_dir = self.root / "tmp"
+        for directory in (self.objects_dir, self.jobs_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self.capacity_bytes = capacity_bytes
+        self.poll_interval = poll_interval
+        self.lease_seconds = max(60.0, 4 * poll_interval)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="atrox-stage")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Estado de los trabajos (job ids -> estado AtroxGetaway) y acciones
+        # sobre el trabajo retenido; los asigna el gestor de trabajos
+        self.job_states: Optional[Callable[[List[str]], Dict[str, str]]] = None
+        self.on_stage_in: Optional[Callable[[str, bool], None]] = None
+
+        self.db_path = str(self.root / "staging.db")
+        self._local = threading.local()
+        conn = self._db()
+        conn.executescript(_SCHEMA)
+        conn.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                         [(name,) for name in _COUNTERS])
+        # Sin copias en curso en ningún worker la ocupación se recalcula
+        # desde el disco (corrige reservas perdidas por un worker caído)
+        if not any(self.tmp_dir.iterdir()):
+            used = sum(size for _path, size, _mtime in self._scan_objects())
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'used_bytes'", (used,))
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        return conn
+
+    def _counters(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+        rows = (conn or self._db()).execute("SELECT name, value FROM counters")
+        return {row["name"]: row["value"] for row in rows}
+
+    # -- objetos -----------------------------------------------------------
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _scan_objects(self) -> Iterator[Tuple[Path, int, float]]:
+        for prefix in os.scandir(self.objects_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield Path(entry.path), stat.st_size, stat.st_mtime
+
+    def _pinned(self, conn: sqlite3.Connection) -> set:
+        """Objetos de stagings activos en cualquier worker"""
+        placeholders = ",".join("?" * len(ACTIVE_STATES))
+        rows = conn.execute(f"SELECT data FROM stagings WHERE state IN ({placeholders})", ACTIVE_STATES)
+        return {item["digest"] for row in rows for item in json.loads(row["data"])["inputs"] if item.get("digest")}
+
+    def _reserve(self, size: int) -> None:
+        """
+        Hace sitio para `size` bytes expulsando los objetos menos usados;
+        la transacción serializa las reservas de todos los workers
+        """
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            used = self._counters(conn)["used_bytes"]
+            if used + size > self.capacity_bytes:
+                pinned = self._pinned(conn)
+                candidates = sorted((mtime, path, obj_size) for path, obj_size, mtime in self._scan_objects()
+                                    if path.name not in pinned)
+                evicted_bytes = evicted_objects = 0
+                for _mtime, path, obj_size in candidates:
+                    if used + size <= self.capacity_bytes:
+                        break
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        continue
+                    used -= obj_size
+                    evicted_bytes += obj_size
+                    evicted_objects += 1
+                self._add(conn, evicted_bytes=evicted_bytes, evicted_objects=evicted_objects,
+                          used_bytes=-evicted_bytes)
+                if used + size > self.capacity_bytes:
+                    conn.execute("COMMIT")
+                    raise OSError(f"Sin espacio en el tier de staging para {size} bytes")
+            self._add(conn, used_bytes=size)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _add(conn: sqlite3.Connection, **deltas: int) -> None:
+        conn.executemany("UPDATE counters SET value = value + ? WHERE name = ?",
+                         [(value, name) for name, value in deltas.items() if value])
+
+    def _count(self, counter: str, size: int) -> None:
+        self._add(self._db(), **{counter: size})
+
+    def _release(self, size: int) -> None:
+        self._add(self._db(), used_bytes=-size)
+
+    def store(self, source: Path) -> Tuple[str, int, bool]:
+        """
+        Copia un archivo al almacén de objetos: (sha256, tamaño, deduplicado).
+        Si el mismo archivo ya se copió y el objeto sigue en el tier no se lee.
+        """
+        stat = os.stat(source, follow_symlinks=False)
+        key = f"{source}|{stat.st_size}|{stat.st_mtime_ns}"
+        row = self._db().execute("SELECT digest FROM hashes WHERE key = ?", (key,)).fetchone()
+        digest = row["digest"] if row is not None else None
+        if digest is not None:
+            obj = self._object_path(digest)
+            try:
+                os.utime(obj)  # uso reciente para el LRU
+                self._count("deduplicated_bytes", stat.st_size)
+                return digest, stat.st_size, True
+            except FileNotFoundError:
+                pass  # expulsado: se vuelve a copiar
+
+        self._reserve(stat.st_size)
+        tmp = self.tmp_dir / uuid.uuid4().hex
+        try:
+            sha = hashlib.sha256()
+            # O_NOFOLLOW: el archivo pudo cambiarse por un enlace tras listarlo
+            fd = os.open(source, os.O_RDONLY | os.O_NOFOLLOW)
+            with open(fd, "rb") as src, open(tmp, "wb") as dst:
+                while True:
+                    chunk = src.read(_COPY_BYTES)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    dst.write(chunk)
+            digest = sha.hexdigest()
+            obj = self._object_path(digest)
+            obj.parent.mkdir(exist_ok=True)
+            os.chmod(tmp, 0o444)
+            try:
+                # link no sobrescribe: si otro worker guarda el mismo contenido
+                # a la vez solo uno crea el objeto y el otro deduplica
+                os.link(tmp, obj)
+                deduplicated = False
+            except FileExistsError:
+                deduplicated = True
+            except OSError:
+                # Tier sin hardlinks: comprobar y reemplazar (no atómico)
+                deduplicated = obj.exists()
+                if not deduplicated:
+                    os.replace(tmp, obj)
+            tmp.unlink(missing_ok=True)
+            if deduplicated:
+                # Mismo contenido desde otra ruta: se conserva una sola copia
+                os.utime(obj)
+                self._release(stat.st_size)
+                self._count("deduplicated_bytes", stat.st_size)
+            else:
+                self._count("copied_bytes", stat.st_size)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            self._release(stat.st_size)
+            raise
+
+        self._db().execute("INSERT OR REPLACE INTO hashes (key, digest) VALUES (?, ?)", (key, digest))
+        return digest, stat.st_size, deduplicated
+
+    def _stage_file(self, source: Path, target: Path) -> Tuple[str, int, bool]:
+        """store() + hardlink en el directorio del trabajo"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Stage-in reanudado: el enlace de un intento anterior se rehace
+        # (escribir sobre él modificaría el objeto compartido)
+        target.unlink(missing_ok=True)
+        for _attempt in range(3):
+            digest, size, deduplicated = self.store(source)
+            try:
+                os.link(self._object_path(digest), target)
+            except FileNotFoundError:
+                continue  # expulsado entre store() y link: se vuelve a copiar
+            except OSError:
+                shutil.copyfile(self._object_path(digest), target)  # sin hardlinks
+            return digest, size, deduplicated
+        raise OSError(f"No se pudo preparar {source.name}")
+
+    # -- staging -----------------------------------------------------------
+
+    def _save(self, record: Dict) -> None:
+        record["updated"] = time.time()
+        # Fuera de staging_in/staging_out nadie tiene el registro reclamado,
+        # salvo mientras la liberación del trabajo está pendiente: un lease
+        # vencido en ready/failed es una liberación que hay que repetir
+        keep_lease = record["state"] in (STAGING_IN, STAGING_OUT) or bool(record.get("release_pending"))
+        self._db().execute(
+            "UPDATE stagings SET state = ?, job_id = ?, updated = ?, data = ?, "
+            "lease_until = CASE WHEN ? THEN lease_until END WHERE id = ?",
+            (record["state"], record["job_id"], record["updated"], json.dumps(record),
+             keep_lease, record["id"]),
+        )
+
+    def _load(self, stage_id: str) -> Optional[Dict]:
+        row = self._db().execute("SELECT data FROM stagings WHERE id = ?", (stage_id,)).fetchone()
+        return json.loads(row["data"]) if row is not None else None
+
+    def _claim(self, stage_id: str, states: Tuple[str, ...], new_state: str) -> bool:
+        """
+        Toma un staging para este worker si está en `states` y nadie tiene
+        un lease vigente sobre él; solo un worker lo consigue
+        """
+        now = time.time()
+        placeholders = ",".join("?" * len(states))
+        cursor = self._db().execute(
+            f"UPDATE stagings SET state = ?, worker = ?, lease_until = ? WHERE id = ? "
+            f"AND state IN ({placeholders}) AND (lease_until IS NULL OR lease_until < ? OR worker = ?)",
+            (new_state, self.worker_id, now + self.lease_seconds, stage_id, *states, now, self.worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def _renew_leases(self) -> None:
+        self._db().execute(
+            "UPDATE stagings SET lease_until = ? WHERE worker = ? AND state IN (?, ?)",
+            (time.time() + self.lease_seconds, self.worker_id, STAGING_IN, STAGING_OUT),
+        )
+
+    def prepare(self, user_id: str, name: str, stage_out: Optional[str] = None) -> Dict:
+        """Crea el registro y los directorios del trabajo (antes del sbatch)"""
+        stage_id = uuid.uuid4().hex[:12]
+        job_dir = self.jobs_dir / stage_id
+        record = {
+            "id": stage_id,
+            "user_id": user_id,
+            "name": name,
+            "job_id": None,
+            "state": STAGING_IN,
+            "input_dir": str(job_dir / "input"),
+            "output_dir": str(job_dir / "output"),
+            "stage_out": str(Path(stage_out).resolve()) if stage_out else None,
+            "sources": [],
+            "inputs": [],
+            "bytes_total": 0,
+            "bytes_copied": 0,
+            "bytes_deduplicated": 0,
+            "error": None,
+            "created": time.time(),
+            "updated": time.time(),
+        }
+        Path(record["input_dir"]).mkdir(parents=True)
+        Path(record["output_dir"]).mkdir(parents=True)
+        self._db().execute(
+            "INSERT INTO stagings (id, user_id, state, job_id, worker, lease_until, updated, data) "
+            "VALUES (?, ?, ?, NULL, ?, ?, ?, ?)",
+            (stage_id, user_id, STAGING_IN, self.worker_id, time.time() + _PREPARE_TIMEOUT,
+             record["updated"], json.dumps(record)),
+        )
+        return record
+
+    def start_stage_in(self, stage_id: str, job_id: str, sources: List[str]) -> None:
+        """Lanza el stage-in en segundo plano; al terminar llama a on_stage_in(job_id, ok)"""
+        record = self._load(stage_id)
+        record["job_id"] = job_id
+        record["sources"] = list(sources)
+        self._save(record)
+        self._claim(stage_id, (STAGING_IN,), STAGING_IN)
+        threading.Thread(target=self._stage_in, args=(record,),
+                         name=f"atrox-stage-in-{stage_id}", daemon=True).start()
+
+    def discard(self, stage_id: str, reason: str) -> None:
+        """Abandona un staging preparado cuyo trabajo no llegó a enviarse"""
+        record = self._load(stage_id)
+        if record is None:
+            return
+        record["state"] = FAILED
+        record["error"] = reason
+        shutil.rmtree(Path(record["input_dir"]).parent, ignore_errors=True)
+        self._save(record)
+
+    def _stage_in(self, record: Dict) -> None:
+        try:
+            files = [item for source in record["sources"] for item in _iter_sources(Path(source))]
+            record["inputs"] = [{"path": str(rel), "size": os.path.getsize(path), "digest": None}
+                                for path, rel in files]
+            record["bytes_total"] = sum(item["size"] for item in record["inputs"])
+            record["bytes_copied"] = record["bytes_deduplicated"] = 0
+            self._save(record)
+
+            input_dir = Path(record["input_dir"])
+            futures = [self._pool.submit(self._stage_file, path, input_dir / rel) for path, rel in files]
+            for item, future in zip(record["inputs"], futures):
+                digest, size, deduplicated = future.result()
+                item["digest"] = digest
+                item["deduplicated"] = deduplicated
+                record["bytes_deduplicated" if deduplicated else "bytes_copied"] += size
+            record["state"] = READY
+            ok = True
+        except Exception as e:
+            record["state"] = FAILED
+            record["error"] = f"Error en stage-in: {str(e)}"
+            shutil.rmtree(Path(record["input_dir"]).parent, ignore_errors=True)
+            ok = False
+        record["release_pending"] = record["job_id"] is not None
+        self._save(record)
+        self._release_job(record, ok)
+
+    def _release_job(self, record: Dict, ok: bool) -> None:
+        """
+        Libera (o cancela) el trabajo retenido y lo anota en el registro. Si
+        el worker cae antes de anotarlo, recover() repite la liberación.
+        """
+        if not record.get("release_pending"):
+            return
+        if self.on_stage_in is not None:
+            try:
+                self.on_stage_in(record["job_id"], ok)
+            except Exception:
+                return  # Slurm no disponible: se reintenta al vencer el lease
+        record["release_pending"] = False
+        self._save(record)
+
+    def _stage_out(self, record: Dict, job_state: str) -> None:
+        record["state"] = STAGING_OUT
+        record["job_state"] = job_state
+        self._save(record)
+        try:
+            if record.get("stage_out"):
+                output_dir = Path(record["output_dir"])
+                destination = Path(record["stage_out"])
+                if destination.is_symlink():
+                    raise OSError("El destino del stage-out es un enlace simbólico")
+                copies = []
+                for path, rel in _iter_sources(output_dir):
+                    target = destination / rel.relative_to(output_dir.name)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    # Un directorio o archivo del destino cambiado por un
+                    # enlace no debe sacar la copia del destino
+                    if not _is_safe_path(destination, target.parent):
+                        raise OSError(f"Destino fuera del directorio de stage-out: {rel}")
+                    if target.is_symlink():
+                        target.unlink()
+                    copies.append(self._pool.submit(shutil.copyfile, path, target, follow_symlinks=False))
+                for future in copies:
+                    future.result()
+                record["files_staged_out"] = len(copies)
+            record["state"] = DONE
+        except Exception as e:
+            record["state"] = FAILED
+            record["error"] = f"Error en stage-out: {str(e)}"
+        # Los objetos quedan en el tier (caché LRU); el directorio del trabajo no
+        shutil.rmtree(Path(record["input_dir"]).parent, ignore_errors=True)
+        self._save(record)
+
+    def poll(self) -> int:
+        """Stage-out de los trabajos listos que ya terminaron; devuelve cuántos"""
+        rows = self._db().execute("SELECT id, job_id FROM stagings WHERE state = ? AND job_id IS NOT NULL",
+                                  (READY,)).fetchall()
+        if not rows or self.job_states is None:
+            return 0
+        states = self.job_states([row["job_id"] for row in rows])
+        staged = 0
+        for row in rows:
+            job_state = states.get(row["job_id"])
+            # Solo el worker que reclama el registro hace el stage-out
+            if job_state in ("completed", "failed") and self._claim(row["id"], (READY,), STAGING_OUT):
+                self._stage_out(self._load(row["id"]), job_state)
+                staged += 1
+        return staged
+
+    def recover(self) -> int:
+        """
+        Reanuda los stagings de workers caídos (lease vencido): el stage-in
+        se repite (los objetos ya copiados se deduplican), el stage-out se
+        vuelve a hacer y la liberación pendiente del trabajo se repite; un
+        staging preparado sin job id se abandona
+        """
+        rows = self._db().execute(
+            "SELECT id, state, job_id FROM stagings WHERE state IN (?, ?, ?, ?) AND lease_until < ?",
+            (STAGING_IN, STAGING_OUT, READY, FAILED, time.time()),
+        ).fetchall()
+        recovered = 0
+        for row in rows:
+            if not self._claim(row["id"], (row["state"],), row["state"]):
+                continue  # otro worker se adelantó
+            record = self._load(row["id"])
+            recovered += 1
+            if row["state"] in (READY, FAILED):
+                self._release_job(record, row["state"] == READY)
+            elif row["state"] == STAGING_OUT:
+                self._pool.submit(self._stage_out, record, record.get("job_state", "completed"))
+            elif row["job_id"] is None:
+                self.discard(row["id"], "El envío a Slurm no llegó a completarse")
+            else:
+                threading.Thread(target=self._stage_in, args=(record,),
+                                 name=f"atrox-stage-in-{row['id']}", daemon=True).start()
+        return recovered
+
+    # -- consulta ----------------------------------------------------------
+
+    def get(self, stage_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        record = self._load(stage_id)
+        if record is None or (user_id is not None and record["user_id"] != user_id):
+            return None
+        return self.public(record)
+
+    @staticmethod
+    def public(record: Dict) -> Dict:
+        """Registro sin rutas del tier"""
+        return {k: v for k, v in record.items() if k not in ("input_dir", "output_dir", "stage_out", "sources")}
+
+    def stats(self) -> Dict:
+        conn = self._db()
+        states = {row["state"]: row["n"]
+                  for row in conn.execute("SELECT state, COUNT(*) AS n FROM stagings GROUP BY state")}
+        counters = self._counters(conn)
+        return {
+            "root": str(self.root),
+            "capacity_bytes": self.capacity_bytes,
+            "stagings": states,
+            **counters,
+        }
+
+    # -- hilo de stage-out -------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="atrox-stage-out", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        # Al arrancar: stagings interrumpidos por un reinicio
+        wait = 0.0
+        while not self._stop.wait(wait):
+            wait = self.poll_interval
+            try:
+                self._renew_leases()
+                self.recover()
+                self.poll()
+            except Exception:
+                pass  # Slurm o la base de datos no disponibles: siguiente ciclo
+            self._expire()
+
+    def _expire(self):
+        """Olvida los registros terminados hace más de un día"""
+        try:
+            self._db().execute("DELETE FROM stagings WHERE state IN (?, ?) AND updated < ?",
+                               (DONE, FAILED, time.time() - 86400))
+        except sqlite3.Error:
+            pass
+
+
+if __name__ == "__main__":
+    # Comprobación con directorios locales como tiers
+    import tempfile
+
+    workdir = Path(tempfile.mkdtemp(prefix="atrox_staging_"))
+    home = workdir / "home"
+    (home / "dataset").mkdir(parents=True)
+    for i in range(20):
+        (home / "dataset" / f"part{i}.dat").write_bytes(os.urandom(256 * 1024))
+    (home / "copia.dat").write_bytes((home / "dataset" / "part0.dat").read_bytes())
+
+    released = {}
+    stager = DataStager(str(workdir / "tier"), capacity_bytes=8 * 1024 * 1024, workers=4)
+    stager.on_stage_in = lambda job_id, ok: released.__setitem__(job_id, ok)
+    states = {}
+    stager.job_states = lambda job_ids: {job_id: states.get(job_id, "running") for job_id in job_ids}
+
+    def run(job_id, sources, stage_out=None):
+        record = stager.prepare("atrox", "demo", stage_out)
+        stager.start_stage_in(record["id"], job_id, sources)
+        deadline = time.time() + 10
+        while job_id not in released and time.time() < deadline:
+            time.sleep(0.01)
+        return record
+
+    first = run("1", [str(home / "dataset"), str(home / "copia.dat")], str(home / "resultados"))
+    assert released["1"] and stager.get(first["id"])["state"] == READY, stager.get(first["id"])
+    assert stager.get(first["id"])["bytes_deduplicated"] == 256 * 1024  # copia.dat == part0.dat
+    assert (Path(first["input_dir"]) / "dataset" / "part3.dat").read_bytes() == \
+        (home / "dataset" / "part3.dat").read_bytes()
+
+    # Enlaces simbólicos: no se copian ni al tier ni de vuelta al destino
+    secret = workdir / "secreto.txt"
+    secret.write_text("ajeno")
+    (home / "dataset" / "enlace.txt").symlink_to(secret)
+    (Path(first["output_dir"]) / "enlace.txt").symlink_to(secret)
+
+    second = stager.get(run("2", [str(home / "dataset")])["id"])
+    assert not any(item["path"].endswith("enlace.txt") for item in second["inputs"])
+    assert second["bytes_copied"] == 0 and second["bytes_deduplicated"] == 20 * 256 * 1024
+
+    (Path(first["output_dir"]) / "sub").mkdir()
+    (Path(first["output_dir"]) / "sub" / "res.txt").write_text("ok")
+    states["1"] = "completed"
+    assert stager.poll() == 1 and (home / "resultados" / "sub" / "res.txt").read_text() == "ok"
+    assert not (home / "resultados" / "enlace.txt").exists()
+    assert stager.get(first["id"])["state"] == DONE and not Path(first["input_dir"]).exists()
+
+    # Otro worker sobre el mismo tier ve los registros y no repite el stage-out
+    other = DataStager(str(workdir / "tier"), capacity_bytes=8 * 1024 * 1024, workers=2)
+    other.job_states = stager.job_states
+    assert other.get(first["id"])["state"] == DONE and other.poll() == 0
+
+    # Capacidad: 8 MB; al terminar el trabajo 2 sus 5 MB dejan de estar
+    # anclados y los 5 MB nuevos expulsan los objetos menos usados
+    states["2"] = "completed"
+    assert stager.poll() == 1
+    (home / "grande").mkdir()
+    for i in range(20):
+        (home / "grande" / f"g{i}.dat").write_bytes(os.urandom(256 * 1024))
+    third = run("3", [str(home / "grande")])
+    assert released["3"], third
+    assert stager.stats()["evicted_objects"] > 0
+    assert stager.stats()["used_bytes"] <= stager.capacity_bytes
+
+    fourth = run("4", [str(home / "grande"), str(workdir / "no-existe")])
+    assert released["4"] is False and stager.get(fourth["id"])["state"] == FAILED
+
+    # Worker caído a mitad de stage-in: al vencer su lease otro lo reanuda
+    # y libera el trabajo
+    orphan = stager.prepare("atrox", "demo")
+    stager._db().execute("UPDATE stagings SET job_id = '5', lease_until = 0, data = json_set(data, '$.job_id', '5', "
+                         "'$.sources', json_array(?)) WHERE id = ?", (str(home / "dataset"), orphan["id"]))
+    other.on_stage_in = stager.on_stage_in
+    assert other.recover() == 1 and stager.recover() == 0
+    deadline = time.time() + 10
+    while "5" not in released and time.time() < deadline:
+        time.sleep(0.01)
+    assert released["5"] and stager.get(orphan["id"])["state"] == READY
+
+    # Worker caído entre el fin del stage-in y la liberación: el lease sigue
+    # puesto en 'ready' y, al vencer, otro worker libera el trabajo
+    pending = stager.prepare("atrox", "demo")
+    stager._db().execute("UPDATE stagings SET state = ?, job_id = '6', lease_until = 0, data = json_set(data, "
+                         "'$.state', ?, '$.job_id', '6', '$.release_pending', json('true')) WHERE id = ?",
+                         (READY, READY, pending["id"]))
+    assert other.recover() == 1 and released["6"] is True
+    assert stager._db().execute("SELECT lease_until FROM stagings WHERE id = ?",
+                                (pending["id"],)).fetchone()["lease_until"] is None
+    assert stager.recover() == 0
+
+    other.stop()
+
+    # Mismo contenido guardado a la vez por dos workers (tier nuevo): una
+    # sola copia y una sola reserva
+    first_worker = DataStager(str(workdir / "tier2"), capacity_bytes=8 * 1024 * 1024, workers=2)
+    second_worker = DataStager(str(workdir / "tier2"), capacity_bytes=8 * 1024 * 1024, workers=2)
+    payload = os.urandom(1024 * 1024)
+    twins = [home / "gemelo_a.dat", home / "gemelo_b.dat"]
+    for twin in twins:
+        twin.write_bytes(payload)
+    with ThreadPoolExecutor(max_workers=2) as race:
+        stored = list(race.map(lambda pair: pair[0].store(pair[1]),
+                               [(first_worker, twins[0]), (second_worker, twins[1])]))
+    assert stored[0][0] == stored[1][0] and sorted(item[2] for item in stored) == [False, True]
+    assert first_worker.stats()["used_bytes"] == len(payload)
+    first_worker.stop()
+    second_worker.stop()
+
+    stager.stop()
+    print("OK:", {k: v for k, v in stager.stats().items() if k != "root"})
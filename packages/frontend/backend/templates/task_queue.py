@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Cola de tareas en segundo plano
+==============================================
+
+Operaciones pesadas del gateway (hash de archivos, uso de disco,
+archivos comprimidos, vistas previas de archivos enormes, sincronización
+con Slurm) como tareas que se envían y se consultan en lugar de mantener
+la petición abierta:
+- Cola persistente en SQLite (WAL), compartida por los workers de
+  uvicorn/gunicorn de la máquina; sobrevive a reinicios
+- Prioridades y reparto justo: a igual prioridad se elige antes al
+  usuario con menos tareas en ejecución
+- Carril de hilos (E/S, llamadas a los managers) y carril de procesos
+  (CPU: hashing, compresión), cada uno con su número de workers
+- Reintentos con backoff exponencial; PermanentError no se reintenta
+- Deduplicación: enviar una tarea idéntica (nombre, argumentos, usuario)
+  a otra pendiente devuelve la existente
+- Las tareas reciben un callback de progreso; un lease renovado por el
+  proceso que las ejecuta permite recuperar las de un worker caído
+
+Comprobación local:
+
+    python task_queue.py
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Estados de una tarea
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+THREAD_LANE = "thread"
+PROCESS_LANE = "process"
+
+# Una tarea en ejecución cuyo lease vence sin renovar se vuelve a encolar
+LEASE_SECONDS = 60.0
+
+# Intervalo mínimo entre escrituras de progreso de una tarea
+PROGRESS_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    lane TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    args TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    progress REAL,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (lane, state, run_after);
+CREATE INDEX IF NOT EXISTS tasks_user ON tasks (user_id, state);
+CREATE UNIQUE INDEX IF NOT EXISTS tasks_pending_dedup ON tasks (dedup_key) WHERE state = 'pending';
+"""
+
+
+class PermanentError(Exception):
+    """Error de una tarea que no tiene sentido reintentar"""
+
+
+class TaskCancelled(Exception):
+    """La tarea se canceló mientras se ejecutaba (lo lanza el callback de progreso)"""
+
+
+class _Abandoned(Exception):
+    """El worker deja la tarea (parada u otro worker la reclamó); no se marca como terminada"""
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class TaskProgress:
+    """
+    Callback de progreso: progress(hecho, total=None, mensaje=None).
+    Escribe como mucho cada PROGRESS_INTERVAL y lanza TaskCancelled si se
+    pidió cancelar la tarea. Es serializable, así que sirve también en el
+    carril de procesos (abre su propia conexión).
+    """
+
+    def __init__(self, db_path: str, task_id: str):
+        self.db_path = db_path
+        self.task_id = task_id
+        self._last = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __getstate__(self):
+        return {"db_path": self.db_path, "task_id": self.task_id}
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"], state["task_id"])
+
+    def __call__(self, done: float, total: Optional[float] = None, message: Optional[str] = None) -> None:
+        now = time.monotonic()
+        if now - self._last < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last = now
+        fraction = min(1.0, done / total) if total else None
+        if self._conn is None:
+            self._conn = _connect(self.db_path)
+        row = self._conn.execute(
+            "UPDATE tasks SET progress = COALESCE(?, progress), message = COALESCE(?, message) "
+            "WHERE id = ? RETURNING cancel_requested",
+            (fraction, message, self.task_id),
+        ).fetchone()
+        if row is not None and row["cancel_requested"]:
+            raise TaskCancelled()
+
+
+def _process_main(conn, func: Callable, args: Dict, progress: TaskProgress) -> None:
+    """Proceso de una tarea del carril de procesos: envía (ok, resultado o excepción)"""
+    try:
+        outcome = (True, func(progress=progress, **args))
+    except BaseException as e:
+        outcome = (False, e)
+    try:
+        conn.send(outcome)
+    except Exception as e:  # resultado o excepción no serializables
+        conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+    finally:
+        conn.close()
+
+
+@dataclass
+class TaskSpec:
+    """Tipo de tarea registrado"""
+    name: str
+    func: Callable  # func(progress=..., **args) -> resultado serializable a JSON
+    lane: str = THREAD_LANE  # en PROCESS_LANE func debe ser una función de módulo
+    max_attempts: int = 3
+    backoff_seconds: float = 5.0
+    # prepare(user_id, args) -> args a guardar; ValueError si no son válidos.
+    # Solo las tareas con prepare se pueden enviar desde la API.
+    prepare: Optional[Callable[[str, Dict], Dict]] = None
+    admin_only: bool = False
+    timeout: float = 3600.0  # carril de procesos: se mata el proceso de la tarea
+
+
+class TaskQueue:
+    """Cola persistente de tareas con carriles de hilos y de procesos"""
+
+    def __init__(self, db_path: str, thread_workers: int = 4, process_workers: int = 2,
+                 poll_interval: float = 1.0, retention_seconds: float = 86400.0):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._specs: Dict[str, TaskSpec] = {}
+        self._local = threading.local()
+        self._wake = {THREAD_LANE: threading.Event(), PROCESS_LANE: threading.Event()}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # Un proceso propio por tarea del carril de procesos: se puede matar
+        # sin tocar a las demás
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._running: Dict[str, float] = {}  # tareas de este proceso -> inicio
+        self._running_lock = threading.Lock()
+
+        with _connect(self.db_path) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_path)
+        return conn
+
+    # -- registro y envío --------------------------------------------------
+
+    def register(self, spec: TaskSpec) -> None:
+        self._specs[spec.name] = spec
+
+    def spec(self, name: str) -> Optional[TaskSpec]:
+        return self._specs.get(name)
+
+    def specs(self) -> List[TaskSpec]:
+        return list(self._specs.values())
+
+    def submit(self, name: str, args: Dict, user_id: str, priority: int = 0) -> Dict:
+        """
+        Encola una tarea y devuelve su registro; si ya hay una idéntica
+        pendiente devuelve esa (deduplicated=True)
+        """
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ValueError(f"Tarea desconocida: {name}")
+        encoded = json.dumps(args, sort_keys=True, separators=(",", ":"))
+        dedup_key = hashlib.sha256(f"{name}\0{user_id}\0{encoded}".encode()).hexdigest()
+        now = time.time()
+        task_id = uuid.uuid4().hex
+
+        conn = self._db()
+        cursor = conn.execute(
+            "INSERT INTO tasks (id, name, user_id, lane, priority, args, dedup_key, state, "
+            "max_attempts, run_after, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (dedup_key) WHERE state = 'pending' DO NOTHING",
+            (task_id, name, user_id, spec.lane, priority, encoded, dedup_key, PENDING,
+             spec.max_attempts, now, now),
+        )
+        if cursor.rowcount == 0:
+            row = conn.execute("SELECT * FROM tasks WHERE dedup_key = ? AND state = 'pending'",
+                               (dedup_key,)).fetchone()
+            if row is not None:
+                # Una prioridad mayor en el duplicado sube la de la pendiente
+                if priority > row["priority"]:
+                    conn.execute("UPDATE tasks SET priority = ? WHERE id = ?", (priority, row["id"]))
+                task = self._public(row)
+                task["deduplicated"] = True
+                return task
+            return self.submit(name, args, user_id, priority)  # la pendiente arrancó justo ahora
+
+        self._wake[spec.lane].set()
+        task = self.get(task_id)
+        task["deduplicated"] = False
+        return task
+
+    # -- consulta ----------------------------------------------------------
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> Dict:
+        task = dict(row)
+        for key in ("args", "result"):
+            task[key] = json.loads(task[key]) if task[key] is not None else None
+        for key in ("dedup_key", "lease_until", "worker"):
+            task.pop(key, None)
+        task["cancel_requested"] = bool(task["cancel_requested"])
+        return task
+
+    def get(self, task_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        row = self._db().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None or (user_id is not None and row["user_id"] != user_id):
+            return None
+        return self._public(row)
+
+    def list(self, user_id: Optional[str] = None, state: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        query = "SELECT * FROM tasks WHERE 1 = 1"
+        params: list = []
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if state is not None:
+            query += " AND state = ?"
+            params.append(state)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        return [self._public(row) for row in self._db().execute(query, params)]
+
+    def cancel(self, task_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        """Cancela una pendiente; a una en ejecución se le pide cancelar (en su próximo progreso)"""
+        task = self.get(task_id, user_id)
+        if task is None:
+            return None
+        conn = self._db()
+        conn.execute("UPDATE tasks SET state = ?, finished = ? WHERE id = ? AND state = ?",
+                     (CANCELLED, time.time(), task_id, PENDING))
+        conn.execute("UPDATE tasks SET cancel_requested = 1 WHERE id = ? AND state = ?", (task_id, RUNNING))
+        return self.get(task_id)
+
+    def stats(self) -> Dict:
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in self._db().execute("SELECT lane, state, COUNT(*) AS n FROM tasks GROUP BY lane, state"):
+            counts.setdefault(row["lane"], {})[row["state"]] = row["n"]
+        with self._running_lock:
+            local = len(self._running)
+        return {
+            "lanes": counts,
+            "workers": {THREAD_LANE: self.thread_workers, PROCESS_LANE: self.process_workers},
+            "running_here": local,
+            "registered": sorted(self._specs),
+        }
+
+    # -- ejecución ---------------------------------------------------------
+
+    def _claim(self, lane: str) -> Optional[sqlite3.Row]:
+        """
+        Toma la siguiente tarea del carril: mayor prioridad, después el
+        usuario con menos tareas en ejecución y después la más antigua.
+        También recupera tareas en ejecución con el lease vencido.
+        """
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT t.id FROM tasks t WHERE t.lane = ? AND ("
+                "  (t.state = 'pending' AND t.run_after <= ?) OR (t.state = 'running' AND t.lease_until < ?)) "
+                "ORDER BY t.priority DESC, "
+                "  (SELECT COUNT(*) FROM tasks r WHERE r.user_id = t.user_id AND r.state = 'running') ASC, "
+                "  t.run_after ASC "
+                "LIMIT 1",
+                (lane, now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET state = 'running', attempts = attempts + 1, started = ?, "
+                "lease_until = ?, worker = ? WHERE id = ?",
+                (now, now + LEASE_SECONDS, self.worker_id, row["id"]),
+            )
+            claimed = conn.execute("SELECT * FROM tasks WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return claimed
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, task: sqlite3.Row, result=None, error: Optional[BaseException] = None) -> None:
+        """
+        Cierra esta ejecución de la tarea. Solo si sigue siendo nuestra: si
+        el lease venció y otro worker la reclamó (attempts avanzó), el
+        resultado de esta ejecución se descarta.
+        """
+        now = time.time()
+        conn = self._db()
+        owned = "WHERE id = ? AND state = 'running' AND worker = ? AND attempts = ?"
+        run = (task["id"], self.worker_id, task["attempts"])
+        if error is None:
+            conn.execute(
+                "UPDATE tasks SET state = ?, finished = ?, progress = 1.0, result = ?, error = NULL, "
+                "lease_until = NULL " + owned,
+                (SUCCEEDED, now, json.dumps(result, default=str), *run),
+            )
+            return
+
+        message = f"{type(error).__name__}: {error}"
+        if isinstance(error, TaskCancelled):
+            conn.execute("UPDATE tasks SET state = ?, finished = ?, error = NULL, lease_until = NULL " + owned,
+                         (CANCELLED, now, *run))
+        elif isinstance(error, (PermanentError, ValueError)) or task["attempts"] >= task["max_attempts"]:
+            # ValueError: argumentos no válidos, reintentar no cambia nada
+            conn.execute("UPDATE tasks SET state = ?, finished = ?, error = ?, lease_until = NULL " + owned,
+                         (FAILED, now, message, *run))
+        else:
+            spec = self._specs.get(task["name"])
+            backoff = (spec.backoff_seconds if spec else 5.0) * 2 ** (task["attempts"] - 1)
+            try:
+                conn.execute(
+                    "UPDATE tasks SET state = ?, run_after = ?, error = ?, lease_until = NULL " + owned,
+                    (PENDING, now + min(backoff, 3600.0), message, *run),
+                )
+            except sqlite3.IntegrityError:
+                # Mientras tanto se encoló una idéntica: esta se da por fallida
+                conn.execute("UPDATE tasks SET state = ?, finished = ?, error = ?, lease_until = NULL " + owned,
+                             (FAILED, now, message, *run))
+
+    def _execute(self, task: sqlite3.Row) -> None:
+        spec = self._specs.get(task["name"])
+        if spec is None:
+            self._finish(task, error=PermanentError(f"Tarea no registrada en este worker: {task['name']}"))
+            return
+
+        with self._running_lock:
+            self._running[task["id"]] = time.time()
+        try:
+            args = json.loads(task["args"])
+            progress = TaskProgress(self.db_path, task["id"])
+            if spec.lane == PROCESS_LANE:
+                result = self._run_process(spec, args, progress, task)
+            else:
+                result = spec.func(progress=progress, **args)
+            # Los managers devuelven {"status": "error"} en lugar de lanzar
+            if isinstance(result, dict) and result.get("status") == "error":
+                raise PermanentError(result.get("message", "Error"))
+        except _Abandoned:
+            # Reclamable enseguida por otro worker (o ya es de otro)
+            self._db().execute("UPDATE tasks SET lease_until = 0 WHERE id = ? AND state = 'running' "
+                               "AND worker = ? AND attempts = ?", (task["id"], self.worker_id, task["attempts"]))
+        except BaseException as e:
+            self._finish(task, error=e)
+        else:
+            self._finish(task, result=result)
+        finally:
+            with self._running_lock:
+                self._running.pop(task["id"], None)
+
+    def _run_process(self, spec: TaskSpec, args: Dict, progress: TaskProgress, task: sqlite3.Row):
+        """
+        Ejecuta la tarea en un proceso propio y espera su resultado sin
+        bloquear para siempre: límite de tiempo de la tarea, parada del
+        worker y lease perdido. Al salir el proceso siempre ha terminado.
+        """
+        # forkserver: hacer fork de un proceso con hilos (uvicorn, carriles,
+        # reaper...) puede heredar locks tomados y colgar al hijo
+        context = multiprocessing.get_context("forkserver")
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(target=_process_main, args=(writer, spec.func, args, progress),
+                                  name=f"atrox-task-{task['id']}", daemon=True)
+        process.start()
+        writer.close()
+        with self._running_lock:
+            self._processes[task["id"]] = process
+        try:
+            deadline = time.monotonic() + spec.timeout
+            while True:
+                if reader.poll(1.0):
+                    try:
+                        ok, value = reader.recv()
+                    except EOFError:
+                        process.join()
+                        raise RuntimeError(f"El proceso de la tarea terminó sin resultado "
+                                           f"(código {process.exitcode})")
+                    if not ok:
+                        raise value
+                    return value
+                if self._stop.is_set():
+                    raise _Abandoned()
+                row = self._db().execute("SELECT state, worker, attempts FROM tasks WHERE id = ?",
+                                         (task["id"],)).fetchone()
+                if (row is None or row["state"] != RUNNING or row["worker"] != self.worker_id
+                        or row["attempts"] != task["attempts"]):
+                    raise _Abandoned()
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"La tarea superó {spec.timeout:.0f}s")
+        finally:
+            # Una tarea colgada no se puede interrumpir: se mata solo su proceso
+            if process.is_alive():
+                process.kill()
+            process.join()
+            reader.close()
+            with self._running_lock:
+                self._processes.pop(task["id"], None)
+
+    def _worker(self, lane: str) -> None:
+        wake = self._wake[lane]
+        while not self._stop.is_set():
+            try:
+                task = self._claim(lane)
+            except sqlite3.OperationalError:
+                task = None  # base de datos ocupada: se reintenta
+            if task is None:
+                wake.wait(self.poll_interval)
+                wake.clear()
+                continue
+            self._execute(task)
+
+    def _housekeeping(self) -> None:
+        """Renueva los leases de las tareas de este proceso y purga las antiguas"""
+        last_purge = 0.0
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            conn = self._db()
+            with self._running_lock:
+                running = list(self._running)
+            try:
+                conn.executemany("UPDATE tasks SET lease_until = ? WHERE id = ? AND state = 'running' "
+                                 "AND worker = ?",
+                                 [(time.time() + LEASE_SECONDS, task_id, self.worker_id) for task_id in running])
+                if time.time() - last_purge > 3600:
+                    conn.execute("DELETE FROM tasks WHERE state IN (?, ?, ?) AND finished < ?",
+                                 (*FINISHED_STATES, time.time() - self.retention_seconds))
+                    last_purge = time.time()
+            except sqlite3.OperationalError:
+                continue
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        lanes = [(THREAD_LANE, self.thread_workers), (PROCESS_LANE, self.process_workers)]
+        for lane, count in lanes:
+            for i in range(count):
+                thread = threading.Thread(target=self._worker, args=(lane,), name=f"atrox-task-{lane}-{i}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        thread = threading.Thread(target=self._housekeeping, name="atrox-task-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for event in self._wake.values():
+            event.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        # Las tareas de procesos ya se devolvieron a la cola (_Abandoned); si
+        # algún hilo no llegó a salir, su proceso se mata aquí
+        with self._running_lock:
+            processes = list(self._processes.values())
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+
+
+def _demo_square(progress, n: int) -> int:
+    for i in range(n):
+        progress(i + 1, n)
+    return n * n
+
+
+def _demo_hang(progress, seconds: float) -> None:
+    time.sleep(seconds)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix="atrox_tasks_")
+    queue = TaskQueue(os.path.join(workdir, "tasks.db"), thread_workers=2, process_workers=2, poll_interval=0.05)
+
+    attempts = {"flaky": 0}
+
+    def flaky(progress, fail_times: int):
+        attempts["flaky"] += 1
+        if attempts["flaky"] <= fail_times:
+            raise OSError("fallo transitorio")
+        return attempts["flaky"]
+
+    def slow(progress, seconds: float):
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            progress(time.time() - deadline + seconds, seconds)
+            time.sleep(0.01)
+        return "ok"
+
+    def invalid(progress):
+        return {"status": "error", "message": "Archivo no encontrado"}
+
+    queue.register(TaskSpec("square", _demo_square, lane=PROCESS_LANE))
+    queue.register(TaskSpec("hang", _demo_hang, lane=PROCESS_LANE, timeout=1.0, max_attempts=1))
+    queue.register(TaskSpec("flaky", flaky, backoff_seconds=0.05))
+    queue.register(TaskSpec("slow", slow))
+    queue.register(TaskSpec("invalid", invalid))
+
+    # Deduplicación antes de arrancar los workers
+    first = queue.submit("square", {"n": 1000}, "ana")
+    again = queue.submit("square", {"n": 1000}, "ana", priority=5)
+    assert again["deduplicated"] and again["id"] == first["id"]
+    assert not queue.submit("square", {"n": 1000}, "luis")["deduplicated"]
+
+    # Reparto justo: "ana" envía 6 tareas antes que "luis"; con 2 hilos luis no espera a todas
+    ana = [queue.submit("slow", {"seconds": 0.2 + i / 1000}, "ana") for i in range(6)]
+    luis = queue.submit("slow", {"seconds": 0.2}, "luis")
+    flaky_task = queue.submit("flaky", {"fail_times": 2}, "ana", priority=10)
+    invalid_task = queue.submit("invalid", {}, "ana", priority=10)
+    hung = queue.submit("hang", {"seconds": 60}, "zoe")
+    cancelled = queue.submit("slow", {"seconds": 5.0}, "zoe", priority=-1)
+    queue.cancel(cancelled["id"])
+
+    queue.start()
+    deadline = time.time() + 30
+    while time.time() < deadline and queue.list(state=PENDING) + queue.list(state=RUNNING):
+        time.sleep(0.05)
+    queue.stop()
+
+    done = {task["id"]: task for task in queue.list(limit=1000)}
+    assert done[first["id"]]["state"] == SUCCEEDED and done[first["id"]]["result"] == 1000000
+    assert done[flaky_task["id"]]["state"] == SUCCEEDED and done[flaky_task["id"]]["attempts"] == 3
+    assert done[invalid_task["id"]]["state"] == FAILED and done[invalid_task["id"]]["attempts"] == 1
+    assert done[cancelled["id"]]["state"] == CANCELLED
+    assert done[hung["id"]]["state"] == FAILED and "TimeoutError" in done[hung["id"]]["error"]
+    assert done[luis["id"]]["started"] < max(done[t["id"]]["started"] for t in ana)
+    print("OK:", queue.stats()["lanes"])
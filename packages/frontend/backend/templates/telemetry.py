@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Telemetría por nodo
+==================================
+
+Series temporales por nodo para la vista de monitorización:
+- Buffers circulares de tamaño fijo sobre arrays NumPy (una fila por
+  muestra, una columna por métrica)
+- Resolución múltiple con reducción automática: raw -> 1m -> 10m
+  (cada nivel promedia los cubos cerrados del anterior)
+- Consultas por rango que eligen el nivel más fino que cubre el rango
+
+La memoria es fija y conocida de antemano: se reserva completa al ver un
+nodo por primera vez y el número de nodos está acotado (max_nodes).
+"""
+
+import math
+import threading
+import time
+import warnings
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Métricas por nodo (porcentajes 0-100; NaN si no aplica, p. ej. GPU sin GPUs)
+METRICS = ("cpu_load", "cpu_alloc", "memory_alloc", "gpu_alloc")
+
+
+def node_metrics(node) -> Tuple[float, ...]:
+    """Fila de métricas de un NodeStatus"""
+    def pct(used, total):
+        return used * 100.0 / total if total else math.nan
+
+    return (
+        pct(node.cpu_load, node.cpus_total),
+        pct(node.cpus_alloc, node.cpus_total),
+        pct(node.memory_alloc_mb, node.memory_total_mb),
+        pct(node.gpus_alloc, node.gpus_total),
+    )
+
+
+class RingBuffer:
+    """Buffer circular de (timestamp, fila de métricas) con capacidad fija"""
+
+    __slots__ = ("capacity", "times", "values", "head", "size")
+
+    def __init__(self, capacity: int, width: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, width), np.nan, dtype=np.float32)
+        self.head = 0
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+
+    @property
+    def last_time(self) -> float:
+        return self.times[self.head - 1] if self.size else -math.inf
+
+    def append(self, timestamp: float, row) -> None:
+        self.times[self.head] = timestamp
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Contenido en orden cronológico (vistas si no ha dado la vuelta)"""
+        if self.size < self.capacity:
+            return self.times[:self.size], self.values[:self.size]
+        order = np.r_[self.head:self.capacity, 0:self.head]
+        return self.times[order], self.values[order]
+
+    def range(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        times, values = self.ordered()
+        lo = np.searchsorted(times, start, side="left")
+        hi = np.searchsorted(times, end, side="right")
+        return times[lo:hi].copy(), values[lo:hi].copy()
+
+
+class Tier:
+    """Un nivel de resolución: acumula el cubo en curso y lo vuelca al cerrarse"""
+
+    __slots__ = ("name", "step", "buffer", "_bucket", "_sum", "_count")
+
+    def __init__(self, name: str, step: float, retention: float, width: int):
+        self.name = name
+        self.step = step
+        self.buffer = RingBuffer(max(1, int(math.ceil(retention / step))), width)
+        self._bucket: Optional[float] = None
+        self._sum = np.zeros(width, dtype=np.float64)
+        self._count = np.zeros(width, dtype=np.int64)
+
+    @property
+    def retention(self) -> float:
+        return self.buffer.capacity * self.step
+
+    def add(self, timestamp: float, row: np.ndarray) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        Añade una muestra; devuelve (inicio, media) del cubo que se cierra,
+        si alguno se cierra, para alimentar el nivel siguiente.
+        """
+        bucket = timestamp - (timestamp % self.step)
+        closed = None
+        if self._bucket is not None and bucket != self._bucket:
+            closed = self.flush()
+        self._bucket = bucket
+        valid = ~np.isnan(row)
+        self._sum[valid] += row[valid]
+        self._count[valid] += 1
+        return closed
+
+    def flush(self) -> Optional[Tuple[float, np.ndarray]]:
+        if self._bucket is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self._count > 0, self._sum / np.maximum(self._count, 1), np.nan)
+        closed = (self._bucket, mean)
+        self.buffer.append(*closed)
+        self._bucket = None
+        self._sum[:] = 0
+        self._count[:] = 0
+        return closed
+
+
+# (nombre, paso en segundos, retención en segundos) de los niveles reducidos
+DEFAULT_TIERS = (("1m", 60, 24 * 3600), ("10m", 600, 7 * 24 * 3600))
+
+
+class NodeSeries:
+    """Serie de un nodo: muestras sin reducir y niveles 1m/10m en cascada"""
+
+    def __init__(self, raw_step: float, raw_retention: float, tiers=DEFAULT_TIERS, width: int = len(METRICS)):
+        self.raw = RingBuffer(max(1, int(math.ceil(raw_retention / raw_step))), width)
+        self.raw_step = raw_step
+        self.tiers = [Tier(name, step, retention, width) for name, step, retention in tiers]
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + sum(tier.buffer.nbytes for tier in self.tiers)
+
+    def add(self, timestamp: float, row: np.ndarray) -> None:
+        if timestamp <= self.raw.last_time:  # descartar muestras fuera de orden
+            return
+        self.raw.append(timestamp, row)
+        sample: Optional[Tuple[float, np.ndarray]] = (timestamp, row)
+        for tier in self.tiers:
+            sample = tier.add(*sample)
+            if sample is None:
+                break
+
+    def resolutions(self) -> List[Tuple[str, float, RingBuffer]]:
+        levels = [("raw", self.raw_step, self.raw)]
+        levels += [(tier.name, tier.step, tier.buffer) for tier in self.tiers]
+        return levels
+
+
+class TelemetryStore:
+    """Series por nodo con memoria acotada y consultas por rango"""
+
+    def __init__(self, raw_step: float = 15, raw_retention: float = 3600,
+                 tiers=DEFAULT_TIERS, max_nodes: int = 1024):
+        self.raw_step = raw_step
+        self.raw_retention = raw_retention
+        self.tiers = tiers
+        self.max_nodes = max_nodes
+        self._series: Dict[str, NodeSeries] = {}
+        self._lock = threading.Lock()
+        self._metric_index = {name: i for i, name in enumerate(METRICS)}
+
+    def record(self, nodes: Iterable, timestamp: Optional[float] = None) -> int:
+        """Registra una muestra de cada nodo (NodeStatus); devuelve cuántas se guardaron"""
+        timestamp = time.time() if timestamp is None else timestamp
+        recorded = 0
+        with self._lock:
+            for node in nodes:
+                series = self._series.get(node.name)
+                if series is None:
+                    if len(self._series) >= self.max_nodes:
+                        continue
+                    series = self._series[node.name] = NodeSeries(self.raw_step, self.raw_retention, self.tiers)
+                series.add(timestamp, np.asarray(node_metrics(node), dtype=np.float64))
+                recorded += 1
+        return recorded
+
+    def nodes(self) -> List[str]:
+        with self._lock:
+            return sorted(self._series)
+
+    def memory_bytes(self) -> int:
+        """Memoria reservada actualmente por los buffers"""
+        with self._lock:
+            return sum(series.nbytes for series in self._series.values())
+
+    def memory_limit_bytes(self) -> int:
+        """Memoria máxima posible (todos los nodos permitidos)"""
+        probe = NodeSeries(self.raw_step, self.raw_retention, self.tiers)
+        return probe.nbytes * self.max_nodes
+
+    def query(self, node: str, start: float, end: float, metrics: Optional[Sequence[str]] = None,
+              resolution: str = "auto", max_points: Optional[int] = None) -> Optional[Dict]:
+        """
+        Serie de un nodo entre start y end (epoch). Con resolution="auto"
+        usa el nivel más fino cuya retención cubre el inicio del rango.
+        Devuelve None si el nodo no tiene telemetría.
+        """
+        metrics = list(metrics or METRICS)
+        unknown = [name for name in metrics if name not in self._metric_index]
+        if unknown:
+            raise ValueError(f"Métricas desconocidas: {', '.join(unknown)}")
+        columns = [self._metric_index[name] for name in metrics]
+
+        with self._lock:
+            series = self._series.get(node)
+            if series is None:
+                return None
+            levels = series.resolutions()
+            if resolution == "auto":
+                # Tolerancia de un paso: "últimas 24h" sigue usando el nivel de 24h
+                now = time.time()
+                level = next(
+                    (lvl for lvl in levels if now - lvl[1] * lvl[2].capacity <= start + lvl[1]),
+                    levels[-1],
+                )
+            else:
+                level = next((lvl for lvl in levels if lvl[0] == resolution), None)
+                if level is None:
+                    raise ValueError(f"Resolución desconocida: {resolution}")
+            name, step, buffer = level
+            times, values = buffer.range(start, end)
+
+        values = values[:, columns]
+        if max_points and len(times) > max_points:
+            times, values, step = _downsample(times, values, step, max_points)
+
+        return {
+            "node": node,
+            "resolution": name,
+            "step": step,
+            "timestamps": times.tolist(),
+            "series": {metric: _to_json_list(values[:, i]) for i, metric in enumerate(metrics)},
+        }
+
+    def start_collector(self, source: Callable[[], Iterable], interval: Optional[float] = None) -> "TelemetryCollector":
+        collector = TelemetryCollector(self, source, interval or self.raw_step)
+        collector.start()
+        return collector
+
+
+def _downsample(times: np.ndarray, values: np.ndarray, step: float, max_points: int):
+    """
+    Agrupa puntos consecutivos para no superar max_points (media por grupo).
+    Los grupos se alinean al final: el resto que no completa un grupo se
+    descarta de los puntos más antiguos, nunca de los más recientes.
+    """
+    factor = int(math.ceil(len(times) / max_points))
+    skip = len(times) % factor
+    times = times[skip:].reshape(-1, factor)[:, 0]
+    grouped = values[skip:].reshape(-1, factor, values.shape[1])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # grupos todo NaN
+        values = np.nanmean(grouped, axis=1)
+    return times, values, step * factor
+
+
+def _to_json_list(column: np.ndarray) -> list:
+    """Lista JSON con NaN como null y dos decimales"""
+    return [None if value != value else round(value, 2) for value in column.tolist()]
+
+
+class TelemetryCollector:
+    """Hilo que muestrea periódicamente el estado de los nodos"""
+
+    def __init__(self, store: TelemetryStore, source: Callable[[], Iterable], interval: float):
+        self.store = store
+        self.source = source
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="atrox-telemetry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.store.record(self.source())
+            except Exception:
+                pass  # el siguiente ciclo vuelve a intentarlo
+            if self._stop.wait(self.interval):
+                break
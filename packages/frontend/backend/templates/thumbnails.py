@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Miniaturas de resultados
+=======================================
+
+Miniaturas de imágenes (PNG/JPEG) y primera página de PDFs para el
+explorador de archivos:
+- Render en un pool de procesos (no bloquea el event loop ni compite
+  con el GIL de los workers)
+- Caché en disco por contenido: clave = (path, tamaño, mtime, lado)
+- Perezoso: la primera petición encola el render y responde "pending";
+  las siguientes sirven el PNG cacheado
+- Anticipado: los archivos nuevos en directorios vigilados (file_watcher)
+  se renderizan en cuanto aparecen
+
+Renderizadores opcionales:
+- Imágenes: Pillow
+- PDF: PyMuPDF (fitz) o, en su defecto, pdftoppm (poppler-utils)
+"""
+
+import hashlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from metrics import cache_counters
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depende del entorno
+    Image = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - depende del entorno
+    fitz = None
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+PDF_EXTENSIONS = {'.pdf'}
+THUMBNAIL_EXTENSIONS = IMAGE_EXTENSIONS | PDF_EXTENSIONS
+
+# Lados permitidos (px): se redondea al inmediato superior
+THUMBNAIL_SIZES = (128, 256, 512)
+DEFAULT_THUMBNAIL_SIZE = 256
+
+# Imágenes más grandes que esto no se abren (protección frente a bombas de descompresión)
+MAX_IMAGE_PIXELS = 200_000_000
+
+
+def normalize_size(size: int) -> int:
+    for allowed in THUMBNAIL_SIZES:
+        if size <= allowed:
+            return allowed
+    return THUMBNAIL_SIZES[-1]
+
+
+def renderer_for(path: Path) -> Optional[str]:
+    """'image', 'pdf' o None si no hay cómo renderizar ese archivo aquí"""
+    suffix = path.suffix.lower()
+    if suffix in IMAGE_EXTENSIONS and Image is not None:
+        return "image"
+    if suffix in PDF_EXTENSIONS and (fitz is not None or shutil.which("pdftoppm")):
+        return "pdf"
+    return None
+
+
+def render_thumbnail(source: str, destination: str, size: int) -> int:
+    """
+    Renderiza la miniatura PNG de source en destination (se ejecuta en el
+    pool de procesos). Escribe en un temporal y lo renombra: un lector
+    nunca ve un PNG a medias. Devuelve el tamaño del PNG.
+    """
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".png", dir=directory)
+    os.close(fd)
+    try:
+        if source.lower().endswith(".pdf"):
+            _render_pdf(source, tmp_path, size)
+        else:
+            _render_image(source, tmp_path, size)
+        os.replace(tmp_path, destination)
+        return os.path.getsize(destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _render_image(source: str, destination: str, size: int) -> None:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source) as image:
+        # JPEG: decodifica directamente a una escala reducida
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        image.save(destination, "PNG", optimize=True)
+
+
+def _render_pdf(source: str, destination: str, size: int) -> None:
+    if fitz is not None:
+        with fitz.open(source) as document:
+            page = document.load_page(0)
+            zoom = size / max(page.rect.width, page.rect.height)
+            page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).save(destination)
+        return
+
+    prefix = destination[:-len(".png")]
+    subprocess.run(
+        ["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(size), source, prefix],
+        check=True, capture_output=True, timeout=60,
+    )
+
+
+class ThumbnailService:
+    """Cola de renders en procesos con caché en disco"""
+
+    def __init__(self, cache_dir: str, max_workers: int = 2, max_cache_bytes: int = 1024 ** 3,
+                 error_ttl: float = 300.0):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self.max_cache_bytes = max_cache_bytes
+        self.error_ttl = error_ttl
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._errors: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._renders_since_prune = 0
+        self._hits, self._misses = cache_counters("thumbnails")
+
+    def cache_key(self, path: Path, stat: os.stat_result, size: int) -> str:
+        raw = f"{path}\x1f{stat.st_size}\x1f{stat.st_mtime_ns}\x1f{size}"
+        return hashlib.blake2b(raw.encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+
+    def cache_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.png"
+
+    def request(self, path: Path, size: int = DEFAULT_THUMBNAIL_SIZE,
+                stat: Optional[os.stat_result] = None) -> Dict:
+        """
+        Estado de la miniatura de path; encola el render si no existe.
+        status: ready (con "file"), pending, unsupported o error.
+        """
+        size = normalize_size(size)
+        if renderer_for(path) is None:
+            return {"status": "unsupported", "message": "No hay renderizador disponible para este tipo de archivo"}
+
+        stat = stat or path.stat()
+        key = self.cache_key(path, stat, size)
+        cached = self.cache_path(key)
+        if cached.exists():
+            self._hits.inc()
+            return {"status": "ready", "file": cached, "key": key}
+        self._misses.inc()
+
+        with self._lock:
+            failure = self._errors.get(key)
+            if failure is not None:
+                if time.monotonic() - failure[0] < self.error_ttl:
+                    return {"status": "error", "message": failure[1]}
+                del self._errors[key]
+
+            if key not in self._pending:
+                if self._executor is None:
+                    # forkserver: no hacer fork del proceso del servidor, que tiene muchos hilos
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         mp_context=multiprocessing.get_context("forkserver"))
+                future = self._executor.submit(render_thumbnail, str(path), str(cached), size)
+                self._pending[key] = future
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+
+        return {"status": "pending", "key": key}
+
+    def prefetch(self, paths: List[Path], size: int = DEFAULT_THUMBNAIL_SIZE) -> int:
+        """Encola los renders de varios archivos (generación anticipada)"""
+        queued = 0
+        for path in paths:
+            try:
+                if self.request(path, size)["status"] == "pending":
+                    queued += 1
+            except OSError:
+                continue
+        return queued
+
+    def on_workspace_events(self, directory: Path, events: List[Dict]) -> None:
+        """Listener de WorkspaceWatcher: renderiza los resultados nuevos o modificados"""
+        paths = [
+            directory / event["name"]
+            for event in events
+            if event["type"] in ("created", "modified") and not event.get("is_directory")
+            and os.path.splitext(event["name"])[1].lower() in THUMBNAIL_EXTENSIONS
+        ]
+        if paths:
+            self.prefetch(paths)
+
+    def _finished(self, key: str, future: Future) -> None:
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled():
+                return
+            if error is not None:
+                if len(self._errors) >= 1000:
+                    self._errors.clear()
+                self._errors[key] = (time.monotonic(), f"Error generando miniatura ({type(error).__name__})")
+                return
+            self._renders_since_prune += 1
+            prune = self._renders_since_prune >= 100
+            if prune:
+                self._renders_since_prune = 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Elimina las miniaturas menos usadas (atime) por encima de max_cache_bytes"""
+        entries = []
+        total = 0
+        for png in self.cache_dir.glob("*/*.png"):
+            try:
+                stat = png.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, png))
+            total += stat.st_size
+
+        removed = 0
+        for _atime, size, png in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                png.unlink()
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "recent_errors": len(self._errors),
+                "image_renderer": Image is not None,
+                "pdf_renderer": "pymupdf" if fitz is not None else ("pdftoppm" if shutil.which("pdftoppm") else None),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
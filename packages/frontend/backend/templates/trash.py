@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+AtrozGetaway - Papelera y borrado en segundo plano
+==================================================
+
+Borrado instantáneo de archivos y árboles de directorios:
+- delete = rename atómico a la papelera del usuario (mismo sistema de
+  archivos); la petición responde en milisegundos aunque el árbol tenga
+  millones de archivos
+- Un hilo "reaper" hace los unlink reales con límite de velocidad
+  (no satura el servidor de metadatos del sistema de archivos compartido)
+  y publica el progreso
+- Ventana de deshacer opcional: durante undo_seconds la entrada se puede
+  restaurar a su ruta original
+- Al terminar, los bytes liberados se suman a la contabilidad del usuario
+
+Estado en disco (sobrevive a reinicios): <trash>/<usuario>/<id>.item
+(el archivo o directorio movido) y <id>.json (metadatos y progreso).
+"""
+
+import errno
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Prefijo de las entradas movidas junto al original cuando la papelera está
+# en otro sistema de archivos (rename no puede cruzar dispositivos)
+SIBLING_PREFIX = ".atrox-trash-"
+
+# Tiempo que se conservan los metadatos de una entrada ya reclamada
+DONE_RETENTION_SECONDS = 3600
+
+# Unlinks entre actualizaciones del progreso en disco
+PROGRESS_BATCH = 1000
+
+
+def _write_json(path: Path, data: Dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class TrashManager:
+    """Papelera por usuario con reclamación en segundo plano"""
+
+    def __init__(self, trash_dir: Path, undo_seconds: float = 0.0, unlink_rate: float = 5000.0):
+        self.trash_dir = Path(trash_dir)
+        self.undo_seconds = undo_seconds
+        self.unlink_rate = unlink_rate
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _user_trash(self, user_id: str) -> Path:
+        path = self.trash_dir / user_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @contextmanager
+    def _state_lock(self, user_id: str):
+        """
+        Exclusión de las transiciones de estado (pending -> counting /
+        restored) entre hilos y entre workers: flock sobre un archivo de
+        bloqueo de la papelera del usuario (los .json se reemplazan al
+        guardar, así que no sirven para flock)
+        """
+        with self._lock, open(self._user_trash(user_id) / ".state.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _meta_path(self, user_id: str, entry_id: str) -> Path:
+        return self.trash_dir / user_id / f"{entry_id}.json"
+
+    def _load(self, user_id: str, entry_id: str) -> Optional[Dict]:
+        if not entry_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(user_id, entry_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, entry: Dict) -> None:
+        _write_json(self._meta_path(entry["user_id"], entry["id"]), entry)
+
+    # -- API ---------------------------------------------------------------
+
+    def move_to_trash(self, user_id: str, target: Path, relative_path: str) -> Dict:
+        """Mueve target a la papelera con un rename atómico y encola su reclamación"""
+        entry_id = uuid.uuid4().hex
+        user_trash = self._user_trash(user_id)
+        is_dir = target.is_dir() and not target.is_symlink()
+
+        item = user_trash / f"{entry_id}.item"
+        try:
+            os.rename(target, item)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Otro sistema de archivos: renombrar junto al original (mismo dispositivo)
+            item = target.parent / f"{SIBLING_PREFIX}{entry_id}"
+            os.rename(target, item)
+
+        now = time.time()
+        entry = {
+            "id": entry_id,
+            "user_id": user_id,
+            "original_path": relative_path,
+            "original_abs": str(target),
+            "item": str(item),
+            "is_dir": is_dir,
+            "deleted_at": now,
+            "purge_after": now + self.undo_seconds,
+            "state": "pending",
+            "total_files": None,
+            "total_bytes": None,
+            "removed_files": 0,
+            "freed_bytes": 0,
+        }
+        self._save(entry)
+        if self.undo_seconds <= 0:
+            self._wake.set()
+        return entry
+
+    def restore(self, user_id: str, entry_id: str) -> Dict:
+        """Devuelve una entrada pendiente a su ruta original"""
+        if not entry_id.isalnum():
+            return {"status": "error", "message": "Entrada de papelera no encontrada"}
+        with self._state_lock(user_id):
+            entry = self._load(user_id, entry_id)
+            if entry is None:
+                return {"status": "error", "message": "Entrada de papelera no encontrada"}
+            if entry["state"] != "pending":
+                return {"status": "error", "message": "La entrada ya se está eliminando o fue eliminada"}
+
+            original = Path(entry["original_abs"])
+            if os.path.lexists(original):
+                return {"status": "error", "message": "Ya existe un archivo en la ruta original"}
+            original.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(entry["item"], original)
+            entry["state"] = "restored"
+            self._save(entry)
+
+        return {"status": "success", "message": "Restaurado exitosamente", "path": entry["original_path"]}
+
+    def get_entry(self, user_id: str, entry_id: str) -> Optional[Dict]:
+        return self._load(user_id, entry_id)
+
+    def list_entries(self, user_id: str) -> List[Dict]:
+        entries = []
+        user_trash = self.trash_dir / user_id
+        if user_trash.is_dir():
+            for meta in user_trash.glob("*.json"):
+                entry = self._load(user_id, meta.stem)
+                if entry is not None and entry["state"] != "restored":
+                    entries.append(entry)
+        return sorted(entries, key=lambda e: e["deleted_at"], reverse=True)
+
+    def usage(self, user_id: str) -> Dict:
+        """Contabilidad de la papelera: pendiente de reclamar y ya reclamado"""
+        entries = self.list_entries(user_id)
+        ledger = self._load_ledger(user_id)
+        return {
+            "pending_entries": sum(1 for e in entries if e["state"] != "done"),
+            "pending_bytes": sum((e["total_bytes"] or 0) - e["freed_bytes"]
+                                 for e in entries if e["state"] != "done"),
+            "reclaimed_bytes": ledger["reclaimed_bytes"],
+            "reclaimed_files": ledger["reclaimed_files"],
+        }
+
+    def _load_ledger(self, user_id: str) -> Dict:
+        try:
+            with open(self.trash_dir / user_id / "usage.ledger") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"reclaimed_bytes": 0, "reclaimed_files": 0}
+
+    def _account(self, user_id: str, freed_bytes: int, removed_files: int) -> None:
+        with self._lock:
+            ledger = self._load_ledger(user_id)
+            ledger["reclaimed_bytes"] += freed_bytes
+            ledger["reclaimed_files"] += removed_files
+            _write_json(self.trash_dir / user_id / "usage.ledger", ledger)
+
+    # -- reaper ------------------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="atrox-trash-reaper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            due, next_due = self._due_entries()
+            if due:
+                self._reap_all(due)
+            timeout = 60.0 if next_due is None else max(0.1, min(60.0, next_due - time.time()))
+            self._wake.wait(timeout)
+
+    def _reap_all(self, due: List[Dict]) -> None:
+        # Con varios workers solo uno reclama a la vez (flock sobre la papelera)
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.trash_dir / ".reaper.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            for entry in due:
+                if self._stop.is_set():
+                    return
+                self._reap(entry)
+
+    @staticmethod
+    def public(entry: Dict) -> Dict:
+        """Entrada sin rutas absolutas del servidor"""
+        return {k: v for k, v in entry.items() if k not in ("original_abs", "item")}
+
+    def _due_entries(self) -> Tuple[List[Dict], Optional[float]]:
+        """Entradas cuya ventana de deshacer expiró (y limpieza de las terminadas)"""
+        due = []
+        next_due = None
+        now = time.time()
+        if not self.trash_dir.is_dir():
+            return due, next_due
+        for meta in self.trash_dir.glob("*/*.json"):
+            entry = self._load(meta.parent.name, meta.stem)
+            if entry is None:
+                continue
+            if entry["state"] in ("done", "restored"):
+                if now - entry.get("finished_at", entry["deleted_at"]) > DONE_RETENTION_SECONDS:
+                    meta.unlink(missing_ok=True)
+                continue
+            if entry["purge_after"] <= now:
+                due.append(entry)
+            else:
+                next_due = entry["purge_after"] if next_due is None else min(next_due, entry["purge_after"])
+        due.sort(key=lambda e: e["purge_after"])
+        return due, next_due
+
+    def _claim(self, entry: Dict) -> bool:
+        """
+        Pasa la entrada a 'counting' si sigue pendiente; la restauración
+        compite desde cualquier worker y el estado se vuelve a leer dentro
+        del bloqueo
+        """
+        with self._state_lock(entry["user_id"]):
+            current = self._load(entry["user_id"], entry["id"])
+            if current is None or current["state"] not in ("pending", "counting", "reaping"):
+                return False
+            entry.update(current)
+            if entry["state"] == "pending":
+                entry["state"] = "counting"
+                self._save(entry)
+            return True
+
+    def _reap(self, entry: Dict) -> None:
+        if not self._claim(entry):
+            return
+        item = entry["item"]
+
+        # Primera pasada: totales para el progreso (scandir, sin leer datos)
+        if entry["total_files"] is None:
+            files, size = 0, 0
+            for path, is_dir in self._walk(item):
+                if not is_dir:
+                    files += 1
+                    try:
+                        size += os.lstat(path).st_size
+                    except OSError:
+                        pass
+            entry.update({"total_files": files, "total_bytes": size, "state": "reaping"})
+            self._save(entry)
+
+        # Segunda pasada: unlink de abajo arriba con límite de velocidad
+        interval = 1.0 / self.unlink_rate if self.unlink_rate > 0 else 0.0
+        started = time.monotonic()
+        done = 0
+        freed, removed = 0, 0
+        try:
+            for path, is_dir in self._walk(item):
+                if self._stop.is_set():
+                    break
+                try:
+                    if is_dir:
+                        os.rmdir(path)
+                    else:
+                        size = os.lstat(path).st_size
+                        os.unlink(path)
+                        freed += size
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+                done += 1
+                if done % PROGRESS_BATCH == 0:
+                    entry["removed_files"] += removed
+                    entry["freed_bytes"] += freed
+                    self._account(entry["user_id"], freed, removed)
+                    freed, removed = 0, 0
+                    self._save(entry)
+                if interval:
+                    ahead = started + done * interval - time.monotonic()
+                    if ahead > 0:
+                        self._stop.wait(ahead)
+        except OSError as e:
+            entry["state"] = "failed"
+            entry["error"] = str(e)
+
+        entry["removed_files"] += removed
+        entry["freed_bytes"] += freed
+        self._account(entry["user_id"], freed, removed)
+        if entry["state"] != "failed" and not os.path.lexists(item):
+            entry["state"] = "done"
+            entry["finished_at"] = time.time()
+        self._save(entry)
+
+    def _walk(self, root: str):
+        """(ruta, es_directorio) en post-orden: el contenido antes que su directorio"""
+        if not os.path.lexists(root):
+            return
+        if not os.path.isdir(root) or os.path.islink(root):
+            yield root, False
+            return
+        stack = [(root, None)]
+        while stack:
+            path, iterator = stack[-1]
+            if iterator is None:
+                try:
+                    iterator = os.scandir(path)
+                except OSError:
+                    iterator = iter(())
+                stack[-1] = (path, iterator)
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, None))
+                    break
+                yield entry.path, False
+            else:
+                stack.pop()
+                yield path, True